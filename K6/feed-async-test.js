@@ -0,0 +1,63 @@
+import http from 'k6/http';
+import { check, group } from 'k6';
+
+// Sync vs async feed under high concurrency. Run the server with the ASGI profile from RUNNING.md
+// (gunicorn -k uvicorn.workers.UvicornWorker core.asgi:application, DB_CONN_MAX_AGE=0), with the same worker count
+// as the sync profile. Both scenarios run at the same time with the same number of VUs; the async routes keep
+// serving other requests while one waits on Redis or Postgres, so their p95 should stay well below the sync one's.
+const VUS = Number(__ENV.VUS || 200);
+
+export const options = {
+  scenarios: {
+    sync: {
+      executor: 'constant-vus', vus: VUS, duration: '30s', exec: 'syncFeed',
+    },
+    async: {
+      executor: 'constant-vus', vus: VUS, duration: '30s', exec: 'asyncFeed',
+    },
+  },
+  thresholds: {
+    'http_req_duration{scenario:sync}': ['p(95)<2000'],
+    'http_req_duration{scenario:async}': ['p(95)<500'],
+    'http_req_failed': ['rate<0.01'],
+  },
+};
+
+const API_BASE_URL = 'http://localhost:8000/posts';
+const LOGIN_URL = `${API_BASE_URL}/users/login/`;
+const TEST_USERNAME = 'user18';
+const TEST_PASSWORD = 'passworD1#';
+const POST_IDS_WITH_COMMENTS = [1, 2, 3];
+
+export function setup() {
+  const loginRes = http.post(
+    LOGIN_URL,
+    JSON.stringify({ identifier: TEST_USERNAME, password: TEST_PASSWORD }),
+    { headers: { 'Content-Type': 'application/json' } },
+  );
+  check(loginRes, { 'Login - status is 200': (r) => r.status === 200 });
+  if (loginRes.status !== 200) {
+    throw new Error(`Login failed: ${loginRes.body}`);
+  }
+  return { accessToken: loginRes.json('access') };
+}
+
+function readFeedAndComments(prefix, accessToken) {
+  const headers = { Authorization: `Bearer ${accessToken}` };
+  const page = 1 + Math.floor(Math.random() * 3);
+  const postId = POST_IDS_WITH_COMMENTS[Math.floor(Math.random() * POST_IDS_WITH_COMMENTS.length)];
+
+  const feed = http.get(`${API_BASE_URL}${prefix}/feed/?page=${page}`, { headers, tags: { name: `${prefix}/feed/` } });
+  check(feed, { 'Feed - status is 200': (r) => r.status === 200 });
+
+  const comments = http.get(`${API_BASE_URL}${prefix}/posts/${postId}/comments/`, { headers, tags: { name: `${prefix}/posts/:id/comments/` } });
+  check(comments, { 'Comments - status is 200 or 404': (r) => r.status === 200 || r.status === 404 });
+}
+
+export function syncFeed({ accessToken }) {
+  group('Sync feed', () => readFeedAndComments('', accessToken));
+}
+
+export function asyncFeed({ accessToken }) {
+  group('Async feed', () => readFeedAndComments('/async', accessToken));
+}
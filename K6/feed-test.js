@@ -1,12 +1,18 @@
 import http from 'k6/http';
 import { check, sleep, group } from 'k6';
 
+// Run the server with a short FEED_CACHE_TIMEOUT (e.g. FEED_CACHE_TIMEOUT=5) so the test crosses many cache
+// expiry boundaries: with single-flight rebuilds and early refresh, p99 should stay flat instead of spiking.
 export const options = {
   stages: [
     { duration: '10s', target: 10 },
     { duration: '30s', target: 10 },
     { duration: '10s', target: 0 },
   ],
+  thresholds: {
+    'http_req_duration{group:::Get Feed Test}': ['p(99)<500'],
+    'http_req_failed': ['rate<0.01'],
+  },
 };
 
 const API_BASE_URL = 'http://localhost:8000/posts';
@@ -80,6 +86,13 @@ export default function ({ accessToken }) {
     check(res2, {
       'Get Feed (Cached) - response is faster': () => res2.timings.duration < res1.timings.duration,
     });
+
+    // Polling client: revalidate with the ETag instead of downloading the page again
+    const res3 = http.get(feedUrl, { headers: { ...headers, 'If-None-Match': res2.headers['Etag'] } });
+    check(res3, {
+      'Get Feed (Conditional) - status is 304 (or 200 if the feed changed)': (r) => r.status === 304 || r.status === 200,
+      'Get Feed (Conditional) - 304 has no body': (r) => r.status !== 304 || !r.body,
+    });
   });
 
   sleep(1);
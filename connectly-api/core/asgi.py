@@ -3,6 +3,9 @@ ASGI config for core project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Served by uvicorn workers (see RUNNING.md), the whole middleware chain runs async, so the async views in
+posts/async_views.py never hold a thread while they wait on Redis or Postgres; the DRF views run in a thread as usual.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
 """
@@ -40,7 +40,6 @@ THIRD_PARTY_APPS = [
     'allauth.socialaccount.providers.google',
     'corsheaders',
     'django_filters',
-    'social_django',
     'dj_rest_auth',
     'dj_rest_auth.registration',
     'djoser',
@@ -48,6 +47,12 @@ THIRD_PARTY_APPS = [
     'whitenoise.runserver_nostatic',
 ]
 
+# python-social-auth: no URL or authentication backend uses it (Google login goes through allauth and dj-rest-auth),
+# yet importing it loads social_core's backends and requests in every worker; `manage.py profile_startup` shows the cost
+SOCIAL_DJANGO_ENABLED = config('SOCIAL_DJANGO_ENABLED', default=False, cast=bool)
+if SOCIAL_DJANGO_ENABLED:
+    THIRD_PARTY_APPS.append('social_django')
+
 LOCAL_APPS = [
     'posts.apps.PostsConfig',
 ]
@@ -57,17 +62,27 @@ INSTALLED_APPS = DJANGO_APPS + THIRD_PARTY_APPS + LOCAL_APPS
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
-    'django.contrib.sessions.middleware.SessionMiddleware',
+    'posts.middleware.QueryBudgetMiddleware', # counts SQL queries per request against posts.middleware.QUERY_BUDGETS
+    'posts.middleware.ReplicaRoutingMiddleware', # sends reads of safe requests to DATABASE_REPLICAS (posts/db_router.py)
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
+    'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    # Browser/OAuth stack: requests under LEAN_API_PREFIXES skip everything from here to LeanPipelineEnd
+    'posts.middleware.LeanPipelineMiddleware',
+    # posts.middleware wraps WhiteNoise's and social_django's middleware so ASGI workers run async views natively
+    'posts.middleware.AsyncWhiteNoiseMiddleware', # first of the block, so static files skip the rest of it
+    'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
-    'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'allauth.account.middleware.AccountMiddleware',
-    'social_django.middleware.SocialAuthExceptionMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'posts.middleware.LeanPipelineEnd',
 ]
+if SOCIAL_DJANGO_ENABLED:
+    MIDDLEWARE.insert(MIDDLEWARE.index('posts.middleware.LeanPipelineEnd'), 'posts.middleware.AsyncSocialAuthExceptionMiddleware')
+
+# Stateless API routes (JWT, no sessions, CSRF or messages); empty to run every request through the full stack
+LEAN_API_PREFIXES = config('LEAN_API_PREFIXES', default='/posts/', cast=Csv())
 
 
 # Common & Templates
@@ -89,8 +104,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
-                'social_django.context_processors.backends',
-                'social_django.context_processors.login_redirect',
+                *(['social_django.context_processors.backends', 'social_django.context_processors.login_redirect'] if SOCIAL_DJANGO_ENABLED else []),
             ],
         },
     },
@@ -127,11 +141,14 @@ STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 # Database & Cache
 # ------------------------------------------------------------------------------
 db_from_env = config('DATABASE_URL')
+# Set to 0 under ASGI (uvicorn workers): connections are per thread and async views run their queries on a new
+# thread per request, so persistent connections would pile up instead of being reused. PgBouncer pools them instead.
+DB_CONN_MAX_AGE = config('DB_CONN_MAX_AGE', default=600, cast=int)
 
 DATABASES = {
     'default': dj_database_url.config(
         default=db_from_env,
-        conn_max_age=600,
+        conn_max_age=DB_CONN_MAX_AGE,
         conn_health_checks=True,
     )
 }
@@ -139,37 +156,103 @@ DATABASES = {
 # Disable server-side cursors when using PgBouncer in transaction pooling mode
 DATABASES['default']['DISABLE_SERVER_SIDE_CURSORS'] = True
 
+# Read replicas: comma-separated URLs, registered as replica1, replica2, ... Reads of GET requests go to a replica,
+# unless the user wrote within the last REPLICA_STICKY_SECONDS (read-your-writes while replication catches up)
+DATABASE_REPLICAS = []
+for number, replica_url in enumerate(config('DATABASE_REPLICA_URLS', default='', cast=Csv()), start=1):
+    DATABASES[f'replica{number}'] = dj_database_url.parse(replica_url, conn_max_age=DB_CONN_MAX_AGE, conn_health_checks=True)
+    DATABASES[f'replica{number}']['DISABLE_SERVER_SIDE_CURSORS'] = True
+    DATABASE_REPLICAS.append(f'replica{number}')
+DATABASE_ROUTERS = ['posts.db_router.PrimaryReplicaRouter']
+REPLICA_STICKY_SECONDS = config('REPLICA_STICKY_SECONDS', default=10, cast=int)
+
 # Caching
 REDIS_URL = config('REDIS_URL', default='redis://127.0.0.1:6379/1') # default on dev mode using docker
 
 CACHES = {
     'default': {
-        'BACKEND': 'django_redis.cache.RedisCache',
+        'BACKEND': 'posts.cache_backends.TieredRedisCache', # django_redis with an in-process LRU in front
         'LOCATION': REDIS_URL,
         'OPTIONS': {
             'CLIENT_CLASS': 'django_redis.client.DefaultClient',
             "IGNORE_EXCEPTIONS": True,  # Prevents Redis failures from breaking the app
+            # Keys kept in worker memory too; writes and deletes are broadcast over pub/sub to evict them everywhere
+            'LOCAL_PREFIXES': config('CACHE_LOCAL_PREFIXES', default='user_,feed_data:,post_comments:,author_recent:', cast=Csv()),
+            'LOCAL_MAX_BYTES': config('CACHE_LOCAL_MAX_BYTES', default=32 * 1024 * 1024, cast=int),
+            'LOCAL_TIMEOUT': config('CACHE_LOCAL_TIMEOUT', default=5, cast=int), # seconds; bounds staleness if a broadcast is lost
+            # msgpack with one header row per list of dicts, plus compression above a size threshold (redis.conf caps memory at 100mb)
+            'SERIALIZER': 'posts.cache_backends.CompactSerializer',
+            'COMPRESSOR': 'posts.cache_backends.ThresholdCompressor',
+            'COMPRESS_ALGORITHM': config('CACHE_COMPRESS_ALGORITHM', default='zlib'), # or 'zstd' (needs the zstandard package)
+            'COMPRESS_MIN_BYTES': config('CACHE_COMPRESS_MIN_BYTES', default=512, cast=int),
         }
     },
 }
 
+# Like engine buffer (posts/likes.py): likes not written to the database yet only live there, so it is a separate
+# Redis that persists and never evicts (redis/redis-likes.conf, e.g. redis://127.0.0.1:6380/0 with docker compose).
+# Empty (the default): likes are written straight to the database
+LIKES_REDIS_URL = config('LIKES_REDIS_URL', default='')
+LIKES_REDIS_TIMEOUT = config('LIKES_REDIS_TIMEOUT', default=0.5, cast=float) # seconds before a like falls back to the database
+
+CACHE_TTL = config('CACHE_TTL', default=300, cast=int) # user profile cache (UserViewSet.retrieve)
+FEED_CACHE_TIMEOUT = config('FEED_CACHE_TIMEOUT', default=7200, cast=int)
+COMMENT_PREVIEW_SIZE = config('COMMENT_PREVIEW_SIZE', default=3, cast=int) # latest comments embedded in each post of /posts/posts/
+# Expired or invalidated pages are served for up to this long while a single worker rebuilds them
+CACHE_STALE_TTL = config('CACHE_STALE_TTL', default=300, cast=int)
+
+# Feed timelines: posts are pushed into followers' timelines (fan-out-on-write), except for authors
+# above the follower threshold, whose recent posts are pulled into the feed at read time
+TIMELINE_MAX_LENGTH = config('TIMELINE_MAX_LENGTH', default=800, cast=int)
+FEED_FANOUT_FOLLOWER_THRESHOLD = config('FEED_FANOUT_FOLLOWER_THRESHOLD', default=5000, cast=int)
+
+# Background jobs (fan-out, follower feed invalidation) are processed by `manage.py run_jobs`;
+# JOBS_EAGER runs them right after the request's transaction commits instead (local dev without a worker)
+JOBS_EAGER = config('JOBS_EAGER', default=False, cast=bool)
+
+
+# User rows behind JWT claims users (posts/authentication.py), for fields outside the token claims
+AUTH_USER_CACHE_TIMEOUT = config('AUTH_USER_CACHE_TIMEOUT', default=60, cast=int)
+
+# Log requests over their SQL query budget (posts/middleware.py); the headers expose per-request query counts
+QUERY_BUDGET_HEADERS = config('QUERY_BUDGET_HEADERS', default=DEBUG, cast=bool)
 
 # Override database settings for unit testing
-if 'test' in sys.argv:
+# (set TEST_DATABASE_URL to a Postgres server to also run the query-plan tests in posts/tests.py)
+TEST_DATABASE_URL = config('TEST_DATABASE_URL', default='')
+if 'test' in sys.argv and TEST_DATABASE_URL:
+    DATABASES['default'] = dj_database_url.parse(TEST_DATABASE_URL)
+elif 'test' in sys.argv:
     DATABASES['default'] = {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': ':memory:',  # Use in-memory SQLite for faster tests
     }
+if 'test' in sys.argv:
+    # A second, independent database so posts/tests.py can check replica routing; the rest of the suite
+    # runs without replicas (ReplicaRoutingTests turns them on with override_settings)
+    for alias in DATABASE_REPLICAS:
+        del DATABASES[alias]
+    DATABASES['replica'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': ':memory:',
+    }
+    DATABASE_REPLICAS = []
 
 # Password & Auth Backends
 # ------------------------------------------------------------------------------
 PASSWORD_HASHERS = [
-    "django.contrib.auth.hashers.Argon2PasswordHasher",
+    "posts.hashers.TunableArgon2PasswordHasher", # Argon2 with the costs below; changed costs rehash on next login
     "django.contrib.auth.hashers.PBKDF2PasswordHasher",
     "django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher",
     "django.contrib.auth.hashers.BCryptSHA256PasswordHasher",
 ]
 
+# Argon2 cost per hash: each login holds ARGON2_MEMORY_COST KiB for ARGON2_TIME_COST passes
+# (`manage.py benchmark_login` measures the resulting login throughput per worker)
+ARGON2_TIME_COST = config('ARGON2_TIME_COST', default=2, cast=int)
+ARGON2_MEMORY_COST = config('ARGON2_MEMORY_COST', default=102400, cast=int)
+ARGON2_PARALLELISM = config('ARGON2_PARALLELISM', default=8, cast=int)
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -199,7 +282,7 @@ CORS_ORIGIN_ALLOW_ALL = False
 
 CORS_ALLOW_CREDENTIALS = True
 
-CORS_EXPOSE_HEADERS = ['Content-Type', 'authorization', 'X-CSRFToken', 'Access-Control-Allow-Origin: *',]
+CORS_EXPOSE_HEADERS = ['Content-Type', 'authorization', 'X-CSRFToken', 'Access-Control-Allow-Origin: *', 'ETag', 'Last-Modified',]
 
 CORS_ALLOWED_ORIGINS = [
     'https://localhost:8080',
@@ -231,6 +314,8 @@ CORS_ALLOW_HEADERS = default_headers + (
     'user-agent',
     'x-csrftoken',
     'x-requested-with',
+    'if-none-match', # conditional GETs of the feed, posts and comments (posts/conditional.py)
+    'if-modified-since',
 )
 
 
@@ -255,8 +340,9 @@ ADMIN_URL = config('ADMIN_URL', default='admin/')
 # django-rest-framework
 # -------------------------------------------------------------------------------
 
+# orjson instead of the json module (same output); 'rest_framework.renderers.JSONRenderer' / 'rest_framework.parsers.JSONParser' to switch back
 DEFAULT_RENDERER_CLASSES = (
-    'rest_framework.renderers.JSONRenderer',
+    'posts.renderers.ORJSONRenderer',
 )
 
 if DEBUG:
@@ -265,15 +351,20 @@ if DEBUG:
 
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": [
+        'posts.authentication.ClaimsJWTAuthentication', # most requests: request.user from the token claims, no query
         'rest_framework.authentication.TokenAuthentication',
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
     ],
     "DEFAULT_PERMISSION_CLASSES": [
         'rest_framework.permissions.AllowAny'
     ],
     "DEFAULT_RENDERER_CLASSES": DEFAULT_RENDERER_CLASSES,
+    "DEFAULT_PARSER_CLASSES": [
+        'posts.renderers.ORJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
 
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    'DEFAULT_PAGINATION_CLASS': 'posts.pagination.DefaultPagination', # page numbers, or keyset mode with ?cursor=
     'PAGE_SIZE': 10,
 
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
@@ -329,6 +420,7 @@ SIMPLE_JWT = {
     'SIGNING_KEY': config('SIGNING_KEY', default='insecure-default-key'),  # Replace with a secure key from env!
     'ALGORITHM': 'HS256',
     'TOKEN_OBTAIN_SERIALIZER': 'posts.serializers.CustomTokenObtainPairSerializer',
+    'TOKEN_REFRESH_SERIALIZER': 'posts.serializers.ClaimsTokenRefreshSerializer', # refreshes the user claims too
     'AUTH_HEADER_TYPES': ('Bearer',),
 }
 
@@ -1,7 +1,7 @@
 from django.contrib import admin
 from django.urls import path, include
-from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView, SpectacularRedocView 
-from posts.views import ValidateTokenView, GoogleLogin, CustomTokenRefreshView
+from posts.lazy import lazy_view
+from posts.views import ValidateTokenView, CustomTokenRefreshView
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -9,14 +9,15 @@ urlpatterns = [
     path('accounts/', include('allauth.urls')),  # For Google OAuth callbacks
     path('api/auth/', include('dj_rest_auth.urls')),
     path('api/auth/registration/', include('dj_rest_auth.registration.urls')),
-    path('api/auth/social/google/', GoogleLogin.as_view(), name='google_login'),  # Handles Google login/token exchange
+    path('api/auth/social/google/', lazy_view('posts.social_login.GoogleLogin'), name='google_login'),  # Handles Google login/token exchange
 
     path('api/validate-token/', ValidateTokenView.as_view(), name='validate-token'),
     path('auth/', include('djoser.urls')),
     path('auth/', include('djoser.urls.authtoken')),
     path('auth/', include('djoser.urls.jwt')),
-    path('api/schema/', SpectacularAPIView.as_view(), name='schema'),
-    path('api/schema/swagger-ui/', SpectacularSwaggerView.as_view(url_name='schema'), name='swagger-ui'),
-    path('api/schema/redoc/', SpectacularRedocView.as_view(url_name='schema'), name='redoc'),
+    # Rarely used: imported on their first request rather than by every worker at boot (posts/lazy.py)
+    path('api/schema/', lazy_view('drf_spectacular.views.SpectacularAPIView'), name='schema'),
+    path('api/schema/swagger-ui/', lazy_view('drf_spectacular.views.SpectacularSwaggerView', url_name='schema'), name='swagger-ui'),
+    path('api/schema/redoc/', lazy_view('drf_spectacular.views.SpectacularRedocView', url_name='schema'), name='redoc'),
 ]
 
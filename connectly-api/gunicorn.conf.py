@@ -0,0 +1,29 @@
+"""
+gunicorn settings for the web process (Procfile, RUNNING.md): gunicorn -c connectly-api/gunicorn.conf.py core.wsgi:application
+
+With WEB_PRELOAD (the default) the master loads Django, the URLconf and every lazy view once, then forks the workers:
+they start ready to serve and share those pages copy-on-write instead of each importing everything again.
+`manage.py profile_startup` shows what a worker's boot costs.
+"""
+import gc
+import os
+from decouple import config
+
+pythonpath = os.path.dirname(os.path.abspath(__file__))
+bind = f"0.0.0.0:{config('PORT', default='8000')}"
+workers = config('WEB_CONCURRENCY', default=3, cast=int)
+preload_app = config('WEB_PRELOAD', default=True, cast=bool)
+
+
+def when_ready(server):
+    if not preload_app:
+        return
+    from posts.lazy import preload
+    preload()
+    # Objects allocated so far live for the whole process: keep the collector from touching (and so copying) their pages
+    gc.freeze()
+
+def post_fork(server, worker):
+    # Connections opened while the master loaded the app must not be shared between processes
+    from django.db import connections
+    connections.close_all()
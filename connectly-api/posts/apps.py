@@ -6,3 +6,6 @@ class PostsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'posts'
     verbose_name = _('Posts')
+
+    def ready(self):
+        from . import authentication, authz # noqa: F401 (connects the user row and group membership receivers)
@@ -0,0 +1,142 @@
+"""
+Async twins of the busiest read endpoints, for ASGI workers (uvicorn, or gunicorn with uvicorn workers; see RUNNING.md).
+
+A sync worker is tied up for the whole time a request waits on Redis or Postgres. These views await those calls
+instead, so one worker process interleaves many I/O-bound requests. Lookups that do not depend on each other run
+concurrently (asyncio.gather): the feed generation and the followed high-fanout authors, the viewer's role and
+followed authors, the comments generation and the post's version stamps. Cache hits (and If-None-Match polls that
+get a 304) never leave the event loop; a miss rebuilds the page with the same builder as the sync view
+(posts/views.py) in a single thread hop.
+
+Responses match the DRF views they mirror (feed_view, PostViewSet.comments, UserViewSet.retrieve), errors included.
+Only JWT authentication is supported: DRF's TokenAuthentication and sessions are not looked at.
+"""
+import asyncio
+import functools
+import logging
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.http import Http404, HttpResponse
+from django.views.decorators.http import require_GET
+from rest_framework import exceptions, status
+from rest_framework.request import Request
+from .authentication import ClaimsJWTAuthentication
+from .models import Post
+from .serializers import UserSerializer
+from .views import COMMENTS_CACHE_TIMEOUT, FEED_CACHE_TIMEOUT, build_comments_page, build_feed_page, page_cache_token
+from . import authz, caching, conditional, renderers, timelines, visibility
+
+User = get_user_model()
+logger = logging.getLogger(__name__)
+
+jwt_authentication = ClaimsJWTAuthentication()
+
+
+def render(data, status_code=status.HTTP_200_OK):
+    return rendered_response(renderers.rendered(data), status_code)
+
+def rendered_response(entry, status_code=status.HTTP_200_OK):
+    return HttpResponse(entry['content'], status=status_code, content_type=entry['content_type'])
+
+def api_view(view):
+    """GET-only async view whose DRF exceptions (and Http404) are rendered as DRF's exception handler would."""
+    @require_GET
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        try:
+            return await view(request, *args, **kwargs)
+        except Http404 as e:
+            exc = exceptions.NotFound(*e.args)
+        except exceptions.APIException as e:
+            exc = e
+        response = render(exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}, exc.status_code)
+        if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+            response['WWW-Authenticate'] = jwt_authentication.authenticate_header(request)
+        return response
+    return wrapper
+
+async def authenticated_user(request, required=True):
+    result = await jwt_authentication.aauthenticate(request)
+    if result is not None:
+        return result[0]
+    if required:
+        raise exceptions.NotAuthenticated()
+    return AnonymousUser()
+
+async def visible_post(user, pk):
+    """PostViewSet.get_object() for a read: the viewer's role and followed authors are resolved concurrently."""
+    posts = Post.objects.filter(pk=pk)
+    if not user.is_authenticated:
+        posts = posts.filter(privacy='public')
+    else:
+        admin, visible = await asyncio.gather(authz.ais_admin(user), visibility.avisible_posts(user, posts))
+        if not admin:
+            posts = visible
+    try:
+        return await posts.aget()
+    except Post.DoesNotExist:
+        raise Http404(f'No {Post._meta.object_name} matches the given query.') # get_object_or_404's message
+
+async def user_profile(pk):
+    try:
+        user = await User.objects.aget(pk=pk)
+    except User.DoesNotExist:
+        raise Http404(f'No {User._meta.object_name} matches the given query.')
+    return UserSerializer(user).data
+
+
+@api_view
+async def feed_view(request):
+    user = await authenticated_user(request)
+    request = Request(request) # query_params and absolute URIs for the paginators
+    filter_type = request.query_params.get('filter', None)
+    page_token = page_cache_token(request)
+    try:
+        key = await caching.afeed_cache_key(user.id, filter_type, page_token, timelines.ahigh_fanout_followees(user.id))
+        not_modified = await conditional.apage_not_modified(request, key)
+        if not_modified:
+            return not_modified
+        entry = await caching.acached(
+            key,
+            sync_to_async(lambda: conditional.versioned(renderers.rendered(build_feed_page(request, user, filter_type)), key)),
+            FEED_CACHE_TIMEOUT,
+            stale_key=caching.feed_stale_key(user.id, filter_type, page_token),
+        )
+    except exceptions.NotFound:
+        raise
+    except Exception as e:
+        logger.error(f"Error in async feed_view: {e}", exc_info=True)
+        return render({"error": "Internal Server Error"}, status.HTTP_500_INTERNAL_SERVER_ERROR)
+    return conditional.respond(request, rendered_response(entry), key, entry=entry)
+
+@api_view
+async def post_comments_view(request, pk):
+    user = await authenticated_user(request, required=False)
+    request = Request(request)
+    page_token = page_cache_token(request)
+    key, post_stamps = await asyncio.gather(caching.acomments_cache_key(pk, page_token), conditional.apost_stamps(pk, user))
+    stamps = [key, *post_stamps]
+    not_modified = await conditional.apage_not_modified(request, *stamps)
+    if not_modified:
+        return not_modified
+    post = await visible_post(user, pk)
+    entry = await caching.acached(
+        key,
+        sync_to_async(lambda: conditional.versioned(renderers.rendered(build_comments_page(request, post)), key)),
+        COMMENTS_CACHE_TIMEOUT,
+        stale_key=caching.comments_stale_key(pk, page_token),
+    )
+    return conditional.respond(request, rendered_response(entry), *stamps, entry=entry)
+
+@api_view
+async def user_detail_view(request, pk):
+    user = await authenticated_user(request)
+    # IsOwnerOrAdmin on a User object (which has no user/author field): admins only, as in UserViewSet.retrieve.
+    # The permission is checked before the profile is loaded or cached; like get_object(), a missing user is a 404
+    if not await authz.ais_admin(user):
+        if not await User.objects.filter(pk=pk).aexists():
+            raise Http404(f'No {User._meta.object_name} matches the given query.')
+        raise exceptions.PermissionDenied()
+    return render(await caching.acached(f'user_{pk}', functools.partial(user_profile, pk), settings.CACHE_TTL))
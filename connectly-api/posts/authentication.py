@@ -0,0 +1,136 @@
+"""
+JWT authentication without a database query.
+
+Tokens issued by the API carry the user fields that requests actually check (USER_CLAIMS). ClaimsJWTAuthentication
+trusts those signed claims and builds the request user from them instead of selecting the User row on every request;
+any other field is read on first access from a short-lived cached copy of the row (AUTH_USER_CACHE_TIMEOUT).
+Claims are refreshed whenever a new token pair is issued (login, refresh); tokens without them (issued before this
+change) fall back to the regular lookup.
+
+Each user's current claims and is_active flag are also cached as a stamp (user_{id}_claims), rewritten when a token is
+issued and by the user post_save/post_delete receivers. A token whose claims no longer match it (demoted staff, changed
+role) or whose user is inactive or deleted is rejected, rather than trusted until it expires; a missing stamp is read
+back from the database.
+"""
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+from .models import ClaimsUser
+
+User = get_user_model()
+
+USER_CLAIMS = ('username', 'role', 'is_staff', 'is_superuser')
+AUTH_USER_CACHE_TIMEOUT = getattr(settings, 'AUTH_USER_CACHE_TIMEOUT', 60)
+
+
+def add_user_claims(token, user):
+    for claim in USER_CLAIMS:
+        token[claim] = getattr(user, claim)
+    remember_claims(user)
+    return token
+
+def token_for(user):
+    """A refresh token carrying the user claims; its .access_token copies them."""
+    return add_user_claims(RefreshToken.for_user(user), user)
+
+
+def _row_key(user_id):
+    return f'user_{user_id}_row'
+
+def user_row(user_id):
+    """The user's column values by attribute name, cached for AUTH_USER_CACHE_TIMEOUT; None if the user is gone."""
+    key = _row_key(user_id)
+    row = cache.get(key)
+    if row is None:
+        row = User.objects.filter(pk=user_id).values(*(field.attname for field in User._meta.concrete_fields)).first()
+        if row is None:
+            return None
+        cache.set(key, row, AUTH_USER_CACHE_TIMEOUT)
+    return row
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def forget_user_row(sender, instance, **kwargs):
+    cache.delete(_row_key(instance.pk))
+
+
+def _claims_key(user_id):
+    return f'user_{user_id}_claims'
+
+def _stamp_timeout():
+    return int(api_settings.ACCESS_TOKEN_LIFETIME.total_seconds()) # as long as a token issued now is valid
+
+def remember_claims(user):
+    cache.set(_claims_key(user.pk), [user.is_active, *(getattr(user, claim) for claim in USER_CLAIMS)], _stamp_timeout())
+
+def claims_stamp(user_id):
+    """[is_active, *USER_CLAIMS] of a user as they are now, False if the user is gone."""
+    stamp = cache.get(_claims_key(user_id))
+    if stamp is None:
+        row = User.objects.filter(pk=user_id).values_list('is_active', *USER_CLAIMS).first()
+        stamp = list(row) if row is not None else False
+        cache.set(_claims_key(user_id), stamp, _stamp_timeout())
+    return stamp
+
+async def aclaims_stamp(user_id):
+    stamp = await cache.aget(_claims_key(user_id))
+    if stamp is None:
+        stamp = await sync_to_async(claims_stamp)(user_id)
+    return stamp
+
+@receiver(post_save, sender=User)
+def update_claims_stamp(sender, instance, **kwargs):
+    remember_claims(instance)
+
+@receiver(post_delete, sender=User)
+def revoke_claims(sender, instance, **kwargs):
+    cache.set(_claims_key(instance.pk), False, _stamp_timeout())
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    def get_user(self, validated_token):
+        if any(claim not in validated_token for claim in USER_CLAIMS):
+            return super().get_user(validated_token)
+        user_id = self.get_user_id(validated_token)
+        return self.claims_user(validated_token, user_id, claims_stamp(user_id))
+
+    def get_user_id(self, validated_token):
+        try:
+            return validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken('Token contained no recognizable user identification')
+
+    def claims_user(self, validated_token, user_id, stamp):
+        """The request user built from the token's claims, once they are checked against the user's current stamp."""
+        if stamp is False:
+            raise AuthenticationFailed('User not found', code='user_not_found')
+        is_active, *current = stamp
+        if not is_active:
+            raise AuthenticationFailed('User is inactive', code='user_inactive')
+        if current != [validated_token[claim] for claim in USER_CLAIMS]:
+            raise AuthenticationFailed('Token claims are outdated, refresh the token', code='claims_outdated')
+        claims = {User._meta.pk.attname: user_id, **{claim: validated_token[claim] for claim in USER_CLAIMS}}
+        # from_db() takes the values in field order; every other field is deferred (see ClaimsUser.refresh_from_db)
+        fields = [field.attname for field in User._meta.concrete_fields if field.attname in claims]
+        return ClaimsUser.from_db(DEFAULT_DB_ALIAS, fields, [claims[name] for name in fields])
+
+    async def aauthenticate(self, request):
+        """authenticate() for async views; only tokens without the user claims, or a missing stamp, need the database."""
+        header = self.get_header(request)
+        raw_token = self.get_raw_token(header) if header is not None else None
+        if raw_token is None:
+            return None
+        validated_token = self.get_validated_token(raw_token)
+        if any(claim not in validated_token for claim in USER_CLAIMS):
+            return await sync_to_async(self.get_user)(validated_token), validated_token
+        user_id = self.get_user_id(validated_token)
+        return self.claims_user(validated_token, user_id, await aclaims_stamp(user_id)), validated_token
@@ -0,0 +1,77 @@
+"""
+Role resolution.
+
+A user is an admin if they are staff, have the "admin" role, or belong to the Admin group. The group part used to be
+a JOIN query in every permission check; here the user's group names are cached (until their membership changes, see
+the m2m_changed receiver below) and the resolved answer is memoized on the request's user object, so a request asks
+at most once whatever the number of checks.
+"""
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
+from django.core.cache import cache
+from django.db.models.signals import m2m_changed, post_save, pre_delete
+from django.dispatch import receiver
+
+User = get_user_model()
+
+ADMIN_GROUP = 'Admin'
+GROUPS_CACHE_TIMEOUT = getattr(settings, 'GROUPS_CACHE_TIMEOUT', 3600)
+
+
+def _groups_key(user_id):
+    return f'user_{user_id}_groups'
+
+def group_names(user_id):
+    """Names of the groups a user belongs to, cached until their membership changes."""
+    key = _groups_key(user_id)
+    names = cache.get(key)
+    if names is None:
+        names = list(Group.objects.filter(user__id=user_id).values_list('name', flat=True))
+        cache.set(key, names, GROUPS_CACHE_TIMEOUT)
+    return names
+
+async def agroup_names(user_id):
+    key = _groups_key(user_id)
+    names = await cache.aget(key)
+    if names is None:
+        names = [name async for name in Group.objects.filter(user__id=user_id).values_list('name', flat=True)]
+        await cache.aset(key, names, GROUPS_CACHE_TIMEOUT)
+    return names
+
+def forget_groups(user_ids):
+    cache.delete_many([_groups_key(user_id) for user_id in user_ids])
+
+def is_admin(user):
+    """Whether the user has admin rights; resolved once per user object (i.e. per request)."""
+    if not user.is_authenticated:
+        return False
+    if not hasattr(user, '_is_admin'):
+        user._is_admin = user.is_staff or user.role == 'admin' or ADMIN_GROUP in group_names(user.id)
+    return user._is_admin
+
+async def ais_admin(user):
+    if not user.is_authenticated:
+        return False
+    if not hasattr(user, '_is_admin'):
+        user._is_admin = user.is_staff or user.role == 'admin' or ADMIN_GROUP in await agroup_names(user.id)
+    return user._is_admin
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def membership_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if not reverse: # user.groups.add(...)
+        forget_groups([instance.pk])
+    elif action == 'pre_clear': # group.user_set.clear(): the members are only known before
+        forget_groups(instance.user_set.values_list('id', flat=True))
+    else: # group.user_set.add(...)
+        forget_groups(pk_set)
+
+@receiver(post_save, sender=Group)
+@receiver(pre_delete, sender=Group)
+def group_changed(sender, instance, **kwargs):
+    # A renamed or deleted group changes the cached names of all its members
+    if instance.pk is not None and not kwargs.get('created'):
+        forget_groups(instance.user_set.values_list('id', flat=True))
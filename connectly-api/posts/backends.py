@@ -1,33 +1,54 @@
 from django.contrib.auth.models import UserManager
 from django.contrib.auth.backends import ModelBackend
 from django.contrib.auth import get_user_model
-from django.core.exceptions import ObjectDoesNotExist
-from django.db.models import Q
+from django.core.exceptions import ObjectDoesNotExist, PermissionDenied
 
 UserModel = get_user_model()
 
+def identifier_lookups(identifier):
+  """
+  Unique columns to match a login identifier against, most likely first: emails contain '@', usernames rarely do.
+  Each lookup hits its own unique index, where `username OR email` cannot use a single one.
+  """
+  return ('email', 'username') if '@' in identifier else ('username',)
+
+def get_by_identifier(identifier):
+  for column in identifier_lookups(identifier):
+    try:
+      return UserModel.objects.get(**{column: identifier})
+    except ObjectDoesNotExist:
+      continue
+  raise UserModel.DoesNotExist
+
 class CustomUserManager(UserManager):
   def get_by_natural_key(self, username):
-    return self.get(
-        Q(username=username) | Q(email=username)
-    )
+    for column in identifier_lookups(username):
+      try:
+        return self.get(**{column: username})
+      except self.model.DoesNotExist:
+        continue
+    raise self.model.DoesNotExist
 
 class EmailOrUsernameModelBackend(ModelBackend):
   """
-  Custom backend to authenticate using either username or email
+  Custom backend to authenticate using either username or email.
+  It is authoritative for username/email logins: a failed attempt stops the backend chain (PermissionDenied)
+  instead of letting the next backends look the same user up and verify the same password hash again.
   """
   def authenticate(self, request, username=None, password=None, **kwargs):
+    if username is None or password is None:
+      return None
     try:
-      user = UserModel.objects.get(Q(username=username) | Q(email=username))
-      if user.check_password(password):
-        return user
+      user = get_by_identifier(username)
     except ObjectDoesNotExist:
-      return None
-
-    return None
+      UserModel().set_password(password) # same hashing time as a wrong password, so misses don't reveal unknown accounts
+      raise PermissionDenied
+    if user.check_password(password): # rehashes with the current hasher parameters if they changed
+      return user
+    raise PermissionDenied
 
   def get_user(self, user_id):
     try:
       return UserModel.objects.get(pk=user_id)
     except ObjectDoesNotExist:
-      return None
\ No newline at end of file
+      return None
@@ -0,0 +1,537 @@
+"""
+Two-tier cache backend: a bounded in-process LRU in front of django_redis.
+
+Keys matching LOCAL_PREFIXES are also kept in worker memory for LOCAL_TIMEOUT seconds, so hot reads
+(user profiles, comment and feed pages) skip the Redis round trip. Every write or delete of such a key is
+published on a Redis pub/sub channel; each process runs one listener thread that evicts its local copy.
+While the listener is not subscribed (Redis down, worker just forked) the local tier is bypassed, so a
+process never serves local entries it could have missed invalidations for.
+
+Counters (incr/decr, e.g. the generation counters in posts/caching.py) always go to Redis.
+
+The async API used by the ASGI views (aget, aget_many, aset, aset_many, aadd, adelete) talks to Redis through
+redis.asyncio, one client per event loop, instead of Django's default of running the sync method in a thread.
+
+Values are stored in Redis with CompactSerializer (msgpack; lists of same-shaped dicts such as feed and comment
+pages are packed as a header row plus value rows, so keys like `author_username` are written once per page)
+and ThresholdCompressor (zlib or zstd, only above COMPRESS_MIN_BYTES).
+
+    CACHES = {'default': {
+        'BACKEND': 'posts.cache_backends.TieredRedisCache',
+        'OPTIONS': {
+            'LOCAL_PREFIXES': ['user_', 'feed_data:', 'post_comments:'],
+            'LOCAL_MAX_BYTES': 32 * 1024 * 1024,
+            'LOCAL_TIMEOUT': 5,
+            'SERIALIZER': 'posts.cache_backends.CompactSerializer',
+            'COMPRESSOR': 'posts.cache_backends.ThresholdCompressor',
+            ...
+        },
+    }}
+"""
+import asyncio
+import logging
+import os
+import pickle
+import threading
+import time
+import uuid
+import weakref
+import zlib
+from datetime import date, datetime
+from decimal import Decimal
+import msgpack
+from cachetools import TTLCache
+from redis import asyncio as aioredis
+from redis.exceptions import RedisError
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.exceptions import ImproperlyConfigured
+from django_redis.cache import RedisCache
+from django_redis.compressors.base import BaseCompressor
+from django_redis.exceptions import CompressorError
+from django_redis.serializers.base import BaseSerializer
+
+try:
+    import zstandard
+    _compression_errors = (zlib.error, ValueError, zstandard.ZstdError)
+except ImportError:
+    zstandard = None
+    _compression_errors = (zlib.error, ValueError)
+
+logger = logging.getLogger(__name__)
+
+INVALIDATION_CHANNEL = 'cache:invalidate'
+CLEAR_ALL = '*'
+
+_missing = object()
+
+# Leading byte of CompactSerializer payloads. Pickle (protocol >= 2) always starts with 0x80, so entries written
+# by the previous PickleSerializer, and values msgpack cannot represent, are still read transparently.
+MSGPACK_MARKER = b'm'
+PICKLE_MARKER = b'\x80'
+ZLIB_MARKER = b'z'
+ZSTD_MARKER = b'Z'
+
+EXT_TUPLE, EXT_TABLE, EXT_DATETIME, EXT_DATE, EXT_DECIMAL, EXT_UUID = range(1, 7)
+
+
+class _Unsupported(TypeError):
+    pass
+
+def _pack(value):
+    return msgpack.packb(value, use_bin_type=True)
+
+def _encode(value):
+    """Maps a value onto msgpack types, using ext types for tuples, tables and the few non-JSON scalars we cache."""
+    if value is None or isinstance(value, (str, bytes, bool, int, float)):
+        return value
+    if isinstance(value, dict):
+        if not all(isinstance(key, (str, int)) for key in value):
+            raise _Unsupported('dict key')
+        return {key: _encode(item) for key, item in value.items()}
+    if isinstance(value, list):
+        first = value[0] if value else None
+        if len(value) > 1 and isinstance(first, dict):
+            keys = list(first)
+            if all(isinstance(row, dict) and len(row) == len(keys) and all(key in row for key in keys) for row in value):
+                return msgpack.ExtType(EXT_TABLE, _pack([keys, [[_encode(row[key]) for key in keys] for row in value]]))
+        return [_encode(item) for item in value]
+    if isinstance(value, tuple):
+        return msgpack.ExtType(EXT_TUPLE, _pack([_encode(item) for item in value]))
+    if isinstance(value, datetime):
+        return msgpack.ExtType(EXT_DATETIME, value.isoformat().encode())
+    if isinstance(value, date):
+        return msgpack.ExtType(EXT_DATE, value.isoformat().encode())
+    if isinstance(value, Decimal):
+        return msgpack.ExtType(EXT_DECIMAL, str(value).encode())
+    if isinstance(value, uuid.UUID):
+        return msgpack.ExtType(EXT_UUID, value.bytes)
+    raise _Unsupported(type(value).__name__)
+
+def _unpack(data):
+    return msgpack.unpackb(data, raw=False, ext_hook=_decode_ext, strict_map_key=False)
+
+def _decode_ext(code, data):
+    if code == EXT_TABLE:
+        keys, rows = _unpack(data)
+        return [dict(zip(keys, row)) for row in rows]
+    if code == EXT_TUPLE:
+        return tuple(_unpack(data))
+    if code == EXT_DATETIME:
+        return datetime.fromisoformat(data.decode())
+    if code == EXT_DATE:
+        return date.fromisoformat(data.decode())
+    if code == EXT_DECIMAL:
+        return Decimal(data.decode())
+    if code == EXT_UUID:
+        return uuid.UUID(bytes=data)
+    return msgpack.ExtType(code, data)
+
+
+class CompactSerializer(BaseSerializer):
+    """
+    msgpack serializer for cached pages. Dict subclasses (DRF's ReturnDict/ReturnList, OrderedDict) come back
+    as plain dicts and lists; values msgpack cannot represent fall back to pickle.
+    """
+
+    def dumps(self, value):
+        try:
+            return MSGPACK_MARKER + _pack(_encode(value))
+        except (TypeError, ValueError, OverflowError):
+            return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+    def loads(self, value):
+        if value[:1] == MSGPACK_MARKER:
+            return _unpack(value[1:])
+        return pickle.loads(value)
+
+
+class ThresholdCompressor(BaseCompressor):
+    """
+    Compresses values of at least COMPRESS_MIN_BYTES with zlib (default) or zstd (COMPRESS_ALGORITHM, needs the
+    zstandard package). A marker byte says how each value was stored, so the threshold and algorithm can change
+    without invalidating existing entries.
+    """
+
+    def __init__(self, options):
+        super().__init__(options)
+        self.min_length = options.get('COMPRESS_MIN_BYTES', 512)
+        self.algorithm = options.get('COMPRESS_ALGORITHM', 'zlib')
+        self.level = options.get('COMPRESS_LEVEL')
+        if self.algorithm == 'zstd':
+            if zstandard is None:
+                raise ImproperlyConfigured("COMPRESS_ALGORITHM 'zstd' requires the zstandard package")
+            self._zstd = zstandard.ZstdCompressor(level=self.level or 3)
+        elif self.algorithm != 'zlib':
+            raise ImproperlyConfigured(f"Unknown COMPRESS_ALGORITHM: {self.algorithm}")
+
+    def compress(self, value):
+        if len(value) < self.min_length:
+            return value
+        if self.algorithm == 'zstd':
+            compressed = ZSTD_MARKER + self._zstd.compress(value)
+        else:
+            compressed = ZLIB_MARKER + zlib.compress(value, 6 if self.level is None else self.level)
+        return compressed if len(compressed) < len(value) else value
+
+    def decompress(self, value):
+        marker = value[:1]
+        try:
+            if marker == ZLIB_MARKER:
+                return zlib.decompress(value[1:])
+            if marker == ZSTD_MARKER and zstandard is not None:
+                return zstandard.ZstdDecompressor().decompress(value[1:])
+        except _compression_errors as e:
+            raise CompressorError(e)
+        raise CompressorError('value is not compressed') # django_redis then reads it as-is
+
+
+class LocalStats:
+    """Hit/miss counters of one process, per tier."""
+    FIELDS = ('local_hits', 'local_misses', 'redis_hits', 'redis_misses', 'local_sets', 'invalidations')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.counts = dict.fromkeys(self.FIELDS, 0)
+
+    def add(self, field, count=1):
+        if count:
+            with self.lock:
+                self.counts[field] += count
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.counts)
+
+
+class TieredRedisCache(RedisCache):
+    def __init__(self, server, params):
+        super().__init__(server, params)
+        options = params.get('OPTIONS', {})
+        self.local_prefixes = tuple(options.get('LOCAL_PREFIXES', ()))
+        self.local_max_bytes = options.get('LOCAL_MAX_BYTES', 32 * 1024 * 1024)
+        self.local_timeout = options.get('LOCAL_TIMEOUT', 5)
+        self.channel = options.get('LOCAL_CHANNEL', INVALIDATION_CHANNEL)
+        self.stats = LocalStats()
+        self._lock = threading.RLock()
+        self._async_clients = weakref.WeakKeyDictionary() # event loop -> redis.asyncio client
+        self._reset_local()
+
+    def _reset_local(self):
+        # Entries are stored pickled: the size bound is in real bytes and callers never share a mutable object
+        self._local = TTLCache(maxsize=self.local_max_bytes, ttl=self.local_timeout, getsizeof=len)
+        self._pid = os.getpid()
+        self._subscribed = threading.Event()
+        self._listener = None
+        self._invalidation_seq = 0
+
+    # Local tier
+
+    def _is_local(self, key):
+        return bool(self.local_prefixes) and self.local_max_bytes > 0 and str(key).startswith(self.local_prefixes)
+
+    def _local_ready(self):
+        """Starts the invalidation listener on first use in a process; True once it is subscribed."""
+        if not self.local_prefixes:
+            return False
+        if self._pid != os.getpid(): # forked (e.g. gunicorn --preload): the parent's entries and thread are not ours
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._reset_local()
+        if self._listener is None:
+            with self._lock:
+                if self._listener is None:
+                    self._listener = threading.Thread(target=self._listen, name='cache-invalidation', daemon=True)
+                    self._listener.start()
+        return self._subscribed.is_set()
+
+    def _local_get(self, full_key):
+        with self._lock:
+            raw = self._local.get(full_key)
+        return _missing if raw is None else pickle.loads(raw)
+
+    def _local_set(self, full_key, value, seq):
+        try:
+            raw = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        except (pickle.PicklingError, TypeError, AttributeError):
+            return
+        if len(raw) > self.local_max_bytes:
+            return
+        with self._lock:
+            # Skip values read before an invalidation that arrived while the Redis call was in flight
+            if seq != self._invalidation_seq:
+                return
+            self._local[full_key] = raw
+        self.stats.add('local_sets')
+
+    def _evict_local(self, full_keys):
+        with self._lock:
+            self._invalidation_seq += 1
+            if CLEAR_ALL in full_keys:
+                self._local.clear()
+            else:
+                for full_key in full_keys:
+                    self._local.pop(full_key, None)
+        self.stats.add('invalidations', len(full_keys))
+
+    def _publish(self, full_keys):
+        """Evicts the keys here and tells every other process to do the same."""
+        if not full_keys or not self.local_prefixes:
+            return
+        self._evict_local(full_keys)
+        try:
+            self.client.get_client(write=True).publish(self.channel, '\n'.join(full_keys))
+        except Exception as e:
+            self._publish_failed(full_keys, e)
+
+    async def _apublish(self, full_keys):
+        if not full_keys or not self.local_prefixes:
+            return
+        self._evict_local(full_keys)
+        try:
+            await self._aredis().publish(self.channel, '\n'.join(full_keys))
+        except RedisError as e:
+            self._publish_failed(full_keys, e)
+
+    def _publish_failed(self, full_keys, e):
+        # Other processes may now hold a stale copy for at most LOCAL_TIMEOUT seconds.
+        # While Redis is down (listener not subscribed) every write fails the same way, so don't flood the log.
+        log = logger.warning if self._subscribed.is_set() else logger.debug
+        log(f"Failed to publish cache invalidation for {len(full_keys)} keys: {e}")
+
+    def _listen(self):
+        backoff = 1
+        while True:
+            pubsub = None
+            try:
+                pubsub = self.client.get_client(write=False).pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                # Anything cached before subscribing may have missed an invalidation
+                self._evict_local([CLEAR_ALL])
+                self._subscribed.set()
+                backoff = 1
+                for message in pubsub.listen():
+                    data = message.get('data')
+                    if isinstance(data, bytes):
+                        data = data.decode()
+                    if data:
+                        self._evict_local(data.split('\n'))
+            except Exception as e:
+                if backoff == 1:
+                    logger.warning(f"Cache invalidation listener disconnected, local tier bypassed: {e}")
+            finally:
+                self._subscribed.clear()
+                if pubsub is not None:
+                    try:
+                        pubsub.close()
+                    except Exception:
+                        pass
+            time.sleep(backoff)
+            backoff = min(backoff * 2, 30)
+
+    def local_stats(self):
+        """Per-tier counters of this process plus the local tier's current size."""
+        stats = self.stats.snapshot()
+        with self._lock:
+            stats.update(local_keys=len(self._local), local_bytes=int(self._local.currsize), local_max_bytes=self.local_max_bytes)
+        stats['local_enabled'] = self._subscribed.is_set()
+        return stats
+
+    # Cache API
+
+    def get(self, key, default=None, version=None, client=None):
+        use_local = self._is_local(key) and client is None and self._local_ready()
+        if use_local:
+            full_key = self.make_key(key, version=version)
+            value = self._local_get(full_key)
+            if value is not _missing:
+                self.stats.add('local_hits')
+                return value
+            self.stats.add('local_misses')
+
+        seq = self._invalidation_seq
+        value = super().get(key, _missing, version, client)
+        if value is _missing:
+            self.stats.add('redis_misses')
+            return default
+        self.stats.add('redis_hits')
+        if use_local:
+            self._local_set(full_key, value, seq)
+        return value
+
+    def get_many(self, keys, version=None, client=None):
+        use_local, found, remote_keys = self._get_many_local(list(keys), version, client)
+        if remote_keys:
+            seq = self._invalidation_seq
+            remote = super().get_many(remote_keys, version=version, client=client)
+            self._got_many_remote(remote, remote_keys, version, use_local, seq)
+            found.update(remote)
+        return found
+
+    def _get_many_local(self, keys, version, client=None):
+        """Splits keys into the values found in worker memory and the keys left to read from Redis."""
+        use_local = client is None and any(self._is_local(key) for key in keys) and self._local_ready()
+        found = {}
+        remote_keys = []
+        for key in keys:
+            value = self._local_get(self.make_key(key, version=version)) if use_local and self._is_local(key) else _missing
+            if value is _missing:
+                remote_keys.append(key)
+            else:
+                found[key] = value
+        if use_local:
+            self.stats.add('local_hits', len(found))
+            self.stats.add('local_misses', sum(1 for key in remote_keys if self._is_local(key)))
+        return use_local, found, remote_keys
+
+    def _got_many_remote(self, remote, remote_keys, version, use_local, seq):
+        self.stats.add('redis_hits', len(remote))
+        self.stats.add('redis_misses', len(remote_keys) - len(remote))
+        if use_local:
+            for key, value in remote.items():
+                if self._is_local(key):
+                    self._local_set(self.make_key(key, version=version), value, seq)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None, client=None, nx=False, xx=False):
+        if not self._is_local(key):
+            return super().set(key, value, timeout=timeout, version=version, client=client, nx=nx, xx=xx)
+        full_key = self.make_key(key, version=version)
+        self._publish([full_key])
+        seq = self._invalidation_seq
+        result = super().set(key, value, timeout=timeout, version=version, client=client, nx=nx, xx=xx)
+        # Only mirror values Redis actually accepted; with IGNORE_EXCEPTIONS a failed write returns None
+        if result and timeout != 0 and self._local_ready():
+            self._local_set(full_key, value, seq)
+        return result
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None, client=None):
+        self._publish([self.make_key(key, version=version) for key in data if self._is_local(key)])
+        return super().set_many(data, timeout=timeout, version=version, client=client)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None, client=None):
+        result = super().add(key, value, timeout=timeout, version=version, client=client)
+        if result and self._is_local(key):
+            self._publish([self.make_key(key, version=version)])
+        return result
+
+    def delete(self, key, version=None, prefix=None, client=None):
+        if self._is_local(key):
+            self._publish([self.make_key(key, version=version)])
+        return super().delete(key, version=version, prefix=prefix, client=client)
+
+    def delete_many(self, keys, version=None):
+        keys = list(keys)
+        self._publish([self.make_key(key, version=version) for key in keys if self._is_local(key)])
+        return super().delete_many(keys, version=version)
+
+    def delete_pattern(self, *args, **kwargs):
+        self._publish([CLEAR_ALL])
+        return super().delete_pattern(*args, **kwargs)
+
+    def clear(self):
+        self._publish([CLEAR_ALL])
+        return super().clear()
+
+    def incr(self, key, delta=1, version=None, client=None, ignore_key_check=False):
+        if self._is_local(key):
+            self._publish([self.make_key(key, version=version)])
+        return super().incr(key, delta=delta, version=version, client=client, ignore_key_check=ignore_key_check)
+
+    def decr(self, key, delta=1, version=None, client=None):
+        if self._is_local(key):
+            self._publish([self.make_key(key, version=version)])
+        return super().decr(key, delta=delta, version=version, client=client)
+
+    # Async API (same tiers and invalidations; Redis is reached through redis.asyncio instead of a worker thread)
+
+    def _aredis(self):
+        """The redis.asyncio client of the running event loop; a connection pool cannot be shared between loops."""
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            options = self._params.get('OPTIONS', {})
+            client = self._async_clients[loop] = aioredis.Redis.from_url(
+                self.client._server[0], # the primary
+                socket_timeout=options.get('SOCKET_TIMEOUT'),
+                socket_connect_timeout=options.get('SOCKET_CONNECT_TIMEOUT'),
+            )
+        return client
+
+    def _redis_failed(self, e, default):
+        """IGNORE_EXCEPTIONS for the async calls: the same fallback values as the sync ones."""
+        if not self._ignore_exceptions:
+            raise e
+        if self._log_ignored_exceptions:
+            self.logger.exception('Exception ignored')
+        return default
+
+    def _expiry_ms(self, timeout):
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.default_timeout
+        return None if timeout is None else int(timeout * 1000)
+
+    async def aget(self, key, default=None, version=None):
+        return (await self.aget_many([key], version=version)).get(key, default)
+
+    async def aget_many(self, keys, version=None):
+        use_local, found, remote_keys = self._get_many_local(list(keys), version)
+        if remote_keys:
+            seq = self._invalidation_seq
+            try:
+                values = await self._aredis().mget([self.make_key(key, version=version) for key in remote_keys])
+            except RedisError as e:
+                values = self._redis_failed(e, [None] * len(remote_keys))
+            remote = {key: self.client.decode(value) for key, value in zip(remote_keys, values) if value is not None}
+            self._got_many_remote(remote, remote_keys, version, use_local, seq)
+            found.update(remote)
+        return found
+
+    async def aset(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        full_key = self.make_key(key, version=version)
+        if self._is_local(key):
+            await self._apublish([full_key])
+        seq = self._invalidation_seq
+        expiry = self._expiry_ms(timeout)
+        try:
+            if expiry is not None and expiry <= 0:
+                return bool(await self._aredis().delete(full_key))
+            result = await self._aredis().set(full_key, self.client.encode(value), px=expiry)
+        except RedisError as e:
+            return self._redis_failed(e, None)
+        if result and self._is_local(key) and self._local_ready():
+            self._local_set(full_key, value, seq)
+        return bool(result)
+
+    async def aset_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        await self._apublish([self.make_key(key, version=version) for key in data if self._is_local(key)])
+        expiry = self._expiry_ms(timeout)
+        try:
+            async with self._aredis().pipeline(transaction=False) as pipe:
+                for key, value in data.items():
+                    pipe.set(self.make_key(key, version=version), self.client.encode(value), px=expiry)
+                await pipe.execute()
+        except RedisError as e:
+            return self._redis_failed(e, list(data))
+        return []
+
+    async def aadd(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        full_key = self.make_key(key, version=version)
+        try:
+            result = bool(await self._aredis().set(full_key, self.client.encode(value), px=self._expiry_ms(timeout), nx=True))
+        except RedisError as e:
+            return self._redis_failed(e, None) # None, not False: posts.caching tells "cache down" from "taken"
+        if result and self._is_local(key):
+            await self._apublish([full_key])
+        return result
+
+    async def adelete(self, key, version=None):
+        full_key = self.make_key(key, version=version)
+        if self._is_local(key):
+            await self._apublish([full_key])
+        try:
+            return bool(await self._aredis().delete(full_key))
+        except RedisError as e:
+            return self._redis_failed(e, False)
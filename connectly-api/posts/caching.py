@@ -0,0 +1,258 @@
+"""
+Versioned cache namespaces for the feed and comment pages.
+
+Each user's feed and each post's comments own a generation counter that is part of every cache key in that
+namespace. Invalidating a namespace is a single INCR of its counter: the old entries are never read again and
+simply age out under Redis' allkeys-lru policy, so no KEYS/SCAN over the keyspace is ever needed.
+
+Pages are read through `cached()`, which protects the rebuild against stampedes: only the worker holding a short
+lock recomputes a missing or expiring page, the others keep serving the previous copy, and entries are refreshed
+probabilistically ahead of their expiry so a hot key rarely expires under load at all.
+
+Async views (posts/async_views.py) use the a-prefixed twins (`acached()`, `afeed_cache_key()`, ...), which follow
+the same protocol through Django's async cache API.
+
+High-fanout authors (see posts/timelines.py) get their own generation, which is embedded in the feed keys of
+everyone following them; a like on such an author's post bumps that one counter instead of every follower's.
+"""
+import asyncio
+import logging
+import math
+import random
+import time
+import uuid
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+FEED_NAMESPACE = 'feed'
+COMMENTS_NAMESPACE = 'post_comments'
+AUTHOR_NAMESPACE = 'author_feed'
+POST_NAMESPACE = 'post' # a post's own content and privacy; only versions HTTP validators (posts/conditional.py)
+FOLLOWS_NAMESPACE = 'follows' # a user's followed authors; idem
+
+CACHE_STALE_TTL = getattr(settings, 'CACHE_STALE_TTL', 300) # how long past expiry/invalidation a page may still be served while it is rebuilt
+CACHE_REBUILD_LOCK_TIMEOUT = getattr(settings, 'CACHE_REBUILD_LOCK_TIMEOUT', 10)
+CACHE_REBUILD_WAIT = getattr(settings, 'CACHE_REBUILD_WAIT', 2.0) # seconds to wait for another worker's rebuild when there is no stale copy
+CACHE_EARLY_REFRESH_BETA = getattr(settings, 'CACHE_EARLY_REFRESH_BETA', 1.0) # > 1 favours earlier refreshes
+
+
+def _generation_key(namespace, obj_id):
+    return f'{namespace}_gen:{obj_id}'
+
+def _seed():
+    # A fresh counter starts from the clock rather than 0, so a counter that was evicted
+    # can never come back with a value that matches entries cached before the eviction.
+    return time.time_ns() // 1000
+
+def get_generation(namespace, obj_id):
+    """Returns the current generation of a namespace, creating the counter if needed."""
+    return get_generations([(namespace, obj_id)])[0]
+
+def get_generations(namespaces):
+    """Returns the generations of several (namespace, obj_id) pairs in one round trip."""
+    keys = [_generation_key(namespace, obj_id) for namespace, obj_id in namespaces]
+    generations = cache.get_many(keys)
+    for key in keys:
+        if generations.get(key) is None:
+            seed = _seed()
+            cache.add(key, seed, timeout=None)
+            generations[key] = cache.get(key) or seed
+    return [generations[key] for key in keys]
+
+async def aget_generation(namespace, obj_id):
+    return (await aget_generations([(namespace, obj_id)]))[0]
+
+async def aget_generations(namespaces):
+    keys = [_generation_key(namespace, obj_id) for namespace, obj_id in namespaces]
+    generations = await cache.aget_many(keys) if keys else {}
+    for key in keys:
+        if generations.get(key) is None:
+            seed = _seed()
+            await cache.aadd(key, seed, timeout=None)
+            generations[key] = await cache.aget(key) or seed
+    return [generations[key] for key in keys]
+
+def bump_generation(namespace, obj_id):
+    """Invalidates every cache entry of a namespace with one INCR."""
+    key = _generation_key(namespace, obj_id)
+    try:
+        cache.incr(key)
+    except ValueError: # counter missing (never read or evicted): start a new one
+        cache.add(key, _seed(), timeout=None)
+
+def feed_cache_key(user_id, filter_type, page_token, author_ids=()):
+    """author_ids are the followed high-fanout authors whose generations the feed depends on."""
+    generations = get_generations([(FEED_NAMESPACE, user_id)] + [(AUTHOR_NAMESPACE, author_id) for author_id in author_ids])
+    return _feed_key(user_id, generations, filter_type, page_token)
+
+async def afeed_cache_key(user_id, filter_type, page_token, author_ids):
+    """feed_cache_key() for async views; the awaitable `author_ids` is resolved concurrently with the feed generation."""
+    feed_generation, author_ids = await asyncio.gather(aget_generation(FEED_NAMESPACE, user_id), author_ids)
+    generations = [feed_generation, *await aget_generations([(AUTHOR_NAMESPACE, author_id) for author_id in author_ids])]
+    return _feed_key(user_id, generations, filter_type, page_token)
+
+def _feed_key(user_id, generations, filter_type, page_token):
+    generation = '.'.join(str(generation) for generation in generations)
+    return f'feed_data:{user_id}:{generation}:{filter_type}:{page_token}'
+
+def feed_stale_key(user_id, filter_type, page_token):
+    """Last page built for this feed position, whatever its generation; served while the current one is rebuilt."""
+    return f'feed_data:{user_id}:stale:{filter_type}:{page_token}'
+
+def comments_cache_key(post_id, page_token):
+    generation = get_generation(COMMENTS_NAMESPACE, post_id)
+    return f'post_comments:{post_id}:{generation}:{page_token}'
+
+async def acomments_cache_key(post_id, page_token):
+    generation = await aget_generation(COMMENTS_NAMESPACE, post_id)
+    return f'post_comments:{post_id}:{generation}:{page_token}'
+
+def comments_stale_key(post_id, page_token):
+    return f'post_comments:{post_id}:stale:{page_token}'
+
+
+def _entry(raw):
+    # Entries are {'value', 'expires', 'delta'} envelopes; anything else (e.g. written before envelopes) is a miss
+    if isinstance(raw, dict) and 'expires' in raw and 'value' in raw:
+        return raw
+    return None
+
+def _should_refresh(entry):
+    """
+    Probabilistic early expiration (XFetch): the closer the entry is to expiring, and the longer it took to
+    build, the more likely a reader is to refresh it early. Always true once the entry has expired.
+    """
+    jitter = entry['delta'] * CACHE_EARLY_REFRESH_BETA * -math.log(random.random() or 1e-12)
+    return time.time() + jitter >= entry['expires']
+
+def _entries(key, value, start, timeout, stale_key):
+    now = time.time()
+    entry = {'value': value, 'expires': now + timeout, 'delta': now - start}
+    # The entry outlives its expiry by CACHE_STALE_TTL so readers can keep serving it during the next rebuild
+    entries = {key: entry}
+    if stale_key:
+        entries[stale_key] = entry
+    return entries
+
+def peek(key):
+    """The value cached under `key` while it is fresh, else None. Never rebuilds."""
+    entry = _entry(cache.get(key))
+    if entry is None or entry['expires'] <= time.time():
+        return None
+    return entry['value']
+
+async def apeek(key):
+    entry = _entry(await cache.aget(key))
+    if entry is None or entry['expires'] <= time.time():
+        return None
+    return entry['value']
+
+def _rebuild(key, compute, timeout, stale_key):
+    start = time.time()
+    value = compute()
+    cache.set_many(_entries(key, value, start, timeout, stale_key), timeout + CACHE_STALE_TTL)
+    return value
+
+async def _arebuild(key, compute, timeout, stale_key):
+    start = time.time()
+    value = await compute()
+    await cache.aset_many(_entries(key, value, start, timeout, stale_key), timeout + CACHE_STALE_TTL)
+    return value
+
+def cached(key, compute, timeout, stale_key=None):
+    """
+    Read-through cache with single-flight rebuilds.
+
+    Returns the cached value of `key`, or compute()'s result, which is cached for `timeout` seconds. When the
+    entry is missing, expired or picked for early refresh, only the worker that takes the rebuild lock calls
+    compute(); the others serve the expired entry (or, after an invalidation changed the key, the one stored
+    under `stale_key`), or wait briefly for the rebuild when there is nothing to serve.
+    """
+    entries = cache.get_many([key, stale_key] if stale_key else [key])
+    entry = _entry(entries.get(key))
+    if entry is not None and not _should_refresh(entry):
+        return entry['value']
+    stale = entry or _entry(entries.get(stale_key))
+
+    lock_key = f'lock:{key}'
+    token = uuid.uuid4().hex
+    acquired = cache.add(lock_key, token, CACHE_REBUILD_LOCK_TIMEOUT)
+    if acquired is None: # cache unavailable: nothing to coordinate through
+        return compute()
+    if acquired:
+        try:
+            return _rebuild(key, compute, timeout, stale_key)
+        finally:
+            if cache.get(lock_key) == token:
+                cache.delete(lock_key)
+
+    if stale is not None:
+        logger.info(f"Serving stale entry while {key} is rebuilt")
+        return stale['value']
+    deadline = time.monotonic() + CACHE_REBUILD_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(0.05)
+        entry = _entry(cache.get(key))
+        if entry is not None:
+            return entry['value']
+    logger.warning(f"Rebuild of {key} by another worker timed out; rebuilding here")
+    return _rebuild(key, compute, timeout, stale_key)
+
+async def acached(key, compute, timeout, stale_key=None):
+    """cached() for async views: `compute` is a coroutine function, and waiting for a rebuild yields to the event loop."""
+    entries = await cache.aget_many([key, stale_key] if stale_key else [key])
+    entry = _entry(entries.get(key))
+    if entry is not None and not _should_refresh(entry):
+        return entry['value']
+    stale = entry or _entry(entries.get(stale_key))
+
+    lock_key = f'lock:{key}'
+    token = uuid.uuid4().hex
+    acquired = await cache.aadd(lock_key, token, CACHE_REBUILD_LOCK_TIMEOUT)
+    if acquired is None:
+        return await compute()
+    if acquired:
+        try:
+            return await _arebuild(key, compute, timeout, stale_key)
+        finally:
+            if await cache.aget(lock_key) == token:
+                await cache.adelete(lock_key)
+
+    if stale is not None:
+        logger.info(f"Serving stale entry while {key} is rebuilt")
+        return stale['value']
+    deadline = time.monotonic() + CACHE_REBUILD_WAIT
+    while time.monotonic() < deadline:
+        await asyncio.sleep(0.05)
+        entry = _entry(await cache.aget(key))
+        if entry is not None:
+            return entry['value']
+    logger.warning(f"Rebuild of {key} by another worker timed out; rebuilding here")
+    return await _arebuild(key, compute, timeout, stale_key)
+
+def invalidate_feed(user_id):
+    bump_generation(FEED_NAMESPACE, user_id)
+    logger.info(f"Invalidated feed cache for user: {user_id}")
+
+def invalidate_feeds(user_ids):
+    count = 0
+    for user_id in user_ids:
+        bump_generation(FEED_NAMESPACE, user_id)
+        count += 1
+    logger.info(f"Invalidated feed cache for {count} users")
+
+def invalidate_post_comments(post_id):
+    bump_generation(COMMENTS_NAMESPACE, post_id)
+    logger.info(f"Invalidated comments cache for post: {post_id}")
+
+def invalidate_post(post_id):
+    bump_generation(POST_NAMESPACE, post_id)
+
+def invalidate_follows(user_id):
+    bump_generation(FOLLOWS_NAMESPACE, user_id)
+
+def invalidate_author(author_id):
+    bump_generation(AUTHOR_NAMESPACE, author_id)
+    logger.info(f"Invalidated feed caches depending on author: {author_id}")
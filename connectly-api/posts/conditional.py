@@ -0,0 +1,87 @@
+"""
+HTTP conditional GETs (ETag / Last-Modified) for the feed, post detail and comment pages.
+
+Validators are derived from the cache generations (posts/caching.py) rather than by hashing response bodies. A post's
+ETag is a digest of its version stamps: the post's own generation, its comments generation and the viewer's follows
+generation (so an edit, a deletion, a privacy change or an unfollow all change the tag). A cached page's ETag names
+the entry that produced the body: its cache key, which embeds the generations and the page position, and the time it
+was built. Generations do not cover everything a page shows (strangers' public posts, like counts), so a poll on a
+cached page gets a 304 only while that entry is still cached and fresh; once it expires, the rebuilt page has a new
+tag. Either way the 304 is answered after a few cache reads, before any query or serialization.
+
+Cached pages also carry the time they were built, sent as Last-Modified for If-Modified-Since clients. A stale copy
+served while its page is rebuilt gets no validators, so a client never pins an outdated body to a current tag.
+ETags are weak: one version may be rendered as JSON or by the browsable API.
+"""
+import hashlib
+import time
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from . import caching
+
+
+def etag(*stamps):
+    digest = hashlib.blake2b('|'.join(str(stamp) for stamp in stamps).encode(), digest_size=12).hexdigest()
+    return f'W/"{digest}"'
+
+def _post_namespaces(post_id, user):
+    namespaces = [(caching.POST_NAMESPACE, post_id), (caching.COMMENTS_NAMESPACE, post_id)]
+    if user.is_authenticated:
+        namespaces.append((caching.FOLLOWS_NAMESPACE, user.id))
+    return namespaces
+
+def post_stamps(post_id, user):
+    """Version stamps of a post as seen by `user` (one cache round trip): its content, its comments, the viewer's follows."""
+    return [f'post:{post_id}', *caching.get_generations(_post_namespaces(post_id, user))]
+
+async def apost_stamps(post_id, user):
+    return [f'post:{post_id}', *await caching.aget_generations(_post_namespaces(post_id, user))]
+
+def versioned(entry, version):
+    """Marks a rendered() entry with the cache key it was built for and when, for respond()."""
+    return {**entry, 'version': version, 'built': time.time()}
+
+def not_modified(request, *stamps):
+    """A 304 if the request's If-None-Match names the current stamps, else None."""
+    if 'HTTP_IF_NONE_MATCH' not in request.META:
+        return None
+    tag = etag(*stamps)
+    response = get_conditional_response(request, etag=tag)
+    if response is None or response.status_code != 304:
+        return None
+    response['ETag'] = tag
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+def page_not_modified(request, key, *stamps):
+    """not_modified() for the page cached under `key`: None unless that entry is still fresh."""
+    if 'HTTP_IF_NONE_MATCH' not in request.META:
+        return None
+    entry = caching.peek(key)
+    if entry is None:
+        return None
+    return not_modified(request, key, *stamps, entry['built'])
+
+async def apage_not_modified(request, key, *stamps):
+    if 'HTTP_IF_NONE_MATCH' not in request.META:
+        return None
+    entry = await caching.apeek(key)
+    if entry is None:
+        return None
+    return not_modified(request, key, *stamps, entry['built'])
+
+def respond(request, response, *stamps, entry=None):
+    """
+    Adds the validators to a response built from `stamps` (for a cached page, the entry it serves, whose build time
+    is part of the tag), and turns it into a 304 when the client's copy is current.
+    """
+    patch_cache_control(response, private=True, no_cache=True) # clients may keep the body, but revalidate it
+    if entry is not None and entry.get('version') != stamps[0]:
+        return response # a stale copy of an older version
+    last_modified = None
+    if entry is not None:
+        stamps = (*stamps, entry['built'])
+        last_modified = int(entry['built'])
+        response['Last-Modified'] = http_date(last_modified)
+    response['ETag'] = etag(*stamps)
+    return get_conditional_response(request, etag=response['ETag'], last_modified=last_modified, response=response)
@@ -0,0 +1,73 @@
+"""
+Denormalized counters: like/comment counts on Post and follower counts on User.
+
+The write paths adjust the counters with atomic F() updates, so reading them is a plain column access
+instead of a COUNT(*) per row. `reconcile` recomputes them from the Like, Comment and Follow tables to fix
+any drift (e.g. rows removed by a cascading user delete).
+"""
+from django.db.models import Count, F, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.contrib.auth import get_user_model
+from .models import Post, Like, Comment, Follow
+
+User = get_user_model()
+
+RECONCILE_BATCH_SIZE = 1000
+
+
+def _adjust(model, pks, field, delta):
+    if not isinstance(pks, (list, tuple, set)):
+        pks = [pks]
+    # Greatest() keeps the counter from going negative if it has already drifted
+    model.objects.filter(pk__in=pks).update(**{field: Greatest(F(field) + delta, Value(0))})
+
+def add_likes(post_ids, delta=1):
+    _adjust(Post, post_ids, 'like_count', delta)
+
+def recount_likes(post_ids):
+    """Sets like_count of the given posts from the Like table in one UPDATE (after bulk like writes)."""
+    Post.objects.filter(pk__in=post_ids).update(like_count=_count_subquery(Like))
+
+def add_comments(post_ids, delta=1):
+    _adjust(Post, post_ids, 'comment_count', delta)
+
+def add_followers(user_ids, delta=1):
+    _adjust(User, user_ids, 'follower_count', delta)
+
+def _count_subquery(model, field='post'):
+    return Coalesce(Subquery(
+        model.objects.filter(**{field: OuterRef('pk')}).order_by().values(field).annotate(c=Count('*')).values('c')
+    ), 0)
+
+def _reconcile(model, counters, batch_size):
+    """counters maps a counter column to the subquery computing its true value."""
+    fixed = 0
+    last_id = 0
+    while True:
+        batch = list(model.objects.filter(pk__gt=last_id).order_by('pk').values_list('pk', flat=True)[:batch_size])
+        if not batch:
+            return fixed
+        last_id = batch[-1]
+        drift = Q()
+        for field in counters:
+            drift |= ~Q(**{field: F(f'actual_{field}')})
+        drifted = list(
+            model.objects.filter(pk__in=batch)
+            .annotate(**{f'actual_{field}': value for field, value in counters.items()})
+            .filter(drift)
+            .values_list('pk', flat=True)
+        )
+        if drifted:
+            model.objects.filter(pk__in=drifted).update(**counters)
+            fixed += len(drifted)
+
+def reconcile(batch_size=RECONCILE_BATCH_SIZE):
+    """Recomputes the counters of every post and user whose stored values drifted. Returns (posts, users) fixed."""
+    posts = _reconcile(Post, {
+        'like_count': _count_subquery(Like),
+        'comment_count': _count_subquery(Comment),
+    }, batch_size)
+    users = _reconcile(User, {
+        'follower_count': _count_subquery(Follow, field='following'),
+    }, batch_size)
+    return posts, users
@@ -0,0 +1,94 @@
+"""
+Primary/replica database routing.
+
+Read queries made while serving a safe (GET/HEAD/OPTIONS) request go to one of the DATABASE_REPLICAS aliases;
+everything else uses the primary ('default'):
+- writes, and any read after a write in the same request,
+- reads inside a transaction,
+- every query of a request from a client that wrote within the last REPLICA_STICKY_SECONDS (read-your-writes while
+  the replicas catch up), and of non-safe requests,
+- queries outside an HTTP request (management commands, the job worker).
+
+Cache rebuilds (posts/caching.py) follow the request they run in: the writer's own pages are rebuilt from the
+primary while the writer is pinned, everyone else's from a replica.
+
+ReplicaRoutingMiddleware (posts/middleware.py) opens the per-request routing state. A write pins its client twice:
+with a REPLICA_STICKY_COOKIE cookie, checked before anything else, and with a "recently wrote" marker in the cache
+for clients that do not keep cookies, looked up by user. The user is identified the way the configured DRF
+authenticators would (from a JWT's claims without a database lookup).
+"""
+import random
+from contextvars import ContextVar
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+
+REPLICA_STICKY_SECONDS = getattr(settings, 'REPLICA_STICKY_SECONDS', 10)
+REPLICA_STICKY_COOKIE = getattr(settings, 'REPLICA_STICKY_COOKIE', 'db_primary_pin')
+
+_routing = ContextVar('db_routing', default=None)
+
+
+class RoutingState:
+    def __init__(self, use_primary):
+        self.use_primary = use_primary
+        self.replica = None
+
+
+def replicas():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+def _sticky_key(user_id):
+    return f'db_primary_pin:{user_id}'
+
+def is_pinned_to_primary(user_id):
+    return user_id is not None and bool(cache.get(_sticky_key(user_id)))
+
+async def ais_pinned_to_primary(user_id):
+    return user_id is not None and bool(await cache.aget(_sticky_key(user_id)))
+
+def pin_to_primary(user_id):
+    """Sends the user's reads to the primary for REPLICA_STICKY_SECONDS, until the replicas have the write."""
+    if user_id is not None:
+        cache.set(_sticky_key(user_id), 1, REPLICA_STICKY_SECONDS)
+
+async def apin_to_primary(user_id):
+    if user_id is not None:
+        await cache.aset(_sticky_key(user_id), 1, REPLICA_STICKY_SECONDS)
+
+def pin_response(response):
+    """Pins the client that gets `response` to the primary for REPLICA_STICKY_SECONDS, by cookie."""
+    response.set_cookie(REPLICA_STICKY_COOKIE, '1', max_age=REPLICA_STICKY_SECONDS, httponly=True, samesite='Lax')
+
+def is_pinned_request(request):
+    return REPLICA_STICKY_COOKIE in request.COOKIES
+
+def start_request(use_primary):
+    """Opens the routing state of a request; returns the token to pass to end_request()."""
+    return _routing.set(RoutingState(use_primary))
+
+def end_request(token):
+    _routing.reset(token)
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _routing.get()
+        pool = replicas()
+        if state is None or state.use_primary or not pool or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        if state.replica is None:
+            state.replica = random.choice(pool) # one replica per request, so its reads are mutually consistent
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        state = _routing.get()
+        if state is not None:
+            state.use_primary = True # read back our own write
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        pool = {DEFAULT_DB_ALIAS, *replicas()}
+        if obj1._state.db in pool and obj2._state.db in pool:
+            return True
+        return None
@@ -0,0 +1,14 @@
+from django.conf import settings
+from django.contrib.auth.hashers import Argon2PasswordHasher
+
+
+class TunableArgon2PasswordHasher(Argon2PasswordHasher):
+    """
+    Argon2 with its cost parameters taken from settings (ARGON2_TIME_COST, ARGON2_MEMORY_COST in KiB,
+    ARGON2_PARALLELISM), defaulting to Django's. It keeps the "argon2" algorithm name, so existing hashes verify
+    as before; after a parameter change, must_update() makes check_password() rehash each user's password with the
+    new parameters on their next successful login.
+    """
+    time_cost = getattr(settings, 'ARGON2_TIME_COST', Argon2PasswordHasher.time_cost)
+    memory_cost = getattr(settings, 'ARGON2_MEMORY_COST', Argon2PasswordHasher.memory_cost)
+    parallelism = getattr(settings, 'ARGON2_PARALLELISM', Argon2PasswordHasher.parallelism)
@@ -0,0 +1,131 @@
+"""
+Database-backed background job queue.
+
+Write endpoints enqueue fan-out and cache invalidation jobs instead of running them inside the request,
+so their latency no longer grows with the author's follower count. Callers enqueue inside the transaction
+of the write (transaction.atomic()), so a job exists exactly when its write committed; `manage.py run_jobs`
+processes them.
+
+Pending jobs are unique per (kind, key): enqueueing the same job again before a worker claims it is a no-op,
+and the worker hands every claimed job of a kind to its handler as one batch, so duplicate work for the same
+author or post is coalesced.
+"""
+import logging
+from collections import defaultdict
+from datetime import timedelta
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from .models import Job, Post
+from . import timelines
+
+logger = logging.getLogger(__name__)
+
+JOBS_EAGER = getattr(settings, 'JOBS_EAGER', False) # run handlers right after commit instead of queueing (dev only)
+JOBS_BATCH_SIZE = getattr(settings, 'JOBS_BATCH_SIZE', 500)
+JOBS_MAX_ATTEMPTS = getattr(settings, 'JOBS_MAX_ATTEMPTS', 5)
+JOBS_CLAIM_TIMEOUT = timedelta(seconds=getattr(settings, 'JOBS_CLAIM_TIMEOUT', 300)) # claims older than this are retried
+
+FANOUT_POST = 'fanout_post'
+INVALIDATE_FOLLOWERS = 'invalidate_followers'
+FORGET_LIKE_SETS = 'forget_like_sets'
+
+HANDLERS = {}
+
+
+def handler(kind):
+    """Registers the function processing a batch of job keys of the given kind."""
+    def register(func):
+        HANDLERS[kind] = func
+        return func
+    return register
+
+def enqueue(kind, *keys):
+    """Queues one job per key; keys that already have a pending job of this kind are coalesced."""
+    if kind not in HANDLERS:
+        raise ValueError(f"Unknown job kind: {kind}")
+    keys = sorted({str(key) for key in keys})
+    if not keys:
+        return
+    if JOBS_EAGER:
+        transaction.on_commit(lambda: HANDLERS[kind](keys))
+        return
+    Job.objects.bulk_create([Job(kind=kind, key=key) for key in keys], ignore_conflicts=True)
+
+def _claim(batch_size):
+    now = timezone.now()
+    with transaction.atomic():
+        pending = Job.objects.filter(claimed_at__isnull=True, run_after__lte=now).order_by('id')
+        if connection.features.has_select_for_update_skip_locked:
+            pending = pending.select_for_update(skip_locked=True) # lets several workers run side by side
+        jobs = list(pending[:batch_size])
+        Job.objects.filter(id__in=[job.id for job in jobs]).update(claimed_at=now)
+    return jobs
+
+def _release_stale_claims():
+    """Re-queues jobs whose worker died while processing them."""
+    stale = list(Job.objects.filter(claimed_at__lt=timezone.now() - JOBS_CLAIM_TIMEOUT))
+    if stale:
+        Job.objects.bulk_create([Job(kind=job.kind, key=job.key, attempts=job.attempts) for job in stale], ignore_conflicts=True)
+        Job.objects.filter(id__in=[job.id for job in stale]).delete()
+        logger.warning(f"Re-queued {len(stale)} stale jobs")
+
+def _retry(jobs, error):
+    retries = []
+    for job in jobs:
+        if job.attempts + 1 >= JOBS_MAX_ATTEMPTS:
+            logger.error(f"Dropping job {job} after {job.attempts + 1} attempts: {error}")
+            continue
+        retries.append(Job(
+            kind=job.kind,
+            key=job.key,
+            attempts=job.attempts + 1,
+            run_after=timezone.now() + timedelta(seconds=2 ** job.attempts), # exponential backoff
+            last_error=str(error),
+        ))
+    Job.objects.bulk_create(retries, ignore_conflicts=True)
+
+def run_pending(batch_size=JOBS_BATCH_SIZE):
+    """Claims and processes one batch of due jobs. Returns the number of jobs processed."""
+    _release_stale_claims()
+    jobs = _claim(batch_size)
+    by_kind = defaultdict(list)
+    for job in jobs:
+        by_kind[job.kind].append(job)
+
+    for kind, kind_jobs in by_kind.items():
+        keys = sorted({job.key for job in kind_jobs})
+        try:
+            HANDLERS[kind](keys)
+        except Exception as e:
+            logger.error(f"Job batch {kind} failed for {len(keys)} keys: {e}", exc_info=True)
+            _retry(kind_jobs, e)
+        else:
+            logger.info(f"Processed {len(kind_jobs)} {kind} jobs ({len(keys)} distinct keys)")
+        Job.objects.filter(id__in=[job.id for job in kind_jobs]).delete()
+    return len(jobs)
+
+def drain(batch_size=JOBS_BATCH_SIZE):
+    """Processes due jobs until none are left. Returns the number of jobs processed."""
+    processed = 0
+    while count := run_pending(batch_size):
+        processed += count
+    return processed
+
+
+@handler(FANOUT_POST)
+def _fan_out_posts(post_ids):
+    posts = list(Post.objects.filter(pk__in=post_ids).only('id', 'author_id', 'created_at'))
+    for post in posts:
+        timelines.fan_out_post(post)
+    # Only invalidate once the posts are on the timelines, so a follower cannot re-cache a feed without them
+    timelines.invalidate_follower_feeds({post.author_id for post in posts})
+
+@handler(INVALIDATE_FOLLOWERS)
+def _invalidate_followers(author_ids):
+    timelines.invalidate_follower_feeds([int(author_id) for author_id in author_ids])
+
+@handler(FORGET_LIKE_SETS)
+def _forget_like_sets(post_ids):
+    from . import likes # likes queues jobs itself
+    likes.forget([int(post_id) for post_id in post_ids]) # raises, and so is retried, while Redis is still down
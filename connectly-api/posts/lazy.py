@@ -0,0 +1,51 @@
+"""
+Views imported on their first request instead of when the URLconf loads.
+
+For rarely used endpoints whose modules are expensive to import (Google social login, the OpenAPI schema and its
+UIs): every worker would otherwise pay for them at boot. `manage.py profile_startup` shows what each app costs.
+"""
+import threading
+from django.utils.module_loading import import_string
+
+
+def lazy_view(dotted_path, **initkwargs):
+    """
+    URLconf view for the class-based DRF view at `dotted_path`, imported and set up with as_view(**initkwargs) on
+    the first request. Like every DRF view it is CSRF-exempt (DRF enforces CSRF itself for session-authenticated requests).
+    """
+    view = None
+    lock = threading.Lock()
+
+    def load():
+        nonlocal view
+        with lock:
+            if view is None:
+                view = import_string(dotted_path).as_view(**initkwargs)
+        return view
+
+    def lazy(request, *args, **kwargs):
+        return (view or load())(request, *args, **kwargs)
+
+    lazy.csrf_exempt = True
+    lazy.__name__ = lazy.__qualname__ = dotted_path.rsplit('.', 1)[-1]
+    lazy.load = load
+    return lazy
+
+def preload():
+    """
+    Imports the URLconf and every lazy view in it. For a master process that forks its workers (gunicorn --preload):
+    whatever it imports is shared with them copy-on-write, so deferring the import would only cost each worker.
+    """
+    from django.urls import URLPattern, get_resolver
+
+    def walk(patterns):
+        for pattern in patterns:
+            if isinstance(pattern, URLPattern):
+                if hasattr(pattern.callback, 'load'):
+                    pattern.callback.load()
+            else:
+                walk(pattern.url_patterns)
+
+    resolver = get_resolver()
+    walk(resolver.url_patterns)
+    resolver.reverse_dict # builds the reverse lookup tables now rather than on each worker's first reverse()
@@ -0,0 +1,254 @@
+"""
+Like engine: likes are recorded in Redis and written to the database in bulk.
+
+Each post's likers are kept as an exact Redis set (likes:{post}:users, loaded from the Like table on first use,
+with a "0" sentinel member so a post without likes is cached too). A like or unlike is one Lua script that checks the
+set is loaded, updates it and records the intent in the post's pending hash (likes:{post}:pending, user -> 1/0, last
+intent wins), so "already liked" and the like count come from Redis, and concurrent likes on a hot post never contend
+for database rows. A set that is not loaded (first use, or expired) is loaded by a second script, which only creates it
+if no flush committed since the likers were read, and the like is then retried.
+
+Unflushed intents only exist in Redis, so the engine uses its own instance (LIKES_REDIS_URL), configured to persist
+and never evict (redis/redis-likes.conf), not the LRU cache.
+
+`flush()` (run by `manage.py flush_likes`) moves the intents of the dirty posts to their flushing hashes, applies them
+with one bulk_create(ignore_conflicts=True) and one DELETE, recounts like_count for those posts, and queues one feed
+invalidation per author, however many likes came in between two flushes. The flushing hashes are deleted only after
+the transaction commits; a flush that fails leaves them to the next one.
+
+Without Redis (LIKES_REDIS_URL empty, the default, or Redis down) the same calls write straight to the database.
+During an outage those writes bypass the like sets, so the sets of the posts involved are dropped afterwards (by a
+background job if Redis is still unreachable) and reloaded from the table on next use.
+"""
+import logging
+import operator
+from collections import defaultdict
+from functools import reduce
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Q
+from redis import Redis
+from redis.exceptions import RedisError
+from .models import Like, Post
+from . import counters, jobs
+
+User = get_user_model()
+logger = logging.getLogger(__name__)
+
+LIKES_REDIS_URL = getattr(settings, 'LIKES_REDIS_URL', '')
+LIKES_REDIS_TIMEOUT = getattr(settings, 'LIKES_REDIS_TIMEOUT', 0.5) # seconds; past it a like falls back to the database
+LIKES_SET_TIMEOUT = getattr(settings, 'LIKES_SET_TIMEOUT', 86400) # idle like sets are dropped and reloaded on demand
+LIKES_FLUSH_BATCH_SIZE = getattr(settings, 'LIKES_FLUSH_BATCH_SIZE', 500) # posts per flush
+RECORD_ATTEMPTS = 3 # loads per like, should sets expire again while being loaded
+DIRTY_KEY = 'likes:dirty'
+FLUSHING_KEY = 'likes:flushing' # posts claimed by a flush that has not committed yet
+FLUSHES_KEY = 'likes:flushes' # bumped by every committed flush
+SENTINEL = 0 # user IDs start at 1
+
+UNAVAILABLE = (RedisError, NotImplementedError) # NotImplementedError: no LIKES_REDIS_URL
+
+# KEYS: the dirty set, then each post's users set and pending hash. ARGV: user ID, 1 (like) or 0 (unlike), set TTL,
+# then the post IDs. Returns 0 and the positions of the posts whose sets are not loaded (nothing is changed), or 1
+# and (changed, like count) per post.
+RECORD_SCRIPT = """
+local missing = {0}
+for i = 2, #KEYS, 2 do
+    if redis.call('EXISTS', KEYS[i]) == 0 then missing[#missing + 1] = i / 2 end
+end
+if #missing > 1 then return missing end
+local results = {1}
+for i = 2, #KEYS, 2 do
+    local changed
+    if ARGV[2] == '1' then changed = redis.call('SADD', KEYS[i], ARGV[1]) else changed = redis.call('SREM', KEYS[i], ARGV[1]) end
+    redis.call('HSET', KEYS[i + 1], ARGV[1], ARGV[2])
+    redis.call('EXPIRE', KEYS[i], ARGV[3])
+    redis.call('SADD', KEYS[1], ARGV[3 + i / 2])
+    results[#results + 1] = changed
+    results[#results + 1] = redis.call('SCARD', KEYS[i]) - 1
+end
+return results
+"""
+
+# KEYS: users set, pending hash, flushing hash, flush counter. ARGV: the flush counter when the likers were read,
+# set TTL, then the sentinel and the likers. Returns 0 if a flush committed since (the likers read are outdated).
+LOAD_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 1 then return 1 end
+if (redis.call('GET', KEYS[4]) or '0') ~= ARGV[1] then return 0 end
+for i = 3, #ARGV, 1000 do
+    redis.call('SADD', KEYS[1], unpack(ARGV, i, math.min(i + 999, #ARGV)))
+end
+for _, key in ipairs({KEYS[3], KEYS[2]}) do -- intents being flushed, then newer ones: both are newer than the table
+    local intents = redis.call('HGETALL', key)
+    for j = 1, #intents, 2 do
+        if intents[j + 1] == '1' then redis.call('SADD', KEYS[1], intents[j]) else redis.call('SREM', KEYS[1], intents[j]) end
+    end
+end
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+return 1
+"""
+
+_redis = None
+
+
+def _users_key(post_id):
+    return f'likes:{post_id}:users'
+
+def _pending_key(post_id):
+    return f'likes:{post_id}:pending'
+
+def _flushing_key(post_id):
+    return f'likes:{post_id}:flushing'
+
+def get_redis():
+    global _redis
+    if not LIKES_REDIS_URL:
+        raise NotImplementedError('LIKES_REDIS_URL is not set')
+    if _redis is None:
+        _redis = Redis.from_url(LIKES_REDIS_URL, socket_connect_timeout=LIKES_REDIS_TIMEOUT, socket_timeout=LIKES_REDIS_TIMEOUT)
+    return _redis
+
+def _load(redis, post_ids):
+    """Loads the like sets of posts that are not in Redis (one query for all of them)."""
+    flushes = redis.get(FLUSHES_KEY) or 0
+    likers = defaultdict(list)
+    for post_id, user_id in Like.objects.filter(post_id__in=post_ids).values_list('post_id', 'user_id').iterator():
+        likers[post_id].append(user_id)
+    load = redis.register_script(LOAD_SCRIPT)
+    pipe = redis.pipeline(transaction=False)
+    for post_id in post_ids:
+        keys = [_users_key(post_id), _pending_key(post_id), _flushing_key(post_id), FLUSHES_KEY]
+        load(keys=keys, args=[flushes, LIKES_SET_TIMEOUT, SENTINEL, *likers[post_id]], client=pipe)
+    pipe.execute()
+
+def _record(user_id, post_ids, liked):
+    """Applies like (liked=True) or unlike intents in Redis. Returns {post_id: (changed, like_count)}."""
+    redis = get_redis()
+    record = redis.register_script(RECORD_SCRIPT)
+    keys = [DIRTY_KEY, *(key for post_id in post_ids for key in (_users_key(post_id), _pending_key(post_id)))]
+    for _ in range(RECORD_ATTEMPTS):
+        status, *results = record(keys=keys, args=[user_id, int(liked), LIKES_SET_TIMEOUT, *post_ids])
+        if status:
+            return {post_id: (bool(results[i * 2]), results[i * 2 + 1]) for i, post_id in enumerate(post_ids)}
+        _load(redis, [post_ids[position - 1] for position in results])
+    raise RedisError(f'Like sets of posts {post_ids} could not be loaded')
+
+def forget(post_ids):
+    """
+    Drops the like sets of posts whose likes were written to the database directly. Counts as a flush, so a set
+    being loaded from a read of the table that predates those writes is not created either.
+    """
+    pipe = get_redis().pipeline(transaction=True)
+    pipe.delete(*(_users_key(post_id) for post_id in post_ids))
+    pipe.incr(FLUSHES_KEY)
+    pipe.execute()
+
+def _forget_after_outage(post_ids):
+    try:
+        forget(post_ids)
+    except UNAVAILABLE as e:
+        logger.warning(f"Like sets of posts {post_ids} could not be dropped, queueing it: {e}")
+        jobs.enqueue(jobs.FORGET_LIKE_SETS, *post_ids)
+
+def record_likes(user_id, authors):
+    """
+    Likes posts for a user; `authors` maps the post IDs to their author IDs.
+    Returns {post_id: like_count} for the posts the user had not liked yet.
+    """
+    if not authors:
+        return {}
+    try:
+        results = _record(user_id, list(authors), liked=True)
+        return {post_id: count for post_id, (changed, count) in results.items() if changed}
+    except UNAVAILABLE as e:
+        logger.debug(f"Like engine unavailable, writing likes to the database: {e}")
+        outage = isinstance(e, RedisError)
+    already_liked = set(Like.objects.filter(user_id=user_id, post_id__in=authors).values_list('post_id', flat=True))
+    liked = [post_id for post_id in authors if post_id not in already_liked]
+    if liked:
+        with transaction.atomic():
+            Like.objects.bulk_create([Like(user_id=user_id, post_id=post_id) for post_id in liked], ignore_conflicts=True)
+            counters.add_likes(liked)
+            jobs.enqueue(jobs.INVALIDATE_FOLLOWERS, *{authors[post_id] for post_id in liked}) # one job per author
+        if outage:
+            _forget_after_outage(liked)
+    return dict.fromkeys(liked) # counts are not known without a further query
+
+def record_unlikes(user_id, post_ids):
+    """Unlikes posts for a user. Returns {post_id: like_count} for the posts the user had liked."""
+    if not post_ids:
+        return {}
+    try:
+        results = _record(user_id, list(post_ids), liked=False)
+        return {post_id: count for post_id, (changed, count) in results.items() if changed}
+    except UNAVAILABLE as e:
+        logger.debug(f"Like engine unavailable, writing unlikes to the database: {e}")
+        outage = isinstance(e, RedisError)
+    likes = Like.objects.filter(user_id=user_id, post_id__in=post_ids)
+    authors = dict(likes.values_list('post_id', 'post__author_id'))
+    if authors:
+        with transaction.atomic():
+            likes.filter(post_id__in=authors).delete()
+            counters.add_likes(list(authors), -1)
+            jobs.enqueue(jobs.INVALIDATE_FOLLOWERS, *set(authors.values()))
+        if outage:
+            _forget_after_outage(list(authors))
+    return dict.fromkeys(authors)
+
+def flush(batch_size=LIKES_FLUSH_BATCH_SIZE):
+    """
+    Writes the pending like intents of up to batch_size posts to the database. Returns the number of posts flushed.
+    Run one flusher at a time: posts still claimed by a flush that failed are retried first.
+    """
+    redis = get_redis()
+    leftover = [int(post_id) for post_id in redis.smembers(FLUSHING_KEY)][:batch_size]
+    dirty = []
+    if len(leftover) < batch_size:
+        dirty = [int(post_id) for post_id in redis.srandmember(DIRTY_KEY, batch_size - len(leftover))]
+    fresh = [post_id for post_id in dirty if post_id not in leftover]
+    post_ids = leftover + fresh
+    if not post_ids:
+        return 0
+    pipe = redis.pipeline(transaction=True)
+    for post_id in fresh:
+        pipe.smove(DIRTY_KEY, FLUSHING_KEY, post_id)
+        pipe.rename(_pending_key(post_id), _flushing_key(post_id))
+    for post_id in post_ids:
+        pipe.hgetall(_flushing_key(post_id))
+    intents = pipe.execute()[-len(post_ids):]
+    claimed = {
+        post_id: {int(user_id): bool(int(liked)) for user_id, liked in pending.items()}
+        for post_id, pending in zip(post_ids, intents)
+    }
+    with transaction.atomic():
+        _apply(claimed)
+    # Committed: the intents can go, and sets being loaded from the table read before this flush must be reread
+    pipe = redis.pipeline(transaction=True)
+    pipe.delete(*(_flushing_key(post_id) for post_id in post_ids))
+    pipe.srem(FLUSHING_KEY, *post_ids)
+    pipe.incr(FLUSHES_KEY)
+    pipe.execute()
+    if len(fresh) < len(dirty): # newer intents of retried posts, claimable now that the older ones are written
+        return len(post_ids) + flush(len(dirty) - len(fresh))
+    return len(post_ids)
+
+def _apply(claimed):
+    authors = dict(Post.objects.filter(pk__in=claimed).values_list('pk', 'author_id')) # skips deleted posts
+    liker_ids = {user_id for intents in claimed.values() for user_id, liked in intents.items() if liked}
+    live_users = set(User.objects.filter(pk__in=liker_ids).values_list('pk', flat=True)) if liker_ids else set()
+    Like.objects.bulk_create(
+        [
+            Like(user_id=user_id, post_id=post_id)
+            for post_id, intents in claimed.items() if post_id in authors
+            for user_id, liked in intents.items() if liked and user_id in live_users
+        ],
+        ignore_conflicts=True,
+    )
+    unliked = [
+        Q(post_id=post_id, user_id__in=[user_id for user_id, liked in intents.items() if not liked])
+        for post_id, intents in claimed.items() if not all(intents.values())
+    ]
+    if unliked:
+        Like.objects.filter(reduce(operator.or_, unliked)).delete()
+    counters.recount_likes(list(authors))
+    jobs.enqueue(jobs.INVALIDATE_FOLLOWERS, *set(authors.values()))
@@ -0,0 +1,88 @@
+import math
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import get_hasher, make_password
+from django.db import connections
+from ...serializers import LoginSerializer
+
+User = get_user_model()
+
+PREFIX = 'loginbench'
+
+
+class Command(BaseCommand):
+    help = 'Measures login throughput (identifier lookup, Argon2 verification, token issuing) to size workers for login storms'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=20, help='Temporary users to log in as (deleted afterwards).')
+        parser.add_argument('--logins', type=int, default=200)
+        parser.add_argument('--concurrency', type=int, default=4, help='Logins run in parallel, like requests on separate workers.')
+        parser.add_argument('--identifier', choices=['email', 'username'], default='email')
+        parser.add_argument('--password', default='passworD1#')
+        parser.add_argument('--target-rate', type=float, default=0, help='Logins per second to size the workers for.')
+
+    def handle(self, *args, **options):
+        if options['users'] < 1 or options['logins'] < 1 or options['concurrency'] < 1:
+            raise CommandError('--users, --logins and --concurrency must be positive.')
+        if User.objects.filter(username__startswith=f'{PREFIX}_').exists():
+            raise CommandError(f"Users with prefix '{PREFIX}_' already exist; an earlier run was interrupted, delete them first.")
+
+        password = options['password']
+        hashed = make_password(password) # with the current hasher parameters, as a fresh signup would be
+        users = User.objects.bulk_create(
+            User(username=f'{PREFIX}_{i}', email=f'{PREFIX}_{i}@example.com', password=hashed) for i in range(options['users'])
+        )
+        identifiers = [getattr(user, options['identifier']) for user in users]
+        concurrency = options['concurrency']
+        shares = [range(worker, options['logins'], concurrency) for worker in range(concurrency)]
+        try:
+            started = time.perf_counter()
+            if concurrency == 1:
+                latencies = self.run_logins(identifiers, password, shares[0])
+            else:
+                with ThreadPoolExecutor(concurrency) as pool:
+                    results = pool.map(lambda share: self.run_logins(identifiers, password, share, in_thread=True), shares)
+                    latencies = [latency for share in results for latency in share]
+            elapsed = time.perf_counter() - started
+        finally:
+            User.objects.filter(username__startswith=f'{PREFIX}_').delete()
+
+        latencies.sort()
+        mean = statistics.fmean(latencies)
+        per_worker = 1000 / mean # a sync worker serves one login at a time, as slow as its CPU share allows
+        hasher = get_hasher()
+        costs = ' '.join(f'{name}={getattr(hasher, name)}' for name in ('time_cost', 'memory_cost', 'parallelism', 'iterations', 'rounds') if hasattr(hasher, name))
+        self.stdout.write(f'Password hasher: {hasher.algorithm} {costs}')
+        self.stdout.write(
+            f"{len(latencies)} logins by {options['identifier']}, concurrency {concurrency}: "
+            f"{len(latencies) / elapsed:.1f} logins/s, latency p50 {self.percentile(latencies, 50):.0f} ms, "
+            f"p95 {self.percentile(latencies, 95):.0f} ms, p99 {self.percentile(latencies, 99):.0f} ms"
+        )
+        self.stdout.write(f'Per sync worker at this concurrency: {per_worker:.1f} logins/s (run with --concurrency = workers per host)')
+        if hasattr(hasher, 'memory_cost'):
+            self.stdout.write(f'{concurrency} concurrent logins hold ~{concurrency * hasher.memory_cost / 1024:.0f} MiB of Argon2 memory')
+        if options['target_rate']:
+            workers = math.ceil(options['target_rate'] / per_worker)
+            self.stdout.write(f"{options['target_rate']:g} logins/s needs at least {workers} workers (on as many free cores).")
+        self.stdout.write(self.style.SUCCESS('Login benchmark finished.'))
+
+    def run_logins(self, identifiers, password, share, in_thread=False):
+        """Runs the logins of one worker's share through LoginSerializer; returns their latencies in milliseconds."""
+        latencies = []
+        try:
+            for i in share:
+                start = time.perf_counter()
+                serializer = LoginSerializer(data={'identifier': identifiers[i % len(identifiers)], 'password': password})
+                if not serializer.is_valid():
+                    raise CommandError(f'Login failed: {serializer.errors}')
+                latencies.append((time.perf_counter() - start) * 1000)
+        finally:
+            if in_thread:
+                connections.close_all() # the thread's own connections
+        return latencies
+
+    def percentile(self, ordered, pct):
+        return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
@@ -0,0 +1,73 @@
+import logging
+import statistics
+import time
+from django.conf import settings
+from django.core.handlers.base import BaseHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.test import RequestFactory, override_settings
+
+
+class Command(BaseCommand):
+    help = 'Measures the per-request cost of the middleware stack on an API route, with the full stack and with the lean pipeline'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default='/posts/protected/', help='Route to request (GET).')
+        parser.add_argument('--requests', type=int, default=5000, help='Requests per configuration.')
+        parser.add_argument('--token', default='', help='JWT access token to send, for an authenticated request.')
+        parser.add_argument('--browser-cookies', action='store_true', help='Send session and CSRF cookies, as a browser logged in to the admin would.')
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1:
+            raise CommandError('--requests must be positive.')
+        prefixes = list(settings.LEAN_API_PREFIXES) or ['/posts/']
+        if not options['path'].startswith(tuple(prefixes)):
+            self.stdout.write(self.style.WARNING(f"{options['path']} is not under LEAN_API_PREFIXES {prefixes}; both stacks will match."))
+        headers = {'HTTP_HOST': next((host for host in settings.ALLOWED_HOSTS if host[0] not in '.*'), 'localhost')}
+        if options['token']:
+            headers['HTTP_AUTHORIZATION'] = f"Bearer {options['token']}"
+        if options['browser_cookies']:
+            headers['HTTP_COOKIE'] = f'{settings.SESSION_COOKIE_NAME}=benchmark; {settings.CSRF_COOKIE_NAME}=benchmark'
+
+        configurations = (
+            ('no middleware', {'MIDDLEWARE': []}),
+            ('full stack', {'LEAN_API_PREFIXES': []}),
+            ('lean pipeline', {'LEAN_API_PREFIXES': prefixes}),
+        )
+        request_logger = logging.getLogger('django.request')
+        level = request_logger.level
+        request_logger.setLevel(logging.ERROR) # 4xx responses would log a warning per request
+        try:
+            results = {label: self.run(overrides, options['path'], headers, options['requests']) for label, overrides in configurations}
+        finally:
+            request_logger.setLevel(level)
+
+        baseline = results['no middleware'][0]
+        self.stdout.write(f"GET {options['path']} -> {results['lean pipeline'][1]}, {options['requests']} requests per configuration")
+        self.stdout.write(f"{'configuration':<16}{'mean us':>10}{'p95 us':>10}{'middleware us':>15}")
+        for label, (latencies, _) in results.items():
+            self.stdout.write(
+                f"{label:<16}{statistics.fmean(latencies):>10.1f}{self.percentile(latencies, 95):>10.1f}"
+                f"{statistics.fmean(latencies) - statistics.fmean(baseline):>15.1f}"
+            )
+        saved = statistics.fmean(results['full stack'][0]) - statistics.fmean(results['lean pipeline'][0])
+        self.stdout.write(self.style.SUCCESS(f'The lean pipeline saves {saved:.1f} us per request on this route.'))
+
+    def run(self, overrides, path, headers, count):
+        """Serves `count` requests through a middleware chain built with the overridden settings; returns latencies (us) and the status."""
+        with override_settings(**overrides):
+            handler = BaseHandler()
+            handler.load_middleware()
+            factory = RequestFactory()
+            for _ in range(min(count, 100)): # warm-up: imports, URL resolver and JWT caches
+                response = handler.get_response(factory.get(path, **headers))
+            latencies = []
+            for _ in range(count):
+                request = factory.get(path, **headers)
+                start = time.perf_counter()
+                handler.get_response(request)
+                latencies.append((time.perf_counter() - start) * 1e6)
+        latencies.sort()
+        return latencies, response.status_code
+
+    def percentile(self, ordered, pct):
+        return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
@@ -0,0 +1,39 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from ...likes import flush, LIKES_FLUSH_BATCH_SIZE, UNAVAILABLE
+
+class Command(BaseCommand):
+    help = 'Writes the likes and unlikes buffered in Redis to the database in bulk'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Flush what is pending, then exit.')
+        parser.add_argument('--batch-size', type=int, default=LIKES_FLUSH_BATCH_SIZE, help='Posts flushed per batch.')
+        parser.add_argument('--interval', type=float, default=2.0, help='Seconds between flushes; bounds how stale like_count gets.')
+
+    def handle(self, *args, **options):
+        if options['once']:
+            try:
+                flushed = self.flush_all(options['batch_size'])
+            except UNAVAILABLE as e:
+                raise CommandError(f'Redis is not available: {e}')
+            self.stdout.write(self.style.SUCCESS(f'Flushed the likes of {flushed} posts.'))
+            return
+
+        self.stdout.write(self.style.SUCCESS('Like flusher started.'))
+        try:
+            while True:
+                try:
+                    self.flush_all(options['batch_size'])
+                except UNAVAILABLE as e:
+                    self.stderr.write(f'Redis is not available, retrying: {e}')
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.WARNING('Like flusher stopped.'))
+
+    def flush_all(self, batch_size):
+        flushed = 0
+        while True:
+            count = flush(batch_size)
+            flushed += count
+            if count < batch_size:
+                return flushed
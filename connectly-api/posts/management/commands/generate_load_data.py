@@ -0,0 +1,212 @@
+import io
+import random
+import time
+from array import array
+from datetime import timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import connection, transaction
+from django.utils import timezone
+from ...models import Post, Comment, Like, Follow
+
+User = get_user_model()
+
+WORDS = (
+    'coffee morning run code deploy weekend music travel photo garden book review launch team idea '
+    'design bug fix release city sunset dinner recipe game match study notes project demo update'
+).split()
+
+
+def csv_field(value):
+    # Unquoted empty is NULL in COPY's CSV format, so only None may be written empty
+    if value is None:
+        return ''
+    if isinstance(value, str):
+        return '"' + value.replace('"', '""') + '"'
+    return str(value)
+
+class Pairs:
+    """(actor, target) index pairs stored as two arrays instead of millions of tuples."""
+
+    def __init__(self, actors, targets):
+        self.actors = actors
+        self.targets = targets
+
+    def __len__(self):
+        return len(self.actors)
+
+    def __iter__(self):
+        return zip(self.actors, self.targets)
+
+class Command(BaseCommand):
+    help = 'Generates a large, deterministic benchmark dataset (power-law followers) with bulk inserts or Postgres COPY'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10000)
+        parser.add_argument('--posts', type=int, default=100000)
+        parser.add_argument('--comments', type=int, default=200000)
+        parser.add_argument('--likes', type=int, default=500000)
+        parser.add_argument('--follows', type=int, default=300000)
+        parser.add_argument('--seed', type=int, default=42, help='Same seed, same dataset.')
+        parser.add_argument('--skew', type=float, default=3.0, help='Power-law skew of follows, likes and comments (1 = uniform).')
+        parser.add_argument('--private-ratio', type=float, default=0.2, help='Share of private posts.')
+        parser.add_argument('--days', type=int, default=90, help='Spread created_at over this many past days.')
+        parser.add_argument('--prefix', default='load', help='Username/email prefix of the generated users.')
+        parser.add_argument('--password', default='passworD1#', help='Password of every generated user (hashed once).')
+        parser.add_argument('--batch-size', type=int, default=10000, help='Rows per INSERT/COPY batch.')
+        parser.add_argument('--no-copy', action='store_true', help='Use bulk_create even on Postgres.')
+
+    def handle(self, *args, **options):
+        if User.objects.filter(username__startswith=f"{options['prefix']}_").exists():
+            raise CommandError(f"Users with prefix '{options['prefix']}_' already exist; pick another --prefix or flush first.")
+
+        self.rng = random.Random(options['seed'])
+        self.skew = options['skew']
+        self.batch_size = options['batch_size']
+        self.use_copy = connection.vendor == 'postgresql' and not options['no_copy']
+        self.now = timezone.now()
+        self.window = options['days'] * 86400
+        started = time.monotonic()
+
+        n_users, n_posts = options['users'], options['posts']
+        if n_users < 2 or (n_posts < 1 and (options['comments'] or options['likes'])):
+            raise CommandError('Need at least 2 users, and at least 1 post for comments and likes.')
+
+        # Everything is drawn up front into compact arrays (indices, not rows), so the denormalized counters
+        # can be written with the rows and no reconcile pass is needed afterwards
+        follows, follower_counts = self.draw_pairs(options['follows'], n_users, n_users, distinct=True, no_self=True)
+        post_authors = array('I', (self.pick(n_users) for _ in range(n_posts)))
+        post_times = array('d', (self.rng.random() * self.window for _ in range(n_posts)))
+        comments, comment_counts = self.draw_pairs(options['comments'], n_users, n_posts, distinct=False)
+        likes, like_counts = self.draw_pairs(options['likes'], n_users, n_posts, distinct=True)
+
+        with transaction.atomic():
+            password = make_password(options['password'])
+            prefix = options['prefix']
+            user_ids = self.insert(User, (
+                User(
+                    username=f'{prefix}_{i}',
+                    email=f'{prefix}_{i}@example.com',
+                    password=password,
+                    role='user',
+                    follower_count=follower_counts[i],
+                    created_at=self.timestamp(0), # everyone joined at the start of the window
+                    date_joined=self.timestamp(0),
+                )
+                for i in range(n_users)
+            ), n_users)
+            self.insert(Follow, (
+                Follow(follower_id=user_ids[follower], following_id=user_ids[followee], created_at=self.timestamp(self.rng.random() * self.window))
+                for follower, followee in follows
+            ), len(follows))
+            post_ids = self.insert(Post, (
+                Post(
+                    author_id=user_ids[post_authors[i]],
+                    content=' '.join(self.rng.choices(WORDS, k=self.rng.randint(6, 30))),
+                    privacy='private' if self.rng.random() < options['private_ratio'] else 'public',
+                    like_count=like_counts[i],
+                    comment_count=comment_counts[i],
+                    created_at=self.timestamp(post_times[i]),
+                )
+                for i in range(n_posts)
+            ), n_posts)
+            self.insert(Comment, (
+                Comment(
+                    user_id=user_ids[user], post_id=post_ids[post],
+                    content=' '.join(self.rng.choices(WORDS, k=self.rng.randint(3, 15))),
+                    created_at=self.timestamp(self.after(post_times[post])),
+                )
+                for user, post in comments
+            ), len(comments))
+            self.insert(Like, (
+                Like(user_id=user_ids[user], post_id=post_ids[post], created_at=self.timestamp(self.after(post_times[post])))
+                for user, post in likes
+            ), len(likes))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Generated {n_users} users, {len(follows)} follows, {n_posts} posts, {len(comments)} comments and {len(likes)} likes "
+            f"in {time.monotonic() - started:.1f}s ({'COPY' if self.use_copy else 'bulk_create'})."
+        ))
+        self.stdout.write("Run 'manage.py rebuild_timelines' to build the home timelines of the new users.")
+
+    def pick(self, n):
+        """Index in [0, n) with a power-law bias towards low indices (skew 1 is uniform)."""
+        return min(int(n * self.rng.random() ** self.skew), n - 1)
+
+    def draw_pairs(self, count, n_actors, n_targets, distinct, no_self=False):
+        """
+        Draws (actor, target) index pairs: actors uniformly, targets by power law.
+        Returns the pairs and the number of pairs per target.
+        """
+        actors, targets = array('I'), array('I')
+        per_target = array('I', [0]) * n_targets
+        seen = set()
+        attempts = 0
+        while len(actors) < count and attempts < count * 5:
+            attempts += 1
+            actor, target = self.rng.randrange(n_actors), self.pick(n_targets)
+            if no_self and actor == target:
+                continue
+            if distinct:
+                key = actor * n_targets + target
+                if key in seen:
+                    continue
+                seen.add(key)
+            actors.append(actor)
+            targets.append(target)
+            per_target[target] += 1
+        if len(actors) < count:
+            self.stdout.write(self.style.WARNING(f'Only {len(actors)} of {count} distinct pairs could be drawn.'))
+        return Pairs(actors, targets), per_target
+
+    def after(self, offset):
+        """A random offset between `offset` and the end of the window."""
+        return offset + self.rng.random() * (self.window - offset)
+
+    def timestamp(self, offset):
+        """A datetime `offset` seconds into the generated time window, which ends now."""
+        return self.now - timedelta(seconds=self.window - offset)
+
+    def insert(self, model, objs, total):
+        """Inserts rows in batches (COPY on Postgres) and returns their new IDs in insertion order."""
+        last_id = model.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+        batch = []
+        inserted = 0
+        for obj in objs:
+            batch.append(obj)
+            if len(batch) >= self.batch_size:
+                inserted += self.write(model, batch)
+                batch = []
+                self.stdout.write(f'{model._meta.model_name}: {inserted}/{total}', ending='\r')
+        if batch:
+            inserted += self.write(model, batch)
+        self.stdout.write(f'{model._meta.model_name}: {inserted}/{total}')
+        if model in (User, Post):
+            # Nothing else writes during seeding, so the new rows are the ones past the previous maximum ID
+            return array('Q', model.objects.filter(pk__gt=last_id).order_by('pk').values_list('pk', flat=True).iterator())
+
+    def write(self, model, batch):
+        fields = [field for field in model._meta.concrete_fields if not field.primary_key]
+        if not self.use_copy:
+            # bulk_create stamps auto_now_add fields with now(); the generated timestamps are put back with one
+            # UPDATE per batch (bulk_update splits it where the database limits query parameters)
+            stamped = [field for field in fields if getattr(field, 'auto_now_add', False)]
+            stamps = [[getattr(obj, field.attname) for field in stamped] for obj in batch]
+            model.objects.bulk_create(batch)
+            if stamped:
+                for obj, values in zip(batch, stamps):
+                    for field, value in zip(stamped, values):
+                        setattr(obj, field.attname, value)
+                model.objects.bulk_update(batch, [field.name for field in stamped])
+            return len(batch)
+
+        buffer = io.StringIO()
+        for obj in batch:
+            buffer.write(','.join(csv_field(field.get_db_prep_save(getattr(obj, field.attname), connection)) for field in fields))
+            buffer.write('\n')
+        buffer.seek(0)
+        columns = ', '.join(connection.ops.quote_name(field.column) for field in fields)
+        with connection.cursor() as cursor:
+            cursor.copy_expert(f'COPY {connection.ops.quote_name(model._meta.db_table)} ({columns}) FROM STDIN WITH (FORMAT csv)', buffer)
+        return len(batch)
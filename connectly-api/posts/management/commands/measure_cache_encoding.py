@@ -0,0 +1,53 @@
+import pickle
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.contrib.auth import get_user_model
+from ...cache_backends import CompactSerializer, ThresholdCompressor
+from ...models import Post
+from ...serializers import FeedPostSerializer, CommentSerializer
+from ... import conditional, renderers, timelines
+
+User = get_user_model()
+
+class Command(BaseCommand):
+    help = 'Reports the size of cached feed and comment pages with pickle versus the compact cache encoding'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--samples', type=int, default=50, help='Number of feed pages and comment pages to sample.')
+        parser.add_argument('--page-size', type=int, default=10, help='Posts or comments per page.')
+
+    def handle(self, *args, **options):
+        samples = options['samples']
+        page_size = options['page_size']
+        cache_options = settings.CACHES['default'].get('OPTIONS', {})
+        serializer = CompactSerializer(cache_options)
+        compressor = ThresholdCompressor(cache_options)
+
+        feed_pages = []
+        for user in User.objects.order_by('-follower_count')[:samples]:
+            posts = timelines.load_posts(timelines.home_feed_ids(user, page_size))
+            feed_pages.append(self.envelope(FeedPostSerializer(posts, many=True).data))
+
+        comment_pages = []
+        for post in Post.objects.order_by('-comment_count')[:samples]:
+            comments = post.comments.order_by('created_at', 'id')[:page_size]
+            comment_pages.append(self.envelope(CommentSerializer(comments, many=True).data))
+
+        self.stdout.write(f"{'entries':<16}{'count':>6}{'pickle':>10}{'msgpack':>10}{'+compress':>11}{'saved':>8}")
+        for name, pages in (('feed_data', feed_pages), ('post_comments', comment_pages)):
+            if not pages:
+                self.stdout.write(f'{name:<16}{0:>6}')
+                continue
+            before = sum(len(pickle.dumps(page, pickle.HIGHEST_PROTOCOL)) for page in pages) / len(pages)
+            packed = [serializer.dumps(page) for page in pages]
+            compact = sum(len(value) for value in packed) / len(pages)
+            compressed = sum(len(compressor.compress(value)) for value in packed) / len(pages)
+            self.stdout.write(
+                f'{name:<16}{len(pages):>6}{before:>10.0f}{compact:>10.0f}{compressed:>11.0f}{1 - compressed / before:>8.0%}'
+            )
+        self.stdout.write(self.style.SUCCESS('Average bytes per entry, as stored in Redis (payload only, excluding key overhead).'))
+
+    def envelope(self, results):
+        # Same shape as the entries caching.cached() writes for a feed or comment page: the rendered response body
+        page = {'next': 'https://example.com/posts/feed/?cursor=MjAyNS0wMS0wMVQwMDowMDowMHwx', 'results': results}
+        return {'value': conditional.versioned(renderers.rendered(page), 'feed_data:1:1730000000000000:None:1:None'), 'expires': 0.0, 'delta': 0.0}
@@ -0,0 +1,78 @@
+import os
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# What a worker does before it can serve its first request: load the application (settings, apps, middleware) and
+# the URLconf with the views it imports. Prints the elapsed milliseconds.
+BOOT_SCRIPT = '''
+import time
+start = time.perf_counter()
+from django.core.{kind} import get_{kind}_application
+get_{kind}_application()
+from django.urls import get_resolver
+get_resolver().url_patterns
+print((time.perf_counter() - start) * 1000)
+'''
+
+
+class Command(BaseCommand):
+    help = 'Profiles worker startup in fresh interpreters: time to ready, and the import cost of each installed app and package'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5, help='Cold starts to time (the median is reported).')
+        parser.add_argument('--top', type=int, default=15, help='Rows per table.')
+        parser.add_argument('--asgi', action='store_true', help='Load the ASGI application instead of the WSGI one.')
+
+    def handle(self, *args, **options):
+        if options['runs'] < 1 or options['top'] < 1:
+            raise CommandError('--runs and --top must be positive.')
+        script = BOOT_SCRIPT.format(kind='asgi' if options['asgi'] else 'wsgi')
+
+        imports = self.parse_importtime(self.boot(script, '-X', 'importtime').stderr)
+        ready = sorted(float(self.boot(script).stdout.split()[-1]) for _ in range(options['runs']))
+
+        by_owner = defaultdict(lambda: [0, 0])
+        for name, self_us, _, _ in imports:
+            owner = self.owner(name)
+            by_owner[owner][0] += self_us
+            by_owner[owner][1] += 1
+        total = sum(self_us for _, self_us, _, _ in imports)
+        apps = {app.split('.')[0] for app in settings.INSTALLED_APPS} | {app for app in settings.INSTALLED_APPS}
+
+        self.stdout.write(f"Ready in {statistics.median(ready):.0f} ms (median of {len(ready)} cold starts, "
+                          f"{ready[0]:.0f}-{ready[-1]:.0f} ms); {len(imports)} modules, {total / 1000:.0f} ms importing")
+        self.stdout.write(f"\n{'app / package':<42}{'modules':>8}{'self ms':>9}{'share':>7}")
+        for owner, (self_us, count) in sorted(by_owner.items(), key=lambda item: -item[1][0])[:options['top']]:
+            label = f'{owner} (app)' if owner in apps else owner
+            self.stdout.write(f'{label:<42}{count:>8}{self_us / 1000:>9.1f}{self_us / total:>7.0%}')
+        self.stdout.write(f"\n{'imported by the startup code':<60}{'cumulative ms':>14}")
+        for name, _, cumulative_us, _ in sorted((row for row in imports if row[3] == 0), key=lambda row: -row[2])[:options['top']]:
+            self.stdout.write(f'{name:<60}{cumulative_us / 1000:>14.1f}')
+        self.stdout.write(self.style.SUCCESS('Startup profile finished.'))
+
+    def boot(self, script, *flags):
+        env = {**os.environ, 'PYTHONPATH': os.pathsep.join(filter(None, [str(settings.BASE_DIR), os.environ.get('PYTHONPATH')]))}
+        result = subprocess.run([sys.executable, *flags, '-c', script], capture_output=True, text=True, env=env, cwd=settings.BASE_DIR)
+        if result.returncode:
+            raise CommandError(f'Startup failed:\n{result.stderr[-2000:]}')
+        return result
+
+    def parse_importtime(self, stderr):
+        """(module, self us, cumulative us, nesting depth) for each line of `python -X importtime`."""
+        rows = []
+        for line in stderr.splitlines():
+            if not line.startswith('import time:') or 'self [us]' in line:
+                continue
+            self_us, cumulative_us, name = line[len('import time:'):].split('|')
+            depth = (len(name) - len(name.lstrip()) - 1) // 2
+            rows.append((name.strip(), int(self_us), int(cumulative_us), depth))
+        return rows
+
+    def owner(self, module):
+        """The installed app a module belongs to (longest matching app module), else its top-level package."""
+        matches = [app for app in settings.INSTALLED_APPS if module == app or module.startswith(f'{app}.')]
+        return max(matches, key=len) if matches else module.split('.')[0]
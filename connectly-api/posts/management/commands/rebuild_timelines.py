@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from django.contrib.auth import get_user_model
+from ...timelines import rebuild_timeline, trim_timeline
+
+User = get_user_model()
+
+class Command(BaseCommand):
+    help = 'Rebuilds (backfills) the materialized home timelines used by the feed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', dest='user_ids', help='Only rebuild the timeline of this user ID (repeatable).')
+        parser.add_argument('--trim-only', action='store_true', help='Only trim timelines down to TIMELINE_MAX_LENGTH.')
+
+    def handle(self, *args, **options):
+        user_ids = options['user_ids'] or User.objects.order_by('id').values_list('id', flat=True).iterator()
+
+        users = 0
+        entries = 0
+        for user_id in user_ids:
+            if options['trim_only']:
+                trim_timeline(user_id)
+            else:
+                entries += rebuild_timeline(user_id)
+            users += 1
+
+        if options['trim_only']:
+            self.stdout.write(self.style.SUCCESS(f'Trimmed {users} timelines.'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Rebuilt {users} timelines with {entries} entries.'))
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from ...counters import reconcile, RECONCILE_BATCH_SIZE
+
+class Command(BaseCommand):
+    help = 'Recomputes the denormalized post like/comment counts and user follower counts that drifted'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=RECONCILE_BATCH_SIZE, help='Posts checked per query.')
+
+    def handle(self, *args, **options):
+        posts, users = reconcile(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Reconciled counters of {posts} posts and {users} users.'))
@@ -0,0 +1,25 @@
+import time
+from django.core.management.base import BaseCommand
+from ...jobs import run_pending, drain, JOBS_BATCH_SIZE
+
+class Command(BaseCommand):
+    help = 'Runs the background job worker (timeline fan-out and feed cache invalidation)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Process the jobs that are due, then exit.')
+        parser.add_argument('--batch-size', type=int, default=JOBS_BATCH_SIZE, help='Jobs claimed per batch.')
+        parser.add_argument('--interval', type=float, default=1.0, help='Seconds to sleep when the queue is empty.')
+
+    def handle(self, *args, **options):
+        if options['once']:
+            processed = drain(options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f'Processed {processed} jobs.'))
+            return
+
+        self.stdout.write(self.style.SUCCESS('Job worker started.'))
+        try:
+            while True:
+                if not run_pending(options['batch_size']):
+                    time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.WARNING('Job worker stopped.'))
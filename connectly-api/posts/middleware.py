@@ -0,0 +1,362 @@
+"""
+Per-endpoint SQL query budgets.
+
+QueryBudgetMiddleware counts the queries each request runs (and the time spent in them) on every database
+connection, and logs a warning when a route goes over its budget in QUERY_BUDGETS. Budgets are keyed by URL
+name and HTTP method (("post-detail", "PATCH")); a pair without a budget gets DEFAULT_QUERY_BUDGET.
+posts/tests.py asserts the same budgets for every route in posts/urls.py, so a new N+1 fails the test suite.
+
+With QUERY_BUDGET_HEADERS on (the default when DEBUG), responses carry X-Query-Count / X-Query-Budget and a
+Server-Timing entry that browsers show in their network panel.
+
+ReplicaRoutingMiddleware opens the per-request state of posts.db_router, which sends the reads of safe requests
+to the read replicas unless the caller wrote recently.
+
+LeanPipelineMiddleware and LeanPipelineEnd bracket the browser/OAuth part of the stack (sessions, CSRF, auth,
+messages, allauth, social-auth, WhiteNoise). Requests under LEAN_API_PREFIXES, the stateless JWT API, jump from
+one to the other and skip everything in between; `manage.py benchmark_middleware` measures what that saves.
+
+Every middleware in settings.MIDDLEWARE is sync and async capable: under ASGI a single sync-only one would make
+Django run the rest of the chain, async views included, in a thread per request. The two third-party middlewares
+that are sync-only (WhiteNoise, social-auth's exception handler) are wrapped at the end of this module.
+"""
+import logging
+import threading
+import time
+from contextlib import ExitStack
+from importlib import import_module
+from asgiref.sync import async_to_sync, iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.auth import SESSION_KEY
+from django.core.exceptions import ImproperlyConfigured, MiddlewareNotUsed
+from django.db import connections
+from whitenoise.middleware import WhiteNoiseMiddleware
+from rest_framework.authentication import SessionAuthentication
+from rest_framework.exceptions import APIException
+from rest_framework.request import Request
+from rest_framework.settings import api_settings as drf_settings
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from . import db_router
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUERY_BUDGET = getattr(settings, 'DEFAULT_QUERY_BUDGET', 10)
+QUERY_BUDGET_HEADERS = getattr(settings, 'QUERY_BUDGET_HEADERS', settings.DEBUG)
+QUERY_BUDGETS = {
+    # Cache-miss counts; authenticated requests read the user from the JWT claims, not the database
+    ('login', 'POST'): 2,
+    ('protected', 'GET'): 0,
+    ('admin', 'GET'): 0,
+    ('cache-stats', 'GET'): 0,
+    ('feed', 'GET'): 5,
+    ('feed-async', 'GET'): 5,
+    ('user-list', 'GET'): 2,
+    ('user-list', 'POST'): 4,
+    ('user-detail', 'GET'): 1,
+    ('user-detail', 'PATCH'): 3,
+    ('user-detail', 'DELETE'): 14, # the cascade: one select or delete per table referencing the user
+    ('user-detail-async', 'GET'): 1,
+    ('post-list', 'GET'): 5,
+    ('post-list', 'POST'): 4,
+    ('post-detail', 'GET'): 4,
+    ('post-detail', 'PATCH'): 7,
+    ('post-detail', 'DELETE'): 9,
+    ('post-content', 'GET'): 2, # the owner of a private post: the post, then the admin check
+    ('post-comments', 'GET'): 4,
+    ('post-comments-async', 'GET'): 4,
+    ('post-like', 'POST'): 7,
+    ('post-unlike', 'POST'): 7,
+    ('post-comment', 'POST'): 6,
+    ('post-batch', 'GET'): 4,
+    ('post-batch-like', 'POST'): 7,
+    ('post-batch-unlike', 'POST'): 4,
+    ('follow-batch', 'POST'): 7, # 6 when the new followees have no posts to backfill
+    ('comment-list', 'GET'): 2,
+    ('comment-detail', 'GET'): 1,
+    ('comment-detail', 'PATCH'): 6,
+    ('comment-detail', 'DELETE'): 7,
+    ('follow-list', 'GET'): 2,
+    ('follow-list', 'POST'): 5,
+    ('follow-detail', 'GET'): 1,
+    ('follow-detail', 'DELETE'): 5,
+    **getattr(settings, 'QUERY_BUDGETS', {}),
+}
+
+
+def query_budget(route, method='GET'):
+    """The declared query budget of a route (URL name) and HTTP method, falling back to DEFAULT_QUERY_BUDGET."""
+    return QUERY_BUDGETS.get((route, method), DEFAULT_QUERY_BUDGET)
+
+
+class QueryCounter:
+    """Database execute wrapper counting queries and the time spent running them."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - start
+
+
+class QueryBudgetMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        counter = QueryCounter()
+        with self.count_queries(counter):
+            response = self.get_response(request)
+        return self.report(request, response, counter)
+
+    async def __acall__(self, request):
+        counter = QueryCounter()
+        # Connections are per thread: the ORM calls of an async view run on the request's sync_to_async thread,
+        # so the wrappers are installed (and removed) there
+        stack = await sync_to_async(self.count_queries)(counter)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+        return self.report(request, response, counter)
+
+    def count_queries(self, counter):
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(counter))
+        return stack
+
+    def report(self, request, response, counter):
+        match = request.resolver_match
+        route = match.url_name if match else None
+        budget = query_budget(route, request.method)
+        if counter.count > budget:
+            logger.warning(
+                f"Query budget exceeded on {route or request.path} ({request.method}): "
+                f"{counter.count} queries > {budget}, {counter.duration * 1000:.1f} ms in the database"
+            )
+        if QUERY_BUDGET_HEADERS:
+            response['X-Query-Count'] = counter.count
+            response['X-Query-Budget'] = budget
+            response['Server-Timing'] = f'db;dur={counter.duration * 1000:.1f};desc="{counter.count} queries"'
+        return response
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Routes reads of GET/HEAD/OPTIONS requests to a replica, except for clients pinned to the primary after a write.
+    A successful write pins its client for REPLICA_STICKY_SECONDS: by cookie, and by user in the cache. The pin has
+    to be known before the view runs, so without the cookie the user is resolved here with DRF's configured
+    authenticators: JWTs from their claims (no database lookup), sessions from the session store, the others
+    (TokenAuthentication) by authenticating.
+    """
+    SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.jwt = JWTAuthentication()
+        self.authenticators = [authenticator() for authenticator in drf_settings.DEFAULT_AUTHENTICATION_CLASSES]
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not db_router.replicas():
+            return self.get_response(request)
+        is_write = request.method not in self.SAFE_METHODS
+        if is_write or db_router.is_pinned_request(request):
+            user_id, use_primary = None, True
+        else:
+            user_id = self.request_user_id(request)
+            use_primary = db_router.is_pinned_to_primary(user_id)
+        token = db_router.start_request(use_primary=use_primary)
+        try:
+            response = self.get_response(request)
+        finally:
+            db_router.end_request(token)
+
+        if is_write and response.status_code < 400:
+            db_router.pin_response(response)
+            db_router.pin_to_primary(self.writer_id(request, user_id))
+        return response
+
+    async def __acall__(self, request):
+        if not db_router.replicas():
+            return await self.get_response(request)
+        is_write = request.method not in self.SAFE_METHODS
+        if is_write or db_router.is_pinned_request(request):
+            user_id, use_primary = None, True
+        else:
+            user_id = self.token_user_id(request)
+            if user_id is None and ('HTTP_AUTHORIZATION' in request.META or settings.SESSION_COOKIE_NAME in request.COOKIES):
+                user_id = await sync_to_async(self.request_user_id)(request) # other credentials may need a lookup
+            use_primary = await db_router.ais_pinned_to_primary(user_id)
+        token = db_router.start_request(use_primary=use_primary)
+        try:
+            response = await self.get_response(request)
+        finally:
+            db_router.end_request(token)
+
+        if is_write and response.status_code < 400:
+            db_router.pin_response(response)
+            await db_router.apin_to_primary(self.writer_id(request, user_id))
+        return response
+
+    def writer_id(self, request, user_id):
+        user = getattr(request, 'user', None) # set by DRF once the view authenticated the request
+        if user_id is None and user is not None and user.is_authenticated:
+            return str(user.pk)
+        return user_id
+
+    def request_user_id(self, request):
+        """The ID of the user DRF's authenticators will resolve for the request, or None."""
+        for authenticator in self.authenticators:
+            if isinstance(authenticator, JWTAuthentication):
+                user_id = self.token_user_id(request)
+            elif isinstance(authenticator, SessionAuthentication):
+                user_id = self.session_user_id(request)
+            else:
+                try:
+                    result = authenticator.authenticate(Request(request))
+                except APIException:
+                    result = None
+                user_id = str(result[0].pk) if result else None
+            if user_id is not None:
+                return user_id
+        return None
+
+    def session_user_id(self, request):
+        session_key = request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+        if not session_key:
+            return None
+        user_id = import_module(settings.SESSION_ENGINE).SessionStore(session_key).get(SESSION_KEY)
+        return None if user_id is None else str(user_id)
+
+    def token_user_id(self, request):
+        header = self.jwt.get_header(request)
+        raw_token = self.jwt.get_raw_token(header) if header else None
+        if raw_token is None:
+            return None
+        try:
+            return str(self.jwt.get_validated_token(raw_token)[jwt_settings.USER_ID_CLAIM])
+        except (InvalidToken, TokenError, KeyError):
+            return None
+
+
+_loading = threading.local() # the LeanPipelineEnd of the middleware chain being built on this thread
+
+
+class LeanPipelineEnd:
+    """Marks the end of the part of MIDDLEWARE that LeanPipelineMiddleware skips; passes every request on."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        _loading.pipeline_end = self # Django builds the chain inside out: the matching LeanPipelineMiddleware comes next
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+
+class LeanPipelineMiddleware:
+    """
+    Sends requests whose path starts with one of LEAN_API_PREFIXES straight to the middleware after LeanPipelineEnd,
+    skipping the ones in between. The process_view/process_exception hooks of the skipped middleware still run
+    (Django calls those from the handler), but they are no-ops for DRF views and the async API views.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        end, _loading.pipeline_end = getattr(_loading, 'pipeline_end', None), None
+        if end is None:
+            raise ImproperlyConfigured('posts.middleware.LeanPipelineEnd must follow LeanPipelineMiddleware in MIDDLEWARE.')
+        self.prefixes = tuple(getattr(settings, 'LEAN_API_PREFIXES', ()))
+        if not self.prefixes:
+            raise MiddlewareNotUsed('LEAN_API_PREFIXES is empty: every request goes through the full stack')
+        self.get_response = get_response
+        self.skip_to = end.get_response
+        # A sync-only middleware in between would have switched modes; adapt the shortcut the same way
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+            if not iscoroutinefunction(self.skip_to):
+                self.skip_to = sync_to_async(self.skip_to, thread_sensitive=True)
+        elif iscoroutinefunction(self.skip_to):
+            self.skip_to = async_to_sync(self.skip_to)
+
+    def __call__(self, request):
+        if request.path_info.startswith(self.prefixes):
+            return self.skip_to(request)
+        return self.get_response(request)
+
+
+class AsyncWhiteNoiseMiddleware(WhiteNoiseMiddleware):
+    """WhiteNoise, also runnable as async middleware: static files are served from a thread, other requests pass through."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, settings=settings):
+        super().__init__(get_response, settings=settings)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = await sync_to_async(self.find_file)(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return await sync_to_async(self.serve)(static_file, request)
+        return await self.get_response(request)
+
+
+class AsyncSocialAuthExceptionMiddleware:
+    """
+    social-auth's exception middleware (when SOCIAL_DJANGO_ENABLED), sync and async capable. It only acts on
+    social-auth's own exceptions, so social_django.middleware is imported on the first of them, and importing this
+    module does not load social_core when the integration is off.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.handler = None
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_exception(self, request, exception):
+        if not type(exception).__module__.startswith('social_core.'):
+            return None
+        if self.handler is None:
+            from social_django.middleware import SocialAuthExceptionMiddleware
+            self.handler = SocialAuthExceptionMiddleware(self.get_response)
+        return self.handler.process_exception(request, exception)
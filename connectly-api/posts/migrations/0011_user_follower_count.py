@@ -0,0 +1,28 @@
+# Generated by Django 5.1.4 on 2026-10-18 18:47
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_follower_count(apps, schema_editor):
+    User = apps.get_model('posts', 'User')
+    Follow = apps.get_model('posts', 'Follow')
+    followers = Follow.objects.filter(following=OuterRef('pk')).order_by().values('following').annotate(c=Count('*')).values('c')
+    User.objects.update(follower_count=Coalesce(Subquery(followers), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0010_post_like_count_comment_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='follower_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_follower_count, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.1.4 on 2026-10-18 18:50
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0011_user_follower_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=50)),
+                ('key', models.CharField(max_length=100)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('run_after', models.DateTimeField(default=django.utils.timezone.now)),
+                ('claimed_at', models.DateTimeField(blank=True, null=True)),
+                ('last_error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('claimed_at__isnull', True)), fields=['run_after'], name='posts_job_pending_idx')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('claimed_at__isnull', True)), fields=('kind', 'key'), name='posts_job_pending_unique')],
+            },
+        ),
+    ]
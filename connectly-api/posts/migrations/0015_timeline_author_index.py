@@ -0,0 +1,17 @@
+# Generated by Django 5.1.4 on 2026-10-18 20:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0014_claims_user'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='timelineentry',
+            index=models.Index(fields=['author', 'user'], name='posts_timeline_author_user'),
+        ),
+    ]
@@ -1,6 +1,7 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
 from django.conf import settings
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
 """
@@ -20,6 +21,7 @@ class User(AbstractUser):
     username = models.CharField(_('username'), max_length=150, unique=True)
     created_at = models.DateTimeField(verbose_name='date joined', auto_now_add=True)
     role = models.CharField(max_length=20, choices=(('guest', 'Guest'), ('user', 'User'), ('admin', 'Admin')), default='user') 
+    follower_count = models.PositiveIntegerField(default=0) # denormalized, decides push vs pull feed delivery (see posts/timelines.py)
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username']
@@ -27,13 +29,32 @@ class User(AbstractUser):
     def __str__(self):
         return self.username
 
+
+class ClaimsUser(User):
+    """
+    The request user of a JWT request, built from the token's signed claims without a query (see posts/authentication.py).
+    Fields outside the claims are deferred, and load from the short-lived cached user row on first access.
+    """
+    class Meta:
+        proxy = True
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        from .authentication import user_row
+        row = user_row(self.pk) if from_queryset is None else None
+        if row is None:
+            return super().refresh_from_db(using, fields, from_queryset)
+        for attname in fields or row:
+            setattr(self, attname, row[attname])
+
         
 class Post(models.Model):
     """Model representing a post created by a user."""
     content = models.TextField()
-    author = models.ForeignKey(settings.AUTH_USER_MODEL, related_name='posts', on_delete=models.CASCADE)
+    author = models.ForeignKey(settings.AUTH_USER_MODEL, related_name='posts', on_delete=models.CASCADE, db_index=False) # covered by posts_post_author_created
     created_at = models.DateTimeField(auto_now_add=True)
     privacy = models.CharField(max_length=20, choices=(('public', 'Public'), ('private', 'Private')), default='public') # Added privacy field
+    like_count = models.PositiveIntegerField(default=0) # denormalized, kept in sync with F() updates (see posts/counters.py)
+    comment_count = models.PositiveIntegerField(default=0) # denormalized, kept in sync with F() updates (see posts/counters.py)
 
     def __str__(self):
         return f"Post {self.id} by {self.author.username}"
@@ -41,17 +62,24 @@ class Post(models.Model):
     class Meta:
         ordering = ['-created_at']
         indexes = [
-            models.Index(fields=['author']),
-            models.Index(fields=['privacy']),
             models.Index(fields=['created_at']),
+            # An author's posts newest first (profile, pulled high-fanout authors, followed feed), keyset-ordered
+            models.Index(fields=['author', '-created_at', '-id'], name='posts_post_author_created'),
+            # The public stream merged into every home feed; privacy alone is too unselective to index
+            models.Index(fields=['-created_at', '-id'], condition=models.Q(privacy='public'), name='posts_post_public_created'),
         ]
 
 class Comment(models.Model):
     """Model representing a comment on a post."""
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="comments") 
-    post = models.ForeignKey('Post', on_delete=models.CASCADE, related_name="comments")
+    post = models.ForeignKey('Post', on_delete=models.CASCADE, related_name="comments", db_index=False) # covered by posts_comment_post_created
     content = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['post', 'created_at', 'id'], name='posts_comment_post_created'), # comment pages, oldest first
+        ]
     
     def __str__(self):
         return f"Comment by {self.user.username} on Post {self.post.id}"
@@ -70,11 +98,62 @@ class Like(models.Model):
 
 class Follow(models.Model):
     follower = models.ForeignKey(settings.AUTH_USER_MODEL, related_name='following', on_delete=models.CASCADE)
-    following = models.ForeignKey(settings.AUTH_USER_MODEL, related_name='followers', on_delete=models.CASCADE)
+    following = models.ForeignKey(settings.AUTH_USER_MODEL, related_name='followers', on_delete=models.CASCADE, db_index=False) # covered by posts_follow_following
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         unique_together = ('follower', 'following')
+        indexes = [
+            models.Index(fields=['following', 'follower'], name='posts_follow_following'), # an author's followers, index-only
+        ]
+
+    def __str__(self):
+        return f"{self.follower.username} follows {self.following.username}"
+
+class TimelineEntry(models.Model):
+    """
+    A materialized home timeline row: one entry per (viewer, post).
+    Rows are written on post creation (fan-out-on-write) for the author and every follower,
+    so the home feed reads a page of IDs instead of joining through followers.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, related_name='timeline_entries', on_delete=models.CASCADE)
+    post = models.ForeignKey(Post, related_name='timeline_entries', on_delete=models.CASCADE)
+    author = models.ForeignKey(settings.AUTH_USER_MODEL, related_name='+', on_delete=models.CASCADE, db_index=False)
+    created_at = models.DateTimeField() # copied from the post so the timeline sorts without a join
+
+    class Meta:
+        unique_together = ('user', 'post')
+        indexes = [
+            models.Index(fields=['user', '-created_at'], name='posts_timeline_user_created'),
+            # Unfollows delete one author's entries from a timeline; deleting a user cascades to all of theirs
+            models.Index(fields=['author', 'user'], name='posts_timeline_author_user'),
+        ]
+
+    def __str__(self):
+        return f"Post {self.post_id} on timeline of user {self.user_id}"
+
+
+class Job(models.Model):
+    """
+    A background job in the database-backed queue (see posts/jobs.py).
+    Pending jobs are unique per (kind, key), so enqueueing the same invalidation or fan-out twice
+    before a worker picks it up coalesces into a single row.
+    """
+    kind = models.CharField(max_length=50)
+    key = models.CharField(max_length=100) # e.g. the author or post ID the job is about
+    attempts = models.PositiveSmallIntegerField(default=0)
+    run_after = models.DateTimeField(default=timezone.now)
+    claimed_at = models.DateTimeField(null=True, blank=True) # set while a worker processes the job
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'key'], condition=models.Q(claimed_at__isnull=True), name='posts_job_pending_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['run_after'], condition=models.Q(claimed_at__isnull=True), name='posts_job_pending_idx'),
+        ]
 
     def __str__(self):
-        return f"{self.follower.username} follows {self.following.username}"
\ No newline at end of file
+        return f"{self.kind}:{self.key}"
@@ -0,0 +1,211 @@
+"""
+Pagination classes for the posts API.
+
+Besides the usual page-number mode, every paginated endpoint supports a keyset (cursor) mode keyed on
+(created_at, id). It is enabled by passing ``?cursor=`` (empty for the first page) and uses opaque cursors,
+so it never runs a COUNT(*) and never scans past an OFFSET: deep pages cost the same as the first one.
+"""
+import base64
+import heapq
+from datetime import datetime
+from itertools import islice
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+CURSOR_QUERY_PARAM = 'cursor'
+
+
+def encode_cursor(created_at, pk):
+    """Builds an opaque cursor pointing just past the row (created_at, pk)."""
+    raw = f'{created_at.isoformat()}|{pk}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    """Returns the (created_at, pk) position encoded in a cursor, or None for the first page."""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        created_at, pk = raw.split('|')
+        return datetime.fromisoformat(created_at), int(pk)
+    except (ValueError, UnicodeDecodeError):
+        raise NotFound('Invalid cursor.')
+
+def is_cursor_request(request):
+    return CURSOR_QUERY_PARAM in request.query_params
+
+def keyset_filter(queryset, position, descending=True, field='created_at', pk_field='id'):
+    """Restricts a queryset to the rows strictly after `position` in (field, pk_field) order."""
+    if position is None:
+        return queryset
+    created_at, pk = position
+    op = 'lt' if descending else 'gt'
+    return queryset.filter(Q(**{f'{field}__{op}': created_at}) | Q(**{field: created_at, f'{pk_field}__{op}': pk}))
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination ordered by (created_at, id).
+    Reads page_size + 1 rows after the cursor position to detect the next page; no COUNT(*) and no OFFSET.
+    """
+    page_size = 10
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = CURSOR_QUERY_PARAM
+    descending = True # newest first
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except ValueError:
+            return self.page_size
+        return min(page_size, self.max_page_size) if page_size > 0 else self.page_size
+
+    def get_position(self, request):
+        return decode_cursor(request.query_params.get(self.cursor_query_param))
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+        ordering = ('-created_at', '-id') if self.descending else ('created_at', 'id')
+        queryset = keyset_filter(queryset.order_by(*ordering), self.get_position(request), self.descending)
+        return self.paginate_rows(list(queryset[:page_size + 1]), page_size)
+
+    def paginate_rows(self, rows, page_size):
+        """Trims an over-fetched list of rows to one page and remembers where the next page starts."""
+        page = rows[:page_size]
+        self.next_position = (page[-1].created_at, page[-1].pk) if len(rows) > page_size else None
+        return page
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, encode_cursor(*self.next_position))
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+
+class CursorOrPageNumberPagination(PageNumberPagination):
+    """
+    Page-number pagination that switches to KeysetPagination when the request carries a `cursor` parameter.
+    Existing ?page= clients keep working unchanged.
+    """
+    keyset_class = KeysetPagination
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if is_cursor_request(request):
+            self.keyset = self.keyset_class()
+            self.keyset.page_size = self.get_page_size(request) or self.keyset.page_size
+            self.keyset.max_page_size = self.max_page_size or self.keyset.max_page_size
+            return self.keyset.paginate_queryset(queryset, request, view)
+        self.keyset = None
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+    def paginate_union(self, branches, request, load_rows, view=None):
+        """
+        Paginates the UNION ALL of disjoint Post querysets (see posts/visibility.py), newest first.
+        Only (created_at, id) pairs are read from the branches; load_rows(ids) loads the page's rows in order.
+        """
+        ordering = ('-created_at', '-id')
+        if is_cursor_request(request):
+            self.keyset = self.keyset_class()
+            self.keyset.request = request
+            page_size = self.get_page_size(request) or self.keyset.page_size
+            position = self.keyset.get_position(request)
+            # Each branch is read with its own LIMIT and the small results are merged here
+            pairs = heapq.merge(*[
+                list(keyset_filter(branch.order_by(*ordering), position).values_list('created_at', 'id')[:page_size + 1])
+                for branch in branches
+            ], reverse=True)
+            ids = [pk for _, pk in islice(pairs, page_size + 1)]
+            return self.keyset.paginate_rows(load_rows(ids), page_size)
+
+        self.keyset = None
+        pairs = [branch.order_by().values_list('created_at', 'id') for branch in branches]
+        union = pairs[0].union(*pairs[1:], all=True) if len(pairs) > 1 else pairs[0]
+        page = super().paginate_queryset(union.order_by(*ordering), request, view)
+        return load_rows([pk for _, pk in page])
+
+
+class DefaultPagination(CursorOrPageNumberPagination):
+    """Default pagination for the list endpoints (configured in REST_FRAMEWORK)."""
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+class CommentKeysetPagination(KeysetPagination):
+    descending = False # comments read oldest first
+
+
+class CommentPagination(CursorOrPageNumberPagination):
+    page_size = 5
+    page_size_query_param = 'page_size'
+    max_page_size = 20
+    keyset_class = CommentKeysetPagination
+
+
+class FeedPagination(CursorOrPageNumberPagination):
+    page_size = 10  # Adjust as needed
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+class TimelinePagination(FeedPagination):
+    """
+    Pagination over a materialized timeline of post IDs.
+    Both modes fetch one extra ID to detect the next page instead of running a COUNT(*) over the feed.
+    """
+    def paginate_timeline(self, request, fetch_ids, load_rows):
+        """
+        fetch_ids(limit, offset=0, before=None) returns ordered IDs; load_rows(ids) returns the rows in that order.
+        """
+        self.request = request
+        page_size = self.get_page_size(request)
+        if is_cursor_request(request):
+            self.keyset = self.keyset_class()
+            self.keyset.request = request
+            ids = fetch_ids(page_size + 1, before=self.keyset.get_position(request))
+            return self.keyset.paginate_rows(load_rows(ids), page_size)
+
+        self.keyset = None
+        try:
+            self.page_number = max(int(request.query_params.get(self.page_query_param, 1)), 1)
+        except ValueError:
+            raise NotFound('Invalid page.')
+        ids = fetch_ids(page_size + 1, offset=(self.page_number - 1) * page_size)
+        self.has_next = len(ids) > page_size
+        return load_rows(ids[:page_size])
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return replace_query_param(self.request.build_absolute_uri(), self.page_query_param, self.page_number + 1)
+
+    def get_previous_link(self):
+        if self.page_number <= 1:
+            return None
+        url = self.request.build_absolute_uri()
+        if self.page_number == 2:
+            return remove_query_param(url, self.page_query_param)
+        return replace_query_param(url, self.page_query_param, self.page_number - 1)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
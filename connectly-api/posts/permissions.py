@@ -1,4 +1,5 @@
 from rest_framework.permissions import BasePermission
+from . import authz
 
 class IsOwnerOrAdmin(BasePermission):
     """
@@ -9,7 +10,7 @@ class IsOwnerOrAdmin(BasePermission):
         user = request.user
 
         # Admins have full access
-        if user.is_staff or user.role == "admin" or user.groups.filter(name="Admin").exists():
+        if authz.is_admin(user):
             return True
 
         # Check if the object has 'user' or 'author' and compare it with the request user
@@ -0,0 +1,85 @@
+"""
+orjson-based JSON renderer and parser, and pre-rendered cached responses.
+
+ORJSONRenderer / ORJSONParser are drop-in replacements for DRF's JSONRenderer / JSONParser (same media type,
+same output: compact, UTF-8, U+2028/U+2029 escaped), enabled in REST_FRAMEWORK in core/settings.py.
+
+Feed and comment pages are cached as their final response body (`rendered()`), so a cache hit is returned as a
+RenderedResponse without running a serializer or a renderer, or unpickling nested dicts.
+"""
+import orjson
+from django.conf import settings
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_UTC_Z # 'Z' for UTC datetimes, as DRF's encoder writes them
+_drf_default = JSONEncoder().default # lazy strings, Decimals, querysets, ... (whatever orjson has no native type for)
+
+
+class ORJSONRenderer(JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context) # pretty-printed (browsable API)
+        ret = orjson.dumps(data, default=_drf_default, option=ORJSON_OPTIONS)
+        # Same strict JavaScript subset as DRF's renderer
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
+
+
+class ORJSONParser(JSONParser):
+    renderer_class = ORJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get('encoding', settings.DEFAULT_CHARSET)
+        if encoding.lower().replace('-', '') != 'utf8': # orjson only reads UTF-8
+            return super().parse(stream, media_type, parser_context)
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError(f'JSON parse error - {exc}')
+
+
+def json_renderer():
+    """The configured JSON renderer (the first of DEFAULT_RENDERER_CLASSES with the json format)."""
+    for renderer_class in api_settings.DEFAULT_RENDERER_CLASSES:
+        if renderer_class.format == 'json':
+            return renderer_class()
+    return ORJSONRenderer()
+
+def rendered(data):
+    """A response body as cached: the JSON bytes and their content type."""
+    renderer = json_renderer()
+    return {'content': renderer.render(data), 'content_type': renderer.media_type}
+
+
+class RenderedResponse(Response):
+    """
+    Response for a cached rendered() body. JSON clients get the stored bytes as they are; other renderers (the
+    browsable API) render the data parsed back from them, which is also what `.data` returns.
+    """
+    def __init__(self, entry, status=None, headers=None):
+        super().__init__(None, status=status, headers=headers)
+        self.entry = entry
+
+    @property
+    def data(self):
+        entry = self.__dict__.get('entry')
+        return None if entry is None else orjson.loads(entry['content'])
+
+    @data.setter
+    def data(self, value):
+        pass # always derived from the entry
+
+    @property
+    def rendered_content(self):
+        if self.accepted_renderer.format != 'json':
+            return super().rendered_content
+        self['Content-Type'] = self.content_type or self.entry['content_type']
+        return self.entry['content']
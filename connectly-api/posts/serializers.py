@@ -1,13 +1,28 @@
 from rest_framework import serializers
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.db.models import Prefetch
 from django.contrib.auth import authenticate
-from rest_framework_simplejwt.tokens import RefreshToken
-from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
 from validate_email import validate_email
 from .models import Post, Comment, Like, Follow
+from .authentication import add_user_claims, token_for
 
 User = get_user_model()
 
+# Posts embed only their latest comments; the full list is paginated by the `comments` action
+COMMENT_PREVIEW_SIZE = getattr(settings, 'COMMENT_PREVIEW_SIZE', 3)
+
+def comment_preview_prefetch():
+    """The latest COMMENT_PREVIEW_SIZE comments of every post on a page, in one windowed query."""
+    return Prefetch(
+        'comments',
+        queryset=Comment.objects.order_by('-created_at', '-id')[:COMMENT_PREVIEW_SIZE],
+        to_attr='latest_comments',
+    )
+
 class UserSerializer(serializers.ModelSerializer):
     role = serializers.CharField(read_only=True) # Added role field
 
@@ -47,12 +62,19 @@ class CommentSerializer(serializers.ModelSerializer):
         return value
 
 class PostSerializer(serializers.ModelSerializer):
-    comments = CommentSerializer(many=True, read_only=True)
+    comments = serializers.SerializerMethodField() # latest comments, newest first
+    comment_count = serializers.IntegerField(read_only=True) # denormalized total
 
     class Meta:
         model = Post
-        fields = ['id', 'content', 'author', 'created_at', 'comments', 'privacy']
+        fields = ['id', 'content', 'author', 'created_at', 'comments', 'comment_count', 'privacy']
         read_only_fields = ['id', 'author', 'created_at']
+
+    def get_comments(self, post):
+        preview = getattr(post, 'latest_comments', None) # set by comment_preview_prefetch()
+        if preview is None:
+            preview = post.comments.order_by('-created_at', '-id')[:COMMENT_PREVIEW_SIZE]
+        return CommentSerializer(preview, many=True).data
     
     def validate_content(self, value):
         if len(value) < 7:
@@ -66,6 +88,10 @@ class PostSerializer(serializers.ModelSerializer):
 
 
 class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
+    @classmethod
+    def get_token(cls, user):
+        return add_user_claims(super().get_token(user), user) # lets ClaimsJWTAuthentication skip the user query
+
     def validate(self, attrs):
         data = super().validate(attrs)
 
@@ -76,6 +102,18 @@ class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
         return data
     
 
+class ClaimsTokenRefreshSerializer(TokenRefreshSerializer):
+    """Re-reads the user claims on refresh (one query), so role changes reach the next access token."""
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs['refresh'])
+        user = User.objects.filter(pk=refresh[api_settings.USER_ID_CLAIM], is_active=True).first()
+        if user is None:
+            raise AuthenticationFailed('No active account found for the given token.')
+        attrs['refresh'] = str(add_user_claims(refresh, user))
+        return super().validate(attrs)
+
+
 class LoginSerializer(serializers.Serializer):
     """
     Instead of manually handling tokens, it is recommended to use DRF SimpleJWT's built-in token handling for better security and maintainability.
@@ -92,17 +130,11 @@ class LoginSerializer(serializers.Serializer):
         if not user:
             raise serializers.ValidationError('Unable to log in with provided credentials.')
 
-        # Generate JWT token using the custom serializer
-        refresh = RefreshToken.for_user(user)
-        access_token = str(refresh.access_token)
-
-        # Use the custom serializer to add username and email to the payload
-        serializer = CustomTokenObtainPairSerializer()
-        token = serializer.get_token(user)
-        token['access'] = access_token
+        # One token pair carrying the user claims (the access token copies them from the refresh token)
+        refresh = token_for(user)
         return {
             'refresh': str(refresh),
-            'access': access_token,
+            'access': str(refresh.access_token),
         }
     
 class LikeSerializer(serializers.ModelSerializer):
@@ -113,19 +145,12 @@ class LikeSerializer(serializers.ModelSerializer):
 
 class FeedPostSerializer(serializers.ModelSerializer):
     author_username = serializers.CharField(source='author.username', read_only=True)
-    like_count = serializers.SerializerMethodField()
-    comment_count = serializers.SerializerMethodField()
     privacy = serializers.CharField(read_only=True) #added privacy
 
     class Meta:
         model = Post
         fields = ['id', 'content', 'author_username', 'created_at', 'like_count', 'comment_count', 'privacy'] #added privacy
-
-    def get_like_count(self, obj):
-        return obj.likes.count()
-
-    def get_comment_count(self, obj):
-        return obj.comments.count()
+        read_only_fields = ['like_count', 'comment_count'] # denormalized columns, no per-row COUNT queries
 
 class FollowSerializer(serializers.ModelSerializer):
     class Meta:
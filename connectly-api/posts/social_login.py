@@ -0,0 +1,32 @@
+"""
+Google social login (dj-rest-auth + allauth's Google provider), returning the API's own JWT pair.
+
+Kept out of posts/views.py and routed through posts.lazy.lazy_view: the OAuth adapter and client pull in requests and
+the provider machinery, which no other endpoint needs, so workers only import them on the first Google login.
+"""
+from dj_rest_auth.registration.views import SocialLoginView
+from allauth.socialaccount.providers.google.views import GoogleOAuth2Adapter
+from allauth.socialaccount.providers.oauth2.client import OAuth2Client
+from rest_framework import status
+from rest_framework.response import Response
+from . import authentication
+
+
+class GoogleLogin(SocialLoginView):
+    adapter_class = GoogleOAuth2Adapter
+    client_class = OAuth2Client
+    callback_url = "http://127.0.0.1:5173/"
+
+    def post(self, request, *args, **kwargs):
+        response = super().post(request, *args, **kwargs)
+        if response.status_code == 200:
+            user = self.user
+            refresh = authentication.token_for(user)
+            access_token = str(refresh.access_token)
+            refresh_token = str(refresh)
+            return Response({
+                'access': access_token,
+                'refresh': refresh_token
+            }, status=status.HTTP_200_OK)
+        else:
+            return response
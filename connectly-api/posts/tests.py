@@ -1,12 +1,56 @@
-from django.test import TestCase
-from django.urls import reverse
+import asyncio
+import json
+import pickle
+import random
+import threading
+import time
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock
+from unittest import skipUnless
+from asgiref.sync import sync_to_async
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIHandler
+from django.db import DatabaseError, connection, transaction
+from django.db.models import F, Max, Min, Q
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+from django_redis.exceptions import CompressorError
+from redis.exceptions import ConnectionError as RedisConnectionError
+from rest_framework.authtoken.models import Token
 from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
 from rest_framework import status
+from rest_framework.exceptions import ParseError
+from rest_framework.renderers import JSONRenderer
 from django.contrib.auth import get_user_model
-from .models import Post, Follow, Like
+from django.contrib.auth.models import Group
+from django.contrib.sessions.middleware import SessionMiddleware
+from django.core.management import call_command, CommandError
+from .models import Post, Follow, Like, Comment, TimelineEntry, Job
+from .serializers import FeedPostSerializer
+from . import authentication, authz, caching, counters, db_router, jobs, lazy, likes, timelines, visibility
+from .pagination import keyset_filter
+from .lazy import lazy_view
+from .middleware import QUERY_BUDGETS, AsyncSocialAuthExceptionMiddleware, query_budget
+from .cache_backends import TieredRedisCache, CompactSerializer, ThresholdCompressor
+from .hashers import TunableArgon2PasswordHasher
+from .renderers import ORJSONParser, ORJSONRenderer
 
 User = get_user_model()
 
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+def run_jobs():
+    """Runs the background job worker until the queue is empty."""
+    call_command('run_jobs', '--once', stdout=StringIO())
+
 class FeedViewTests(TestCase):
     def setUp(self):
         self.client = APIClient()
@@ -42,4 +86,1836 @@ class FeedViewTests(TestCase):
     def test_feed_view_unauthenticated(self):
         self.client.force_authenticate(user=None)
         response = self.client.get(reverse('feed'))
-        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
\ No newline at end of file
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+class TimelineTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.author = User.objects.create_user(username='author', email='author@example.com', password='password1')
+        self.follower = User.objects.create_user(username='follower', email='follower@example.com', password='password2')
+        self.stranger = User.objects.create_user(username='stranger', email='stranger@example.com', password='password3')
+        Follow.objects.create(follower=self.follower, following=self.author)
+
+    def create_post(self, content, privacy='public'):
+        self.client.force_authenticate(user=self.author)
+        response = self.client.post(reverse('post-list'), {'content': content, 'privacy': privacy})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        run_jobs()
+        return response.data['id']
+
+    def feed_ids(self, user, query=''):
+        self.client.force_authenticate(user=user)
+        response = self.client.get(reverse('feed') + query)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [post['id'] for post in response.data['results']]
+
+    def test_post_creation_fans_out_to_followers(self):
+        post_id = self.create_post('Private post content', privacy='private')
+        self.assertEqual(
+            set(TimelineEntry.objects.filter(post_id=post_id).values_list('user_id', flat=True)),
+            {self.author.id, self.follower.id},
+        )
+        self.assertIn(post_id, self.feed_ids(self.follower))
+        self.assertNotIn(post_id, self.feed_ids(self.stranger))
+
+    def test_fan_out_keeps_timelines_bounded(self):
+        with mock.patch('posts.timelines.TIMELINE_MAX_LENGTH', 3):
+            post_ids = [self.create_post(f'Post number {i}') for i in range(5)]
+        for user in (self.author, self.follower):
+            self.assertEqual(
+                list(TimelineEntry.objects.filter(user=user).order_by('-created_at', '-post_id').values_list('post_id', flat=True)),
+                post_ids[:1:-1],
+            )
+
+    @override_settings(CACHES=LOCMEM_CACHES)
+    def test_post_edits_and_deletions_reach_cached_follower_feeds(self):
+        post_id = self.create_post('Original content', privacy='private')
+        self.assertIn(post_id, self.feed_ids(self.follower)) # cached
+        self.client.force_authenticate(user=self.author)
+        self.client.patch(reverse('post-detail', args=[post_id]), {'content': 'Edited content'}, format='json')
+        run_jobs()
+        self.client.force_authenticate(user=self.follower)
+        self.assertEqual(self.client.get(reverse('feed')).data['results'][0]['content'], 'Edited content')
+
+        self.client.force_authenticate(user=self.author)
+        self.client.delete(reverse('post-detail', args=[post_id]))
+        run_jobs()
+        self.assertNotIn(post_id, self.feed_ids(self.follower))
+
+    def test_home_feed_merges_public_stream_newest_first(self):
+        private_id = self.create_post('Private post content', privacy='private')
+        public_id = self.create_post('Public post content')
+        self.assertEqual(self.feed_ids(self.follower), [public_id, private_id])
+        self.assertEqual(self.feed_ids(self.stranger), [public_id])
+
+    def test_home_feed_pages_without_count(self):
+        post_ids = [self.create_post(f'Post number {i}') for i in range(3)]
+        self.client.force_authenticate(user=self.follower)
+        response = self.client.get(reverse('feed') + '?page_size=2')
+        self.assertNotIn('count', response.data)
+        self.assertEqual([post['id'] for post in response.data['results']], post_ids[::-1][:2])
+        self.assertIsNotNone(response.data['next'])
+        self.assertEqual(self.feed_ids(self.follower, '?page_size=2&page=2'), post_ids[:1])
+
+    def test_unfollow_removes_author_from_timeline(self):
+        post_id = self.create_post('Private post content', privacy='private')
+        follow = Follow.objects.get(follower=self.follower, following=self.author)
+        self.client.force_authenticate(user=self.follower)
+        self.client.delete(reverse('follow-detail', args=[follow.id]))
+        self.assertNotIn(post_id, self.feed_ids(self.follower))
+
+    def test_rebuild_timelines_backfills_existing_posts(self):
+        post = Post.objects.create(author=self.author, content='Created before timelines', privacy='private')
+        self.assertNotIn(post.id, self.feed_ids(self.follower))
+        call_command('rebuild_timelines', stdout=StringIO())
+        self.assertIn(post.id, self.feed_ids(self.follower))
+
+
+class CursorPaginationTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='reader', email='reader@example.com', password='password1')
+        self.author = User.objects.create_user(username='writer', email='writer@example.com', password='password2')
+        Follow.objects.create(follower=self.user, following=self.author)
+        self.posts = [Post.objects.create(author=self.author, content=f'Post number {i}') for i in range(5)]
+        call_command('rebuild_timelines', stdout=StringIO())
+        self.client.force_authenticate(user=self.user)
+
+    def walk(self, url):
+        """Follows `next` cursors until exhaustion and returns every result ID."""
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertNotIn('count', response.data)
+            ids += [item['id'] for item in response.data['results']]
+            url = response.data['next']
+        return ids
+
+    def test_feed_cursor_pages_cover_all_posts_once(self):
+        newest_first = [post.id for post in reversed(self.posts)]
+        self.assertEqual(self.walk(reverse('feed') + '?cursor=&page_size=2'), newest_first)
+        self.assertEqual(self.walk(reverse('feed') + '?filter=followed&cursor=&page_size=2'), newest_first)
+
+    def test_comments_cursor_pages_oldest_first(self):
+        post = self.posts[0]
+        comment_ids = [post.comments.create(user=self.user, content=f'Comment number {i}').id for i in range(7)]
+        url = reverse('post-comments', args=[post.id]) + '?cursor='
+        self.assertEqual(self.walk(url), comment_ids)
+
+    def test_list_endpoint_cursor_mode(self):
+        self.assertEqual(self.walk(reverse('post-list') + '?cursor=&page_size=3'), [post.id for post in reversed(self.posts)])
+        response = self.client.get(reverse('post-list'))
+        self.assertEqual(response.data['count'], 5) # page-number mode is unchanged
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse('post-list') + '?cursor=not-a-cursor')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class CounterTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='counter', email='counter@example.com', password='password1')
+        self.post = Post.objects.create(author=self.user, content='Counted post content')
+        self.client.force_authenticate(user=self.user)
+
+    def test_like_unlike_and_comment_update_counters(self):
+        self.client.post(reverse('post-like', args=[self.post.id]))
+        self.client.post(reverse('post-comment', args=[self.post.id]), {'content': 'Nice post!'})
+        self.post.refresh_from_db()
+        self.assertEqual((self.post.like_count, self.post.comment_count), (1, 1))
+
+        self.client.post(reverse('post-unlike', args=[self.post.id]))
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.like_count, 0)
+
+    @override_settings(CACHES=LOCMEM_CACHES)
+    def test_feed_reads_counters_without_per_row_queries(self):
+        cache.clear()
+        for i in range(5):
+            Post.objects.create(author=self.user, content=f'Another post {i}', like_count=i)
+        call_command('rebuild_timelines', stdout=StringIO())
+        with self.assertNumQueries(4): # high-fanout followees, timeline IDs, public IDs, rows with authors
+            response = self.client.get(reverse('feed'))
+        self.assertEqual(response.data['results'][0]['like_count'], 4)
+
+    def test_reconcile_counters_fixes_drift(self):
+        Like.objects.create(user=self.user, post=self.post)
+        Post.objects.filter(pk=self.post.pk).update(comment_count=7)
+        call_command('reconcile_counters', stdout=StringIO())
+        self.post.refresh_from_db()
+        self.assertEqual((self.post.like_count, self.post.comment_count), (1, 0))
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class GenerationCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.author = User.objects.create_user(username='author', email='author@example.com', password='password1')
+        self.follower = User.objects.create_user(username='follower', email='follower@example.com', password='password2')
+        Follow.objects.create(follower=self.follower, following=self.author)
+        self.post = Post.objects.create(author=self.author, content='First post content')
+
+    def get(self, user, url):
+        self.client.force_authenticate(user=user)
+        return self.client.get(url).data
+
+    def test_new_post_invalidates_follower_feed(self):
+        self.assertEqual(len(self.get(self.follower, reverse('feed'))['results']), 1)
+        self.client.force_authenticate(user=self.author)
+        self.client.post(reverse('post-list'), {'content': 'Second post content'})
+        run_jobs()
+        self.assertEqual(len(self.get(self.follower, reverse('feed'))['results']), 2)
+
+    def test_comment_invalidates_comment_pages(self):
+        url = reverse('post-comments', args=[self.post.id])
+        self.assertEqual(self.get(self.follower, url)['count'], 0)
+        self.client.post(reverse('post-comment', args=[self.post.id]), {'content': 'Great post!'})
+        self.assertEqual(self.get(self.follower, url)['count'], 1)
+
+    def test_invalidation_is_a_single_counter_bump(self):
+        key = caching.feed_cache_key(self.follower.id, None, '1')
+        caching.invalidate_feed(self.follower.id)
+        self.assertNotEqual(caching.feed_cache_key(self.follower.id, None, '1'), key)
+
+    def test_evicted_counter_does_not_revive_old_entries(self):
+        key = caching.feed_cache_key(self.follower.id, None, '1')
+        cache.delete(f'feed_gen:{self.follower.id}')
+        self.assertNotEqual(caching.feed_cache_key(self.follower.id, None, '1'), key)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+@mock.patch.object(timelines, 'FEED_FANOUT_FOLLOWER_THRESHOLD', 1)
+class HybridFeedTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.star = User.objects.create_user(username='star', email='star@example.com', password='password1')
+        self.fans = [
+            User.objects.create_user(username=f'fan{i}', email=f'fan{i}@example.com', password='password2')
+            for i in range(2)
+        ]
+        for fan in self.fans:
+            self.client.force_authenticate(user=fan)
+            self.client.post(reverse('follow-list'), {'following': self.star.id})
+        self.star.refresh_from_db()
+
+    def create_post(self, content, privacy='public'):
+        self.client.force_authenticate(user=self.star)
+        post_id = self.client.post(reverse('post-list'), {'content': content, 'privacy': privacy}).data['id']
+        run_jobs()
+        return post_id
+
+    def feed_ids(self, user, query=''):
+        self.client.force_authenticate(user=user)
+        return [post['id'] for post in self.client.get(reverse('feed') + query).data['results']]
+
+    def test_high_fanout_posts_are_pulled_not_pushed(self):
+        self.assertEqual(self.star.follower_count, 2)
+        post_id = self.create_post('Private post for fans', privacy='private')
+        self.assertEqual(list(TimelineEntry.objects.filter(post_id=post_id).values_list('user_id', flat=True)), [self.star.id])
+        for fan in self.fans:
+            self.assertEqual(self.feed_ids(fan), [post_id])
+            self.assertEqual(self.feed_ids(fan, '?cursor='), [post_id])
+
+    def test_like_bumps_one_author_generation(self):
+        post_id = self.create_post('Public post for fans')
+        feed_gens = [caching.get_generation(caching.FEED_NAMESPACE, fan.id) for fan in self.fans]
+        author_gen = caching.get_generation(caching.AUTHOR_NAMESPACE, self.star.id)
+        self.client.force_authenticate(user=self.fans[0])
+        self.client.post(reverse('post-like', args=[post_id]))
+        run_jobs()
+        self.assertEqual([caching.get_generation(caching.FEED_NAMESPACE, fan.id) for fan in self.fans], feed_gens)
+        self.assertEqual(caching.get_generation(caching.AUTHOR_NAMESPACE, self.star.id), author_gen + 1)
+        self.assertEqual(self.client.get(reverse('feed')).data['results'][0]['like_count'], 1)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class JobQueueTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.author = User.objects.create_user(username='author', email='author@example.com', password='password1')
+        self.readers = [
+            User.objects.create_user(username=f'reader{i}', email=f'reader{i}@example.com', password='password2')
+            for i in range(3)
+        ]
+        self.posts = [Post.objects.create(author=self.author, content=f'Post number {i}') for i in range(3)]
+
+    def like_all(self, user):
+        self.client.force_authenticate(user=user)
+        for post in self.posts:
+            self.client.post(reverse('post-like', args=[post.id]))
+
+    def test_duplicate_jobs_for_an_author_coalesce(self):
+        for reader in self.readers:
+            self.like_all(reader)
+        self.assertEqual(Job.objects.filter(kind=jobs.INVALIDATE_FOLLOWERS).count(), 1)
+
+    def test_write_latency_does_not_grow_with_followers(self):
+        def like_queries():
+            post = Post.objects.create(author=self.author, content='Measured post')
+            self.client.force_authenticate(user=User.objects.get(pk=self.readers[0].pk)) # a new request's user, roles unresolved
+            with CaptureQueriesContext(connection) as ctx:
+                self.client.post(reverse('post-like', args=[post.id]))
+            return len(ctx.captured_queries)
+
+        visibility.followed_author_ids(self.readers[0].id) # warm the reader's cached follows and groups
+        authz.group_names(self.readers[0].id)
+        few = like_queries()
+        for i in range(20):
+            follower = User.objects.create(username=f'follower{i}', email=f'follower{i}@example.com')
+            Follow.objects.create(follower=follower, following=self.author)
+        self.assertEqual(like_queries(), few)
+
+    def test_worker_invalidates_each_follower_once(self):
+        for reader in self.readers:
+            Follow.objects.create(follower=reader, following=self.author)
+        generations = [caching.get_generation(caching.FEED_NAMESPACE, reader.id) for reader in self.readers]
+        self.like_all(self.readers[0])
+        run_jobs()
+        self.assertEqual(
+            [caching.get_generation(caching.FEED_NAMESPACE, reader.id) for reader in self.readers],
+            [generation + 1 for generation in generations],
+        )
+        self.assertFalse(Job.objects.exists())
+
+    def test_rolled_back_writes_leave_no_jobs(self):
+        enqueue = jobs.enqueue
+        def enqueue_then_fail(*args):
+            enqueue(*args)
+            raise DatabaseError('connection lost before commit')
+
+        self.client.force_authenticate(user=self.readers[0])
+        requests = [
+            (reverse('post-list'), {'content': 'Rolled back post'}),
+            (reverse('post-like', args=[self.posts[0].id]), None),
+            (reverse('post-comment', args=[self.posts[0].id]), {'content': 'Rolled back comment'}),
+        ]
+        for url, payload in requests:
+            with self.subTest(url=url), mock.patch('posts.jobs.enqueue', enqueue_then_fail):
+                with self.assertRaises(DatabaseError):
+                    self.client.post(url, payload, format='json')
+                self.assertFalse(Job.objects.exists())
+        self.assertEqual(Post.objects.count(), len(self.posts))
+        self.assertFalse(Like.objects.exists())
+        self.assertFalse(Comment.objects.exists())
+        self.assertEqual(Post.objects.get(pk=self.posts[0].pk).comment_count, 0)
+
+    def test_failed_batch_is_retried_with_backoff(self):
+        jobs.enqueue(jobs.INVALIDATE_FOLLOWERS, self.author.id)
+        with mock.patch.dict(jobs.HANDLERS, {jobs.INVALIDATE_FOLLOWERS: mock.Mock(side_effect=RuntimeError('boom'))}):
+            run_jobs()
+        job = Job.objects.get()
+        self.assertEqual((job.attempts, job.last_error), (1, 'boom'))
+        self.assertIsNone(job.claimed_at)
+        self.assertEqual(jobs.run_pending(), 0) # not due yet
+
+
+class VisibilityEquivalenceTests(TestCase):
+    """The visibility engine must return exactly what the old OR + followers JOIN + DISTINCT query returned."""
+
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(7)
+        cls.users = [User.objects.create(username=f'viewer{i}', email=f'viewer{i}@example.com') for i in range(8)]
+        cls.posts = [
+            Post.objects.create(author=rng.choice(cls.users), content=f'Seeded post {i}', privacy=rng.choice(['public', 'private']))
+            for i in range(40)
+        ]
+        for follower in cls.users:
+            for following in rng.sample(cls.users, 3):
+                if following != follower:
+                    Follow.objects.get_or_create(follower=follower, following=following)
+            for post in rng.sample(cls.posts, 6):
+                Like.objects.create(user=follower, post=post)
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def legacy_visible(self, user, queryset):
+        return queryset.filter(
+            Q(privacy='public') |
+            Q(author=user) |
+            Q(author__followers__follower=user)
+        ).distinct().order_by('-created_at', '-id')
+
+    def legacy_feed(self, user, filter_type):
+        if filter_type == 'followed':
+            posts = Post.objects.filter(author__in=Follow.objects.filter(follower=user).values_list('following', flat=True))
+        else:
+            posts = Post.objects.filter(id__in=Like.objects.filter(user=user).values_list('post', flat=True))
+        return [post.id for post in self.legacy_visible(user, posts)]
+
+    def feed_ids(self, url):
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            ids += [post['id'] for post in response.data['results']]
+            url = response.data['next']
+        return ids
+
+    def test_visible_posts_match_legacy_query(self):
+        for user in self.users:
+            self.assertEqual(
+                set(visibility.visible_posts(user).values_list('id', flat=True)),
+                set(self.legacy_visible(user, Post.objects.all()).values_list('id', flat=True)),
+            )
+
+    def test_visible_posts_query_has_no_join_or_distinct(self):
+        sql = str(visibility.visible_posts(self.users[0]).query).upper()
+        self.assertNotIn('JOIN', sql)
+        self.assertNotIn('DISTINCT', sql)
+
+    def test_filtered_feeds_match_legacy_query(self):
+        for user in self.users:
+            self.client.force_authenticate(user=user)
+            for filter_type in ('followed', 'liked'):
+                expected = self.legacy_feed(user, filter_type)
+                url = reverse('feed') + f'?filter={filter_type}&page_size=4'
+                self.assertEqual(self.feed_ids(url), expected)
+                self.assertEqual(self.feed_ids(url + '&cursor='), expected)
+
+    def test_post_list_matches_legacy_query(self):
+        for user in self.users:
+            self.client.force_authenticate(user=user)
+            expected = [post.id for post in self.legacy_visible(user, Post.objects.all())]
+            self.assertEqual(self.feed_ids(reverse('post-list') + '?cursor=&page_size=7'), expected)
+
+
+class FakeRedisClient:
+    """Stands in for the django_redis client behind TieredRedisCache and counts the round trips."""
+
+    def __init__(self):
+        self.data = {}
+        self.reads = 0
+        self.published = []
+
+    def get(self, key, default=None, version=None, client=None):
+        self.reads += 1
+        return self.data.get(key, default)
+
+    def get_many(self, keys, version=None, client=None):
+        self.reads += 1
+        return {key: self.data[key] for key in keys if key in self.data}
+
+    def set(self, key, value, timeout=None, version=None, client=None, nx=False, xx=False):
+        self.data[key] = value
+        return True
+
+    def delete(self, key, version=None, prefix=None, client=None):
+        return int(self.data.pop(key, None) is not None)
+
+    def get_client(self, write=True):
+        return mock.Mock(publish=lambda channel, message: self.published.append(message))
+
+
+class FakeAsyncRedis:
+    """Stands in for the redis.asyncio client behind TieredRedisCache's async API."""
+
+    def __init__(self):
+        self.data = {}
+        self.reads = 0
+        self.published = []
+
+    async def mget(self, keys):
+        self.reads += 1
+        return [self.data.get(key) for key in keys]
+
+    async def set(self, key, value, px=None, nx=False):
+        if nx and key in self.data:
+            return None
+        self.data[key] = value
+        return True
+
+    async def delete(self, key):
+        return int(self.data.pop(key, None) is not None)
+
+    async def publish(self, channel, message):
+        self.published.append(message)
+
+
+class TieredCacheTests(TestCase):
+    def setUp(self):
+        self.cache = TieredRedisCache('redis://127.0.0.1:6379/1', {
+            'OPTIONS': {'LOCAL_PREFIXES': ['user_', 'post_comments:'], 'LOCAL_MAX_BYTES': 4096, 'LOCAL_TIMEOUT': 60},
+        })
+        self.redis = self.cache._client = FakeRedisClient()
+        self.cache._listener = mock.Mock() # no listener thread; pretend it is subscribed
+        self.cache._subscribed.set()
+
+    def test_hot_reads_are_served_from_worker_memory(self):
+        self.redis.data['user_1'] = {'username': 'alice'}
+        for _ in range(3):
+            self.assertEqual(self.cache.get('user_1'), {'username': 'alice'})
+        self.assertEqual(self.redis.reads, 1)
+        stats = self.cache.local_stats()
+        self.assertEqual((stats['local_hits'], stats['local_misses'], stats['redis_hits']), (2, 1, 1))
+
+    def test_local_copies_are_not_shared_objects(self):
+        self.cache.set('user_1', {'username': 'alice'})
+        self.cache.get('user_1')['username'] = 'mallory'
+        self.assertEqual(self.cache.get('user_1'), {'username': 'alice'})
+
+    def test_writes_and_deletes_are_broadcast(self):
+        self.cache.set('user_1', 'v1')
+        self.cache.delete('user_1')
+        full_key = self.cache.make_key('user_1')
+        self.assertEqual(self.redis.published, [full_key, full_key])
+        self.assertIsNone(self.cache.get('user_1'))
+        self.assertEqual(self.redis.reads, 1)
+
+    def test_invalidation_from_another_worker_evicts_the_local_copy(self):
+        self.cache.set('post_comments:1:5:page', ['comment'])
+        self.redis.data['post_comments:1:5:page'] = ['edited']
+        self.cache._evict_local([self.cache.make_key('post_comments:1:5:page')]) # as delivered by the listener
+        self.assertEqual(self.cache.get('post_comments:1:5:page'), ['edited'])
+
+    def test_values_read_during_an_invalidation_are_not_kept(self):
+        self.redis.data['user_1'] = 'old'
+        original_get = self.redis.get
+        def get_then_invalidate(*args, **kwargs):
+            value = original_get(*args, **kwargs)
+            self.cache._evict_local([self.cache.make_key('user_1')])
+            return value
+        with mock.patch.object(self.redis, 'get', get_then_invalidate):
+            self.cache.get('user_1')
+        self.assertEqual(self.cache.local_stats()['local_keys'], 0)
+
+    def test_local_tier_is_bypassed_while_unsubscribed(self):
+        self.cache.set('user_1', 'value')
+        self.cache._subscribed.clear()
+        self.cache.get('user_1')
+        self.cache.get('user_1')
+        self.assertEqual(self.redis.reads, 2)
+
+    def test_failed_redis_write_is_not_mirrored_locally(self):
+        with mock.patch.object(self.redis, 'set', return_value=None):
+            self.cache.set('user_1', 'value')
+        self.assertEqual(self.cache.local_stats()['local_keys'], 0)
+
+    def test_local_tier_is_bounded_and_prefix_scoped(self):
+        self.cache.set('user_big', 'x' * 10000)
+        self.cache.set('feed_gen:1', 1)
+        self.cache.get('feed_gen:1')
+        stats = self.cache.local_stats()
+        self.assertEqual(stats['local_keys'], 0)
+        self.assertLessEqual(stats['local_bytes'], 4096)
+        for i in range(200):
+            self.cache.set(f'user_{i}', 'x' * 100)
+        self.assertLessEqual(self.cache.local_stats()['local_bytes'], 4096)
+
+    def test_get_many_mixes_tiers(self):
+        self.cache.set('user_1', 'local')
+        self.redis.data.update({'user_2': 'remote', 'feed_gen:1': 7})
+        self.assertEqual(self.cache.get_many(['user_1', 'user_2', 'feed_gen:1']), {'user_1': 'local', 'user_2': 'remote', 'feed_gen:1': 7})
+        self.assertEqual(self.cache.get_many(['user_1', 'user_2']), {'user_1': 'local', 'user_2': 'remote'})
+        self.assertEqual(self.redis.reads, 1)
+
+    def test_stats_endpoint_is_admin_only(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create(username='member', email='member@example.com'))
+        self.assertEqual(client.get(reverse('cache-stats')).status_code, status.HTTP_403_FORBIDDEN)
+        client.force_authenticate(User.objects.create(username='staff', email='staff@example.com', is_staff=True))
+        with mock.patch('posts.views.cache', self.cache):
+            response = client.get(reverse('cache-stats'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('local_hits', response.data)
+        self.assertIn('redis_misses', response.data)
+
+    async def test_async_api_uses_both_tiers(self):
+        aredis = FakeAsyncRedis()
+        with mock.patch.object(self.cache, '_aredis', return_value=aredis), \
+                mock.patch.object(self.cache, '_client', mock.Mock(encode=pickle.dumps, decode=pickle.loads)):
+            await self.cache.aset('user_1', {'username': 'alice'})
+            self.assertEqual(aredis.published, [self.cache.make_key('user_1')])
+            self.assertEqual(await self.cache.aget_many(['user_1', 'feed_gen:1']), {'user_1': {'username': 'alice'}})
+            self.assertTrue(await self.cache.aadd('feed_gen:1', 5))
+            self.assertFalse(await self.cache.aadd('feed_gen:1', 6))
+            self.assertEqual(await self.cache.aget('feed_gen:1'), 5)
+            self.assertEqual(aredis.reads, 2) # user_1 came from worker memory both times
+            self.assertTrue(await self.cache.adelete('user_1'))
+            self.assertIsNone(await self.cache.aget('user_1'))
+
+    async def test_async_api_ignores_redis_errors_like_the_sync_one(self):
+        aredis = mock.Mock(mget=mock.AsyncMock(side_effect=RedisConnectionError), set=mock.AsyncMock(side_effect=RedisConnectionError))
+        self.cache._client = mock.Mock(encode=pickle.dumps, decode=pickle.loads)
+        self.cache._ignore_exceptions = True
+        with mock.patch.object(self.cache, '_aredis', return_value=aredis):
+            self.assertEqual(await self.cache.aget('feed_gen:1', 'default'), 'default')
+            self.assertIsNone(await self.cache.aadd('lock:page', 'token')) # what posts.caching reads as "cache down"
+        self.cache._ignore_exceptions = False
+        with mock.patch.object(self.cache, '_aredis', return_value=aredis), self.assertRaises(RedisConnectionError):
+            await self.cache.aget('feed_gen:1')
+
+    @override_settings(CACHES=LOCMEM_CACHES)
+    def test_user_retrieve_caches_profile(self):
+        user = User.objects.create(username='profile', email='profile@example.com', is_staff=True)
+        client = APIClient()
+        client.force_authenticate(user)
+        response = client.get(f'/posts/users/{user.id}/') # reverse('user-detail') resolves to djoser's route
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(cache.get(f'user_{user.id}')['value']['username'], 'profile')
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class StampedeProtectionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.calls = 0
+
+    def compute(self, value='fresh', delay=0):
+        def build():
+            self.calls += 1
+            time.sleep(delay)
+            return value
+        return build
+
+    def test_concurrent_misses_rebuild_once(self):
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(caching.cached('page', self.compute(delay=0.2), 60)))
+            for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, ['fresh'] * 5)
+        self.assertEqual(self.calls, 1)
+
+    def test_expired_entry_is_served_while_another_worker_rebuilds(self):
+        cache.set('page', {'value': 'old', 'expires': time.time() - 1, 'delta': 0.1})
+        cache.add('lock:page', 'other-worker')
+        self.assertEqual(caching.cached('page', self.compute(), 60), 'old')
+        self.assertEqual(self.calls, 0)
+
+    def test_invalidated_page_is_served_from_stale_copy_during_rebuild(self):
+        caching.cached('page:gen1', self.compute('v1'), 60, stale_key='page:stale')
+        cache.add('lock:page:gen2', 'other-worker')
+        self.assertEqual(caching.cached('page:gen2', self.compute('v2'), 60, stale_key='page:stale'), 'v1')
+        cache.delete('lock:page:gen2')
+        self.assertEqual(caching.cached('page:gen2', self.compute('v2'), 60, stale_key='page:stale'), 'v2')
+
+    def test_waits_for_rebuild_when_nothing_stale(self):
+        cache.add('lock:page', 'other-worker')
+        timer = threading.Timer(0.1, lambda: cache.set('page', {'value': 'built elsewhere', 'expires': time.time() + 60, 'delta': 0.1}))
+        timer.start()
+        self.assertEqual(caching.cached('page', self.compute(), 60), 'built elsewhere')
+        timer.join()
+        self.assertEqual(self.calls, 0)
+
+    def test_probabilistic_early_refresh(self):
+        entry = {'value': 'old', 'expires': time.time() + 5, 'delta': 1.0}
+        with mock.patch('posts.caching.random.random', return_value=0.5):
+            self.assertFalse(caching._should_refresh(entry)) # 0.69s of jitter, 5s left
+        with mock.patch('posts.caching.random.random', return_value=1e-6):
+            self.assertTrue(caching._should_refresh(entry)) # 13.8s of jitter
+        cache.set('page', entry)
+        with mock.patch('posts.caching.random.random', return_value=1e-6):
+            self.assertEqual(caching.cached('page', self.compute(), 60), 'fresh')
+        self.assertEqual(self.calls, 1)
+
+    def test_computes_directly_when_cache_is_down(self):
+        with mock.patch.object(cache, 'add', return_value=None):
+            self.assertEqual(caching.cached('page', self.compute(), 60), 'fresh')
+            self.assertEqual(caching.cached('page', self.compute(), 60), 'fresh')
+        self.assertEqual(self.calls, 2)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class RenderedResponseTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create(username='reader', email='reader@example.com')
+        self.post = Post.objects.create(author=self.user, content='Caf\u00e9 \u2028 post', privacy='public')
+        Comment.objects.create(user=self.user, post=self.post, content='First \u2028 comment')
+        timelines.rebuild_timeline(self.user.id)
+        self.client.force_authenticate(self.user)
+
+    def test_orjson_renderer_matches_drf_output(self):
+        data = {
+            'when': timezone.now(), 'day': timezone.now().date(), 'price': Decimal('1.50'), 'text': 'caf\u00e9 \u2028 \u2029',
+            'lazy': gettext_lazy('Not found.'), 'nested': [{'id': 1, 'ok': True, 'none': None}], 1: 'int key',
+        }
+        self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(data))
+        self.assertEqual(ORJSONRenderer().render(None), b'')
+        self.assertEqual(ORJSONRenderer().render(data, 'application/json; indent=4'), JSONRenderer().render(data, 'application/json; indent=4'))
+
+    def test_orjson_parser(self):
+        self.assertEqual(ORJSONParser().parse(BytesIO('{"content": "caf\u00e9"}'.encode())), {'content': 'caf\u00e9'})
+        with self.assertRaises(ParseError):
+            ORJSONParser().parse(BytesIO(b'{"content": '))
+        response = self.client.post(reverse('post-comment', args=[self.post.id]), '{"content": "Parsed by orjson"}', content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def test_cache_hits_return_the_stored_bytes(self):
+        for url in (reverse('feed'), reverse('post-comments', args=[self.post.id])):
+            with self.subTest(url=url):
+                first = self.client.get(url)
+                with mock.patch.object(ORJSONRenderer, 'render', side_effect=AssertionError('rendered again')), \
+                        mock.patch('posts.views.build_feed_page', side_effect=AssertionError('rebuilt')), \
+                        mock.patch('posts.views.build_comments_page', side_effect=AssertionError('rebuilt')):
+                    second = self.client.get(url)
+                self.assertEqual(second.status_code, status.HTTP_200_OK)
+                self.assertEqual(second['Content-Type'], 'application/json')
+                self.assertEqual(second.content, first.content)
+                self.assertEqual(second.data, json.loads(first.content))
+                self.assertIn(b'\\u2028', second.content)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ConditionalRequestTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.reader = User.objects.create(username='reader', email='reader@example.com')
+        self.author = User.objects.create(username='author', email='author@example.com')
+        Follow.objects.create(follower=self.reader, following=self.author)
+        self.post = Post.objects.create(author=self.author, content='Followers only post', privacy='private')
+        Comment.objects.create(user=self.reader, post=self.post, content='First comment')
+        timelines.rebuild_timeline(self.reader.id)
+        self.client.force_authenticate(self.reader)
+        self.urls = [reverse('feed'), reverse('post-detail', args=[self.post.id]), reverse('post-comments', args=[self.post.id])]
+
+    def etags(self):
+        responses = [self.client.get(url) for url in self.urls]
+        for response in responses:
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertIn('no-cache', response['Cache-Control'])
+        return [response['ETag'] for response in responses]
+
+    def test_matching_if_none_match_is_answered_without_queries_or_rendering(self):
+        for url, etag in zip(self.urls, self.etags()):
+            with self.subTest(url=url):
+                with self.assertNumQueries(0), \
+                        mock.patch.object(ORJSONRenderer, 'render', side_effect=AssertionError('rendered')), \
+                        mock.patch('posts.views.build_feed_page', side_effect=AssertionError('rebuilt')), \
+                        mock.patch('posts.views.build_comments_page', side_effect=AssertionError('rebuilt')):
+                    response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+                self.assertEqual(response['ETag'], etag)
+                self.assertEqual(response.content, b'')
+
+    def test_if_modified_since_uses_the_build_time_of_cached_pages(self):
+        for url in self.urls[::2]:
+            with self.subTest(url=url):
+                last_modified = self.client.get(url)['Last-Modified']
+                self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_writes_change_the_etags(self):
+        feed, detail, comments = self.etags()
+        self.client.post(reverse('post-comment', args=[self.post.id]), {'content': 'Second comment'}, format='json')
+        run_jobs()
+        new_feed, new_detail, new_comments = self.etags()
+        self.assertNotEqual(new_feed, feed) # comment_count changed for the author's followers
+        self.assertNotEqual(new_detail, detail)
+        self.assertNotEqual(new_comments, comments)
+        self.assertEqual(self.client.get(self.urls[2], HTTP_IF_NONE_MATCH=comments).status_code, status.HTTP_200_OK)
+
+        self.client.force_authenticate(self.author)
+        self.client.patch(reverse('post-detail', args=[self.post.id]), {'privacy': 'public'}, format='json')
+        self.client.force_authenticate(self.reader)
+        edited = self.etags()
+        self.assertNotEqual(edited[1:], [new_detail, new_comments])
+
+        Follow.objects.filter(follower=self.reader).delete()
+        visibility.forget_follows(self.reader.id) # as the unfollow endpoints do
+        self.assertNotEqual(self.etags()[1:], edited[1:])
+
+    def test_polls_see_edits_and_deletions_by_followed_authors(self):
+        feed = self.etags()[0]
+        self.client.force_authenticate(self.author)
+        self.client.patch(reverse('post-detail', args=[self.post.id]), {'content': 'Edited post'}, format='json')
+        run_jobs()
+        self.client.force_authenticate(self.reader)
+        response = self.client.get(self.urls[0], HTTP_IF_NONE_MATCH=feed)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'][0]['content'], 'Edited post')
+
+        self.client.force_authenticate(self.author)
+        self.client.delete(reverse('post-detail', args=[self.post.id]))
+        run_jobs()
+        self.client.force_authenticate(self.reader)
+        response = self.client.get(self.urls[0], HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'], [])
+
+    def test_polls_get_a_304_only_while_the_page_is_cached(self):
+        stranger = User.objects.create(username='stranger', email='stranger@example.com')
+        feed = self.etags()[0]
+        Post.objects.create(author=stranger, content='Public post by a stranger', privacy='public') # bumps no generation
+        cache.clear() # the cached page expired
+        response = self.client.get(self.urls[0], HTTP_IF_NONE_MATCH=feed)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], feed)
+        self.assertEqual(self.client.get(self.urls[0], HTTP_IF_NONE_MATCH=response['ETag']).status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_stale_copies_get_no_validators(self):
+        self.client.get(self.urls[0])
+        caching.invalidate_feed(self.reader.id)
+        with mock.patch.object(caching.cache, 'add', return_value=False): # another worker is rebuilding the page
+            response = self.client.get(self.urls[0])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('ETag', response)
+        self.assertNotIn('Last-Modified', response)
+
+
+class CacheEncodingTests(TestCase):
+    def setUp(self):
+        self.serializer = CompactSerializer({})
+        self.compressor = ThresholdCompressor({'COMPRESS_MIN_BYTES': 64})
+        author = User.objects.create(username='encoder', email='encoder@example.com')
+        for i in range(10):
+            Post.objects.create(author=author, content=f'Encoded post number {i}', privacy='public')
+        self.page = {
+            'next': None,
+            'results': FeedPostSerializer(Post.objects.all(), many=True).data,
+        }
+
+    def test_round_trips_cached_values(self):
+        now = timezone.now()
+        values = [
+            {'value': self.page, 'expires': 1.5, 'delta': 0.01},
+            [(now, 1), (now, 2)], # author_recent lists must keep their tuples for heapq.merge
+            [{'a': 1, 'b': [1, 2]}, {'a': 2, 'b': []}],
+            [{'a': 1}, {'b': 2}],
+            {'when': now.date(), 'none': None, 'flag': True, 'blob': b'\x00'},
+        ]
+        for value in values:
+            self.assertEqual(self.serializer.loads(self.serializer.dumps(value)), value)
+
+    def test_feed_page_is_smaller_than_pickle(self):
+        packed = self.serializer.dumps(self.page)
+        self.assertLess(len(packed), len(pickle.dumps(self.page, pickle.HIGHEST_PROTOCOL)) * 0.8)
+        self.assertEqual(packed.count(b'author_username'), 1)
+
+    def test_unsupported_values_and_legacy_entries_fall_back_to_pickle(self):
+        value = {(1, 2): 'tuple key'}
+        self.assertEqual(self.serializer.loads(self.serializer.dumps(value)), value)
+        self.assertEqual(self.serializer.loads(pickle.dumps({'old': 'entry'}, pickle.HIGHEST_PROTOCOL)), {'old': 'entry'})
+
+    def test_compresses_only_above_threshold(self):
+        small = self.serializer.dumps({'a': 1})
+        self.assertEqual(self.compressor.compress(small), small)
+        with self.assertRaises(CompressorError):
+            self.compressor.decompress(small)
+
+        packed = self.serializer.dumps(self.page)
+        compressed = self.compressor.compress(packed)
+        self.assertLess(len(compressed), len(packed))
+        self.assertEqual(self.compressor.decompress(compressed), packed)
+
+    def test_measure_command_reports_both_entry_kinds(self):
+        out = StringIO()
+        call_command('measure_cache_encoding', '--samples', '5', stdout=out)
+        self.assertIn('feed_data', out.getvalue())
+        self.assertIn('post_comments', out.getvalue())
+
+
+@skipUnless(connection.vendor == 'postgresql', 'query plans are only checked on Postgres (set TEST_DATABASE_URL)')
+class QueryPlanTests(TestCase):
+    """EXPLAIN the hot feed/comment queries against a seeded database: they must use their index, without a sort."""
+
+    @classmethod
+    def setUpTestData(cls):
+        users = User.objects.bulk_create([User(username=f'planner{i}', email=f'planner{i}@example.com') for i in range(200)])
+        Post.objects.bulk_create([
+            Post(author=user, content=f'Plan post {i}', privacy='private' if i % 4 == 0 else 'public')
+            for user in users for i in range(100)
+        ], batch_size=5000)
+        posts = list(Post.objects.values_list('id', flat=True)[:200])
+        Comment.objects.bulk_create([
+            Comment(user=users[i % len(users)], post_id=post_id, content=f'Plan comment {i}')
+            for post_id in posts for i in range(100)
+        ], batch_size=5000)
+        Follow.objects.bulk_create([
+            Follow(follower=follower, following=users[(n + offset) % len(users)])
+            for n, follower in enumerate(users) for offset in range(1, 21)
+        ], batch_size=5000)
+        author_posts = defaultdict(list)
+        for post_id, author_id, created_at in Post.objects.values_list('id', 'author_id', 'created_at'):
+            if len(author_posts[author_id]) < 5:
+                author_posts[author_id].append((post_id, created_at))
+        TimelineEntry.objects.bulk_create([
+            TimelineEntry(user_id=follow.follower_id, post_id=post_id, author_id=follow.following_id, created_at=created_at)
+            for follow in Follow.objects.all() for post_id, created_at in author_posts[follow.following_id]
+        ], batch_size=5000)
+        with connection.cursor() as cursor:
+            # auto_now_add gave every row the same timestamp; spread them out like real traffic
+            cursor.execute("UPDATE posts_post SET created_at = now() - id * interval '1 minute'")
+            cursor.execute("UPDATE posts_comment SET created_at = now() - id * interval '1 second'")
+            cursor.execute('ANALYZE posts_post, posts_comment, posts_follow, posts_timelineentry')
+        cls.author = users[0]
+        cls.post_id = posts[0]
+        cls.position = Post.objects.order_by('-created_at', '-id').values_list('created_at', 'id')[500]
+
+    def plan_nodes(self, queryset):
+        plan = json.loads(queryset.explain(format='json'))[0]['Plan']
+        nodes = [plan]
+        for node in nodes:
+            nodes.extend(node.get('Plans', []))
+        return nodes
+
+    def assertUsesIndex(self, queryset, index_name):
+        nodes = self.plan_nodes(queryset)
+        node_types = [node['Node Type'] for node in nodes]
+        self.assertNotIn('Seq Scan', node_types, nodes)
+        self.assertFalse({'Sort', 'Incremental Sort'} & set(node_types), nodes)
+        self.assertIn(index_name, [node.get('Index Name') for node in nodes], nodes)
+
+    def test_author_posts_newest_first(self):
+        queryset = Post.objects.filter(author=self.author).order_by('-created_at', '-id')
+        self.assertUsesIndex(queryset[:200], 'posts_post_author_created')
+        self.assertUsesIndex(keyset_filter(queryset, self.position)[:11], 'posts_post_author_created')
+
+    def test_public_stream_page(self):
+        queryset = Post.objects.filter(privacy='public').order_by('-created_at', '-id')
+        self.assertUsesIndex(queryset[:11], 'posts_post_public_created')
+        self.assertUsesIndex(keyset_filter(queryset, self.position)[:11], 'posts_post_public_created')
+
+    def test_comment_page(self):
+        queryset = Comment.objects.filter(post_id=self.post_id).order_by('created_at', 'id')
+        self.assertUsesIndex(queryset[:6], 'posts_comment_post_created')
+
+    def test_author_followers(self):
+        queryset = Follow.objects.filter(following=self.author).values_list('follower_id', flat=True)
+        self.assertUsesIndex(queryset, 'posts_follow_following')
+
+    def test_author_timeline_entries(self):
+        # what deleting the author cascades to
+        self.assertUsesIndex(TimelineEntry.objects.filter(author=self.author), 'posts_timeline_author_user')
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class QueryBudgetTests(TestCase):
+    """Every route in posts/urls.py stays within its budget in posts/middleware.py, at every data size (no N+1)."""
+    SIZES = (2, 6)
+    PASSWORD = 'passworD1#'
+
+    def seed(self, size):
+        reader = User.objects.create_user(username=f'reader{size}', email=f'reader{size}@example.com', password=self.PASSWORD)
+        staff = User.objects.create(username=f'staff{size}', email=f'staff{size}@example.com', is_staff=True)
+        authors = [User.objects.create(username=f'author{size}_{i}', email=f'author{size}_{i}@example.com') for i in range(size)]
+        for author in authors:
+            Follow.objects.create(follower=reader, following=author)
+            for i in range(size):
+                post = Post.objects.create(author=author, content=f'Budget post {i}', privacy='private' if i % 2 else 'public')
+                Comment.objects.bulk_create([Comment(user=reader, post=post, content=f'Budget comment {j}') for j in range(size)])
+                Like.objects.create(user=reader, post=post)
+            Follow.objects.create(follower=author, following=reader)
+        Post.objects.update(comment_count=size, like_count=1)
+        timelines.rebuild_timeline(reader.id)
+        unliked = Post.objects.create(author=authors[0], content='Not liked yet', privacy='public')
+        return {
+            'reader': reader,
+            'staff': staff,
+            'post': Post.objects.filter(author=authors[0], privacy='public').first(),
+            'unliked': unliked,
+            'comment': Comment.objects.filter(user=reader).first(),
+            'follow': Follow.objects.filter(follower=reader).first(),
+            # batches grow with the data size, so they are checked for N+1 too
+            'batch_posts': [Post.objects.create(author=author, content='Batch post', privacy='public').id for author in authors],
+            'batch_users': [User.objects.create(username=f'new{size}_{i}', email=f'new{size}_{i}@example.com').id for i in range(size)],
+            'own_posts': [Post.objects.create(author=reader, content=f'Own post {i}', privacy='public') for i in range(2)],
+            'private': Post.objects.filter(author=authors[0], privacy='private').first(),
+            'stranger': User.objects.create(username=f'stranger{size}', email=f'stranger{size}@example.com'),
+            'new_username': f'signup{size}',
+        }
+
+    def route_requests(self, data):
+        """(url, payload, user) for one request to each (route name, method)."""
+        reader, staff, post, own = data['reader'], data['staff'], data['post'], data['own_posts']
+        return {
+            ('login', 'POST'): ('/posts/users/login/', {'identifier': reader.username, 'password': self.PASSWORD}, None),
+            ('protected', 'GET'): (reverse('protected'), None, reader),
+            ('admin', 'GET'): (reverse('admin'), None, staff),
+            ('cache-stats', 'GET'): (reverse('cache-stats'), None, staff),
+            ('feed', 'GET'): (reverse('feed'), None, reader),
+            ('feed-async', 'GET'): (reverse('feed-async'), None, reader),
+            ('user-list', 'GET'): ('/posts/users/', None, reader), # reverse('login'/'user-*') resolves to djoser's routes
+            ('user-list', 'POST'): ('/posts/users/', {'username': data['new_username'], 'email': f"{data['new_username']}@example.com", 'password': self.PASSWORD}, None),
+            ('user-detail', 'GET'): (f'/posts/users/{reader.id}/', None, staff),
+            ('user-detail', 'PATCH'): (f'/posts/users/{reader.id}/', {'email': f'changed.{reader.email}'}, staff),
+            ('user-detail-async', 'GET'): (reverse('user-detail-async', args=[reader.id]), None, staff),
+            ('post-list', 'GET'): (reverse('post-list'), None, reader),
+            ('post-list', 'POST'): (reverse('post-list'), {'content': 'New budget post', 'privacy': 'public'}, reader),
+            ('post-detail', 'GET'): (reverse('post-detail', args=[post.id]), None, reader),
+            ('post-detail', 'PATCH'): (reverse('post-detail', args=[own[0].id]), {'content': 'Edited budget post'}, reader),
+            ('post-detail', 'DELETE'): (reverse('post-detail', args=[own[1].id]), None, reader),
+            ('post-content', 'GET'): (reverse('post-content', args=[data['private'].id]), None, data['private'].author), # owner or admin only
+            ('post-comments', 'GET'): (reverse('post-comments', args=[post.id]), None, reader),
+            ('post-comments-async', 'GET'): (reverse('post-comments-async', args=[post.id]), None, reader),
+            ('post-like', 'POST'): (reverse('post-like', args=[data['unliked'].id]), None, reader),
+            ('post-unlike', 'POST'): (reverse('post-unlike', args=[post.id]), None, reader),
+            ('post-comment', 'POST'): (reverse('post-comment', args=[post.id]), {'content': 'Another comment'}, reader),
+            ('post-batch', 'GET'): (reverse('post-batch') + f"?ids={','.join(str(pk) for pk in data['batch_posts'])}", None, reader),
+            ('post-batch-like', 'POST'): (reverse('post-batch-like'), {'post_ids': data['batch_posts']}, reader),
+            ('post-batch-unlike', 'POST'): (reverse('post-batch-unlike'), {'post_ids': data['batch_posts']}, reader),
+            ('follow-batch', 'POST'): (reverse('follow-batch'), {'following_ids': data['batch_users']}, reader),
+            ('comment-list', 'GET'): (reverse('comment-list'), None, reader),
+            ('comment-detail', 'GET'): (reverse('comment-detail', args=[data['comment'].id]), None, reader),
+            ('comment-detail', 'PATCH'): (reverse('comment-detail', args=[data['comment'].id]), {'content': 'Edited comment'}, reader),
+            ('follow-list', 'GET'): (reverse('follow-list'), None, reader),
+            ('follow-list', 'POST'): (reverse('follow-list'), {'following': data['stranger'].id}, reader),
+            ('follow-detail', 'GET'): (reverse('follow-detail', args=[data['follow'].id]), None, reader),
+            # deletions last: the requests above still use these rows
+            ('comment-detail', 'DELETE'): (reverse('comment-detail', args=[data['comment'].id]), None, reader),
+            ('follow-detail', 'DELETE'): (reverse('follow-detail', args=[data['follow'].id]), None, reader),
+            ('user-detail', 'DELETE'): (f"/posts/users/{data['stranger'].id}/", None, staff),
+        }
+
+    def count_queries(self, method, url, payload, user):
+        cache.clear() # measure the cache-miss path
+        client = APIClient()
+        if user is not None: # a token as issued by login, so the authentication cost is counted as in production
+            client.credentials(HTTP_AUTHORIZATION=f'Bearer {authentication.token_for(user).access_token}')
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(client, method.lower())(url, payload, format='json')
+        # cache-stats answers 404 on the locmem cache used here; anything else must be a successful response
+        self.assertTrue(response.status_code < 400 or url == reverse('cache-stats'), f'{method} {url}: {response.status_code}')
+        # Outside the test's transaction, the views' atomic blocks begin and commit without savepoint statements
+        return len([query for query in queries if not query['sql'].startswith(('SAVEPOINT', 'RELEASE SAVEPOINT'))])
+
+    def test_routes_stay_within_budget_at_every_size(self):
+        counts = {}
+        for size in self.SIZES:
+            data = self.seed(size)
+            for (route, method), (url, payload, user) in self.route_requests(data).items():
+                counts.setdefault((route, method), []).append(self.count_queries(method, url, payload, user))
+        for (route, method), route_counts in counts.items():
+            with self.subTest(route=route, method=method, counts=route_counts):
+                self.assertEqual(len(set(route_counts)), 1, f'{method} {route} runs more queries on more data (N+1)')
+                self.assertLessEqual(max(route_counts), query_budget(route, method))
+
+    def test_middleware_reports_requests_over_budget(self):
+        data = self.seed(2)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(data["reader"])}')
+        with mock.patch.dict('posts.middleware.QUERY_BUDGETS', {('post-list', 'GET'): 1}), \
+                mock.patch('posts.middleware.QUERY_BUDGET_HEADERS', True), \
+                self.assertLogs('posts.middleware', 'WARNING') as logs:
+            response = client.get(reverse('post-list'))
+        self.assertEqual(response['X-Query-Budget'], '1')
+        self.assertGreater(int(response['X-Query-Count']), 1)
+        self.assertIn('db;dur=', response['Server-Timing'])
+        self.assertIn('Query budget exceeded on post-list', logs.output[0])
+
+    def test_every_route_and_budget_has_a_check(self):
+        from .urls import urlpatterns
+        routes = {pattern.name for pattern in urlpatterns if pattern.name} - {'api-root'}
+        data = dict.fromkeys(['reader', 'staff', 'post', 'unliked', 'comment', 'follow', 'private', 'stranger'], mock.Mock(id=1))
+        data.update(batch_posts=[1], batch_users=[1], own_posts=[mock.Mock(id=1)] * 2, new_username='signup')
+        checked = set(self.route_requests(data))
+        self.assertEqual(routes - {route for route, method in checked}, set())
+        self.assertEqual(set(QUERY_BUDGETS) - checked, set())
+
+
+class CommentPreviewTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='reader', email='reader@example.com', password='password1')
+        self.client.force_authenticate(user=self.user)
+
+    def seed_posts(self, count, comments_per_post):
+        for i in range(count):
+            post = Post.objects.create(author=self.user, content=f'Preview post {i}', comment_count=comments_per_post)
+            Comment.objects.bulk_create([Comment(user=self.user, post=post, content=f'Comment {j}') for j in range(comments_per_post)])
+
+    def test_list_embeds_the_latest_comments_and_the_total(self):
+        self.seed_posts(1, 8)
+        response = self.client.get(reverse('post-list'))
+        post = response.data['results'][0]
+        self.assertEqual(post['comment_count'], 8)
+        self.assertEqual([comment['content'] for comment in post['comments']], ['Comment 7', 'Comment 6', 'Comment 5'])
+
+    def test_preview_is_one_query_for_the_whole_page(self):
+        self.seed_posts(2, 2)
+        with CaptureQueriesContext(connection) as few:
+            self.client.get(reverse('post-list'))
+        self.seed_posts(6, 20)
+        self.client.force_authenticate(user=User.objects.get(pk=self.user.pk)) # a new request's user, roles unresolved
+        with CaptureQueriesContext(connection) as many:
+            response = self.client.get(reverse('post-list'))
+        self.assertEqual(len(many), len(few))
+        self.assertTrue(all(len(post['comments']) <= 3 for post in response.data['results']))
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class AuthzTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin_group = Group.objects.create(name='Admin')
+        self.user = User.objects.create(username='member', email='member@example.com', role='user')
+
+    def fresh_user(self):
+        return User.objects.get(pk=self.user.pk) # what the next request authenticates
+
+    def test_group_membership_is_cached_across_requests(self):
+        self.user.groups.add(self.admin_group)
+        self.assertTrue(authz.is_admin(self.fresh_user()))
+        user = self.fresh_user()
+        with self.assertNumQueries(0):
+            self.assertTrue(authz.is_admin(user))
+            self.assertTrue(authz.is_admin(user))
+
+    def test_staff_and_admin_role_need_no_group_lookup(self):
+        staff = User.objects.create(username='staff', email='staff@example.com', is_staff=True)
+        role_admin = User.objects.create(username='roleadmin', email='roleadmin@example.com', role='admin')
+        with self.assertNumQueries(0):
+            self.assertTrue(authz.is_admin(staff))
+            self.assertTrue(authz.is_admin(role_admin))
+
+    def test_membership_changes_invalidate_the_cache(self):
+        self.assertFalse(authz.is_admin(self.fresh_user()))
+        self.user.groups.add(self.admin_group)
+        self.assertTrue(authz.is_admin(self.fresh_user()))
+        self.admin_group.user_set.remove(self.user)
+        self.assertFalse(authz.is_admin(self.fresh_user()))
+        self.admin_group.user_set.add(self.user)
+        self.assertTrue(authz.is_admin(self.fresh_user()))
+        self.admin_group.name = 'Former admins'
+        self.admin_group.save()
+        self.assertFalse(authz.is_admin(self.fresh_user()))
+
+    def test_assign_roles_grants_admin_rights(self):
+        admin = User.objects.create(username='admin', email='admin@example.com', role='user')
+        self.assertFalse(authz.is_admin(admin))
+        call_command('assign_roles', stdout=StringIO())
+        self.assertTrue(authz.is_admin(User.objects.get(pk=admin.pk)))
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ClaimsAuthenticationTests(TestCase):
+    PASSWORD = 'passworD1#'
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='claims', email='claims@example.com', password=self.PASSWORD, role='user')
+        self.client = APIClient()
+
+    def login(self):
+        response = self.client.post('/posts/users/login/', {'identifier': 'claims', 'password': self.PASSWORD}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def test_authenticated_requests_run_no_user_query(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.login()['access']}")
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('protected'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_claims_user_works_as_the_model(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.login()['access']}")
+        response = self.client.post(reverse('post-list'), {'content': 'Written by a claims user'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Post.objects.get(pk=response.data['id']).author, self.user)
+
+    def test_other_fields_load_from_the_cached_row(self):
+        access = self.login()['access']
+        authenticator = authentication.ClaimsJWTAuthentication()
+        user = authenticator.get_user(authenticator.get_validated_token(access))
+        with self.assertNumQueries(1):
+            self.assertEqual(user.email, 'claims@example.com')
+        user = authenticator.get_user(authenticator.get_validated_token(access))
+        with self.assertNumQueries(0):
+            self.assertEqual(user.email, 'claims@example.com')
+            self.assertEqual(user.follower_count, 0)
+
+        User.objects.filter(pk=self.user.pk).update(email='changed@example.com')
+        self.user.save() # saving the user drops the cached row
+        user = authenticator.get_user(authenticator.get_validated_token(access))
+        self.assertEqual(user.email, 'claims@example.com')
+
+    def test_tokens_without_claims_still_authenticate(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('protected'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_deactivated_and_deleted_users_are_rejected(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.login()['access']}")
+        self.user.is_active = False
+        self.user.save()
+        response = self.client.get(reverse('protected'))
+        self.assertEqual((response.status_code, response.data['detail'].code), (status.HTTP_401_UNAUTHORIZED, 'user_inactive'))
+        self.user.delete()
+        response = self.client.get(reverse('protected'))
+        self.assertEqual((response.status_code, response.data['detail'].code), (status.HTTP_401_UNAUTHORIZED, 'user_not_found'))
+
+    def test_demoted_staff_must_refresh(self):
+        self.user.is_staff = True
+        self.user.save()
+        tokens = self.login()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {tokens['access']}")
+        self.assertEqual(self.client.get(reverse('protected')).status_code, status.HTTP_200_OK)
+        self.user.is_staff = False
+        self.user.save()
+        response = self.client.get(reverse('protected'))
+        self.assertEqual((response.status_code, response.data['detail'].code), (status.HTTP_401_UNAUTHORIZED, 'claims_outdated'))
+
+        response = self.client.post('/auth/jwt/refresh/', {'refresh': tokens['refresh']}, format='json')
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {response.data['access']}")
+        self.assertEqual(self.client.get(reverse('protected')).status_code, status.HTTP_200_OK)
+
+    def test_missing_stamp_is_read_from_the_database(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.login()['access']}")
+        User.objects.filter(pk=self.user.pk).update(is_active=False) # no signal
+        cache.clear()
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('protected'))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_refresh_reissues_the_claims(self):
+        refresh = self.login()['refresh']
+        User.objects.filter(pk=self.user.pk).update(role='admin')
+        response = self.client.post('/auth/jwt/refresh/', {'refresh': refresh}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(AccessToken(response.data['access'])['role'], 'admin')
+
+
+class LoginPathTests(TestCase):
+    PASSWORD = 'passworD1#'
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='shape', email='shape@example.com', password=self.PASSWORD)
+
+    def login(self, identifier, password=PASSWORD):
+        return APIClient().post('/posts/users/login/', {'identifier': identifier, 'password': password}, format='json')
+
+    def test_identifier_shape_picks_one_indexed_column(self):
+        for identifier, column in (('shape@example.com', '"email"'), ('shape', '"username"')):
+            with self.subTest(identifier=identifier), CaptureQueriesContext(connection) as queries:
+                self.assertEqual(self.login(identifier).status_code, status.HTTP_200_OK)
+            lookups = [query['sql'] for query in queries if query['sql'].startswith('SELECT') and 'FROM "posts_user"' in query['sql']]
+            self.assertEqual(len(lookups), 1)
+            self.assertIn(f'"posts_user".{column} =', lookups[0])
+            self.assertNotIn(' OR ', lookups[0])
+
+    def test_usernames_with_an_at_sign_still_log_in(self):
+        User.objects.create_user(username='at@home', email='athome@example.com', password=self.PASSWORD)
+        self.assertEqual(self.login('at@home').status_code, status.HTTP_200_OK)
+
+    def test_failed_logins_verify_the_password_once(self):
+        with mock.patch.object(TunableArgon2PasswordHasher, 'verify', autospec=True, return_value=False) as verify:
+            self.assertEqual(self.login('shape@example.com', 'wrong-password').status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(verify.call_count, 1) # not once more in each following authentication backend
+        self.assertEqual(self.login('nobody@example.com').status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_login_rehashes_passwords_with_outdated_parameters(self):
+        with mock.patch.object(TunableArgon2PasswordHasher, 'time_cost', 1):
+            self.user.set_password(self.PASSWORD)
+            self.user.save()
+        self.assertIn('t=1,', self.user.password)
+        self.assertEqual(self.login('shape').status_code, status.HTTP_200_OK)
+        self.user.refresh_from_db()
+        self.assertIn(f't={TunableArgon2PasswordHasher.time_cost},', self.user.password)
+        self.assertEqual(self.login('shape').status_code, status.HTTP_200_OK)
+
+    def test_benchmark_reports_throughput_and_cleans_up(self):
+        out = StringIO()
+        call_command('benchmark_login', '--users', '2', '--logins', '3', '--concurrency', '1', '--target-rate', '10', stdout=out)
+        self.assertIn('logins/s', out.getvalue())
+        self.assertIn('workers', out.getvalue())
+        self.assertFalse(User.objects.filter(username__startswith='loginbench_').exists())
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class BatchEndpointTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.reader = User.objects.create(username='batcher', email='batcher@example.com')
+        self.authors = [User.objects.create(username=f'author{i}', email=f'author{i}@example.com') for i in range(3)]
+        self.posts = [Post.objects.create(author=author, content=f'Public post {i}') for i, author in enumerate(self.authors)]
+        self.hidden = Post.objects.create(author=self.authors[0], content='Private post', privacy='private')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.reader)
+
+    def test_batch_fetch_keeps_the_order_and_lists_missing_posts(self):
+        ids = [self.posts[2].id, self.hidden.id, self.posts[0].id, 999999]
+        response = self.client.get(reverse('post-batch') + '?ids=' + ','.join(map(str, ids)))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([post['id'] for post in response.data['results']], [self.posts[2].id, self.posts[0].id])
+        self.assertEqual(response.data['missing'], [self.hidden.id, 999999])
+
+    def test_batch_like_and_unlike(self):
+        Like.objects.create(user=self.reader, post=self.posts[0])
+        ids = [post.id for post in self.posts] + [self.hidden.id]
+        response = self.client.post(reverse('post-batch-like'), {'post_ids': ids}, format='json')
+        self.assertEqual(response.data, {'liked': ids[1:3], 'already_liked': ids[:1], 'not_found': [self.hidden.id]})
+        self.assertEqual(Like.objects.filter(user=self.reader).count(), 3)
+        self.assertEqual(list(Post.objects.filter(pk__in=ids[1:3]).values_list('like_count', flat=True)), [1, 1])
+        # One feed invalidation job per author of a newly liked post, however many posts were liked
+        self.assertEqual(
+            set(Job.objects.filter(kind=jobs.INVALIDATE_FOLLOWERS).values_list('key', flat=True)),
+            {str(self.authors[1].id), str(self.authors[2].id)},
+        )
+
+        response = self.client.post(reverse('post-batch-unlike'), {'post_ids': ids[1:]}, format='json')
+        self.assertEqual(response.data, {'unliked': ids[1:3], 'not_liked': [self.hidden.id]})
+        self.assertEqual(list(Like.objects.filter(user=self.reader).values_list('post_id', flat=True)), ids[:1])
+        self.assertEqual(list(Post.objects.filter(pk__in=ids[1:3]).values_list('like_count', flat=True)), [0, 0])
+
+    def test_batch_follow(self):
+        Follow.objects.create(follower=self.reader, following=self.authors[0])
+        ids = [author.id for author in self.authors] + [self.reader.id]
+        response = self.client.post(reverse('follow-batch'), {'following_ids': ids}, format='json')
+        self.assertEqual(response.data, {'followed': ids[1:3], 'already_following': ids[:1], 'not_found': [self.reader.id]})
+        self.assertEqual(list(User.objects.filter(pk__in=ids[1:3]).values_list('follower_count', flat=True)), [1, 1])
+        self.assertEqual(
+            set(TimelineEntry.objects.filter(user=self.reader).values_list('post_id', flat=True)),
+            {self.posts[1].id, self.posts[2].id},
+        )
+        # The cached follows were dropped, so the newly followed authors' private posts are visible right away
+        self.assertEqual(set(visibility.visible_author_ids(self.reader)), {self.reader.id, *ids[:3]})
+
+    def test_batch_follow_counts_only_the_rows_it_inserted(self):
+        bulk_create = Follow.objects.bulk_create
+
+        def racing_bulk_create(follows, **kwargs):
+            Follow.objects.create(follower=self.reader, following=self.authors[1]) # a concurrent follow commits first
+            return bulk_create(follows, **kwargs)
+        ids = [author.id for author in self.authors[:2]]
+        with mock.patch.object(Follow.objects, 'bulk_create', side_effect=racing_bulk_create):
+            response = self.client.post(reverse('follow-batch'), {'following_ids': ids}, format='json')
+        self.assertEqual((response.data['followed'], response.data['already_following']), (ids[:1], ids[1:]))
+        self.assertEqual(list(User.objects.filter(pk__in=ids).order_by('pk').values_list('follower_count', flat=True)), [1, 0])
+
+    def test_batch_requests_are_validated(self):
+        too_many = list(range(1, 102))
+        self.assertEqual(self.client.post(reverse('post-batch-like'), {'post_ids': too_many}, format='json').status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.post(reverse('follow-batch'), {'following_ids': ['x']}, format='json').status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get(reverse('post-batch')).status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class FakeLikeRedis:
+    """The commands and scripts of the like engine, on dicts; replies are bytes like redis-py's."""
+
+    def __init__(self):
+        self.sets = {}
+        self.hashes = {}
+        self.strings = {}
+
+    def pipeline(self, transaction=True):
+        redis = self
+
+        class Pipeline:
+            def __init__(self):
+                self.calls = []
+
+            def __getattr__(self, name):
+                return lambda *args: self.calls.append((getattr(redis, name), args))
+
+            def execute(self):
+                return [method(*args) for method, args in self.calls]
+
+        return Pipeline()
+
+    def register_script(self, source):
+        run = {likes.RECORD_SCRIPT: self.record_script, likes.LOAD_SCRIPT: self.load_script}[source]
+
+        def script(keys, args, client=None):
+            if client is not None:
+                return client.calls.append((run, (keys, [str(arg).encode() for arg in args])))
+            return run(keys, [str(arg).encode() for arg in args])
+        return script
+
+    def record_script(self, keys, args):
+        user_id, liked, _, *post_ids = args
+        missing = [i for i, key in enumerate(keys[1::2], start=1) if not self.exists(key)]
+        if missing:
+            return [0, *missing]
+        results = [1]
+        for users_key, pending_key, post_id in zip(keys[1::2], keys[2::2], post_ids):
+            results.append((self.sadd if liked == b'1' else self.srem)(users_key, user_id.decode()))
+            self.hset(pending_key, user_id.decode(), liked.decode())
+            self.sadd(keys[0], post_id.decode())
+            results.append(self.scard(users_key) - 1)
+        return results
+
+    def load_script(self, keys, args):
+        users_key, pending_key, flushing_key, flushes_key = keys
+        if self.exists(users_key):
+            return 1
+        if self.strings.get(flushes_key, b'0') != args[0]:
+            return 0
+        self.sadd(users_key, *(arg.decode() for arg in args[2:]))
+        for key in (flushing_key, pending_key):
+            for user_id, liked in self.hgetall(key).items():
+                (self.sadd if liked == b'1' else self.srem)(users_key, user_id.decode())
+        return 1
+
+    def exists(self, key):
+        return int(bool(self.sets.get(key) or self.hashes.get(key)))
+
+    def get(self, key):
+        return self.strings.get(key)
+
+    def incr(self, key):
+        self.strings[key] = str(int(self.strings.get(key, 0)) + 1).encode()
+
+    def sadd(self, key, *members):
+        members = {str(member).encode() for member in members}
+        added = len(members - self.sets.setdefault(key, set()))
+        self.sets[key] |= members
+        return added
+
+    def srem(self, key, *members):
+        members = {str(member).encode() for member in members}
+        removed = len(members & self.sets.get(key, set()))
+        self.sets[key] = self.sets.get(key, set()) - members
+        return removed
+
+    def scard(self, key):
+        return len(self.sets.get(key, ()))
+
+    def smembers(self, key):
+        return set(self.sets.get(key, ()))
+
+    def srandmember(self, key, count):
+        return sorted(self.sets.get(key, ()))[:count]
+
+    def smove(self, source, destination, member):
+        if str(member).encode() not in self.sets.get(source, ()):
+            return 0
+        self.srem(source, member)
+        return self.sadd(destination, member)
+
+    def hset(self, key, field, value):
+        self.hashes.setdefault(key, {})[str(field).encode()] = str(value).encode()
+
+    def hgetall(self, key):
+        return dict(self.hashes.get(key, {}))
+
+    def rename(self, source, destination):
+        self.hashes[destination] = self.hashes.pop(source)
+
+    def delete(self, *keys):
+        return sum(self.hashes.pop(key, None) is not None or self.sets.pop(key, None) is not None for key in keys)
+
+    def expire(self, key, seconds):
+        return 1
+
+
+class LikeEngineTests(TestCase):
+    def setUp(self):
+        self.redis = FakeLikeRedis()
+        patcher = mock.patch('posts.likes.get_redis', return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.author = User.objects.create(username='hot', email='hot@example.com')
+        self.post = Post.objects.create(author=self.author, content='A viral post')
+        self.fans = [User.objects.create(username=f'fan{i}', email=f'fan{i}@example.com') for i in range(5)]
+
+    def like(self, user, action='post-like'):
+        client = APIClient()
+        client.force_authenticate(user=user)
+        return client.post(reverse(action, args=[self.post.id]))
+
+    def flush(self):
+        call_command('flush_likes', '--once', stdout=StringIO())
+        self.post.refresh_from_db()
+
+    def test_likes_are_buffered_and_flushed_in_bulk(self):
+        for i, fan in enumerate(self.fans):
+            response = self.like(fan)
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+            self.assertEqual(response.data['like_count'], i + 1)
+        self.assertEqual(self.like(self.fans[0]).status_code, status.HTTP_400_BAD_REQUEST) # answered by Redis
+        self.assertFalse(Like.objects.exists())
+
+        self.flush()
+        self.assertEqual(Like.objects.filter(post=self.post).count(), 5)
+        self.assertEqual(self.post.like_count, 5)
+        self.assertEqual(list(Job.objects.filter(kind=jobs.INVALIDATE_FOLLOWERS).values_list('key', flat=True)), [str(self.author.id)])
+
+    def test_existing_likes_are_loaded_from_the_database(self):
+        Like.objects.create(user=self.fans[0], post=self.post)
+        self.assertEqual(self.like(self.fans[0]).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.like(self.fans[1]).data['like_count'], 2)
+        response = self.like(self.fans[0], 'post-unlike')
+        self.assertEqual((response.status_code, response.data['like_count']), (status.HTTP_200_OK, 1))
+
+        self.flush()
+        self.assertEqual(list(Like.objects.values_list('user_id', flat=True)), [self.fans[1].id])
+        self.assertEqual(self.post.like_count, 1)
+
+    def test_last_intent_wins(self):
+        self.like(self.fans[0])
+        self.like(self.fans[0], 'post-unlike')
+        self.like(self.fans[1], 'post-unlike') # never liked
+        self.flush()
+        self.assertFalse(Like.objects.exists())
+        self.assertEqual(self.post.like_count, 0)
+
+    def test_failed_flush_keeps_the_intents(self):
+        self.like(self.fans[0])
+        with mock.patch('posts.likes._apply', side_effect=RuntimeError('database down')), self.assertRaises(RuntimeError):
+            likes.flush()
+        self.assertEqual(self.redis.hgetall(f'likes:{self.post.id}:flushing'), {str(self.fans[0].id).encode(): b'1'})
+        self.like(self.fans[1]) # arrives while the first intent is still claimed
+        self.flush()
+        self.assertEqual(set(Like.objects.values_list('user_id', flat=True)), {self.fans[0].id, self.fans[1].id})
+        self.assertEqual(self.redis.hashes, {})
+
+    def test_expired_set_is_reloaded_before_recording(self):
+        Like.objects.create(user=self.fans[0], post=self.post)
+        load = likes._load
+
+        def load_then_expire(redis, post_ids):
+            load(redis, post_ids)
+            if load_then_expire.first:
+                load_then_expire.first = False
+                redis.sets.pop(f'likes:{self.post.id}:users') # evicted or expired before the like is recorded
+        load_then_expire.first = True
+        with mock.patch('posts.likes._load', side_effect=load_then_expire):
+            self.assertEqual(self.like(self.fans[1]).data['like_count'], 2)
+        self.assertEqual(self.like(self.fans[0]).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_load_racing_a_flush_rereads_the_likers(self):
+        Like.objects.create(user=self.fans[0], post=self.post)
+        with mock.patch.object(self.redis, 'get', side_effect=[b'-1', None]): # a flush committed after the read
+            self.assertEqual(self.like(self.fans[1]).data['like_count'], 2)
+
+    def test_writes_during_an_outage_drop_the_like_sets(self):
+        self.like(self.fans[0])
+        self.flush()
+        with mock.patch('posts.likes._record', side_effect=RedisConnectionError('timed out')):
+            self.assertEqual(self.like(self.fans[0], 'post-unlike').status_code, status.HTTP_200_OK)
+        self.assertFalse(Like.objects.exists())
+        self.assertEqual(self.like(self.fans[0]).status_code, status.HTTP_201_CREATED) # reloaded from the table
+
+    def test_like_sets_are_dropped_once_redis_is_back(self):
+        self.like(self.fans[0])
+        self.flush()
+        with mock.patch('posts.likes._record', side_effect=RedisConnectionError('down')), \
+                mock.patch.object(self.redis, 'pipeline', side_effect=RedisConnectionError('down')):
+            self.like(self.fans[0], 'post-unlike')
+        self.assertEqual(list(Job.objects.filter(kind=jobs.FORGET_LIKE_SETS).values_list('key', flat=True)), [str(self.post.id)])
+        run_jobs()
+        self.assertEqual(self.redis.scard(f'likes:{self.post.id}:users'), 0)
+        self.assertEqual(self.like(self.fans[0]).data['like_count'], 1)
+
+    def test_database_path_without_redis(self):
+        with mock.patch('posts.likes.get_redis', side_effect=NotImplementedError):
+            self.assertEqual(self.like(self.fans[0]).status_code, status.HTTP_201_CREATED)
+            self.assertEqual(self.like(self.fans[0]).status_code, status.HTTP_400_BAD_REQUEST)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.like_count, 1)
+
+
+class LoadDataGeneratorTests(TestCase):
+    def generate(self, prefix, seed=7):
+        call_command(
+            'generate_load_data', '--users', '40', '--posts', '80', '--comments', '120', '--likes', '200',
+            '--follows', '150', '--seed', str(seed), '--prefix', prefix, '--batch-size', '50', stdout=StringIO(),
+        )
+        users = User.objects.filter(username__startswith=f'{prefix}_')
+        return users, Post.objects.filter(author__in=users)
+
+    def test_generates_requested_volumes_with_consistent_counters(self):
+        users, posts = self.generate('bench')
+        self.assertEqual(users.count(), 40)
+        self.assertEqual(posts.count(), 80)
+        self.assertEqual(Follow.objects.filter(follower__in=users).count(), 150)
+        self.assertEqual(Comment.objects.filter(post__in=posts).count(), 120)
+        self.assertEqual(Like.objects.filter(post__in=posts).count(), 200)
+        self.assertFalse(Follow.objects.filter(follower=F('following')).exists())
+        self.assertEqual(counters.reconcile(), (0, 0)) # denormalized counters written with the rows
+        self.assertTrue(all(post.created_at <= timezone.now() for post in posts))
+
+    def test_keeps_the_generated_timestamps(self):
+        _, posts = self.generate('dated')
+        self.assertGreater(posts.aggregate(span=Max('created_at') - Min('created_at'))['span'], timedelta(days=1))
+        self.assertTrue(Post._meta.get_field('created_at').auto_now_add) # model fields are left alone
+
+    def test_follower_counts_follow_a_power_law(self):
+        users, _ = self.generate('skewed')
+        follower_counts = sorted(users.values_list('follower_count', flat=True), reverse=True)
+        self.assertGreater(follower_counts[0], 5 * follower_counts[len(follower_counts) // 2])
+
+    def test_same_seed_same_dataset(self):
+        def shape(prefix):
+            users, _ = self.generate(prefix)
+            return sorted(
+                (follow.follower.username.split('_')[1], follow.following.username.split('_')[1])
+                for follow in Follow.objects.filter(follower__in=users).select_related('follower', 'following')
+            )
+        self.assertEqual(shape('first'), shape('second'))
+
+    def test_refuses_to_reuse_a_prefix(self):
+        self.generate('taken')
+        with self.assertRaises(CommandError):
+            self.generate('taken')
+
+
+@override_settings(DATABASE_REPLICAS=['replica'], CACHES=LOCMEM_CACHES)
+class ReplicaRoutingTests(TransactionTestCase):
+    """Two local databases standing in for a primary and a lagging replica (TestCase's open transaction would pin every read)."""
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='staff', email='staff@example.com', is_staff=True)
+        self.post = Post.objects.create(author=self.user, content='On the primary')
+        # The replica has the same rows, but has not caught up with the latest edit yet
+        User.objects.using('replica').create(id=self.user.id, username='staff', email='staff@example.com', is_staff=True)
+        Post.objects.using('replica').create(id=self.post.id, author_id=self.user.id, content='On the replica')
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+
+    def content(self):
+        response = self.client.get(reverse('post-content', args=[self.post.id]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data['content']
+
+    def test_reads_go_to_the_replica(self):
+        self.assertEqual(self.content(), 'On the replica')
+
+    def test_reads_stick_to_the_primary_after_a_write(self):
+        response = self.client.post(reverse('post-comment', args=[self.post.id]), {'content': 'Hello'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Comment.objects.using('replica').count(), 0) # writes only ever go to the primary
+        self.client.cookies.clear() # a client that does not keep cookies is pinned by user
+        self.assertEqual(self.content(), 'On the primary')
+
+        cache.delete(f'db_primary_pin:{self.user.id}') # REPLICA_STICKY_SECONDS elapsed
+        self.assertEqual(self.content(), 'On the replica')
+
+    def test_failed_writes_do_not_pin(self):
+        response = self.client.post(reverse('post-comment', args=[self.post.id]), {}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.content(), 'On the replica')
+
+    @override_settings(CACHES=LOCMEM_CACHES)
+    def test_token_authenticated_writers_read_their_writes(self):
+        token = Token.objects.create(user=self.user)
+        Token.objects.using('replica').create(key=token.key, user_id=self.user.id, created=token.created)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        response = self.client.post(reverse('post-comment', args=[self.post.id]), {'content': 'Hello'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.client.cookies.clear()
+        self.assertEqual(self.content(), 'On the primary')
+
+    def test_writes_pin_their_client_by_cookie(self):
+        response = self.client.post(reverse('post-comment', args=[self.post.id]), {'content': 'Hello'}, format='json')
+        self.assertEqual(response.cookies[db_router.REPLICA_STICKY_COOKIE]['max-age'], db_router.REPLICA_STICKY_SECONDS)
+        cache.delete(f'db_primary_pin:{self.user.id}')
+        self.assertEqual(self.content(), 'On the primary')
+
+        del self.client.cookies[db_router.REPLICA_STICKY_COOKIE] # expired
+        self.assertEqual(self.content(), 'On the replica')
+
+    @override_settings(CACHES=LOCMEM_CACHES)
+    def test_cache_rebuilds_follow_the_request(self):
+        content = lambda: Post.objects.get(pk=self.post.pk).content
+        for use_primary, expected in ((False, 'On the replica'), (True, 'On the primary')):
+            token = db_router.start_request(use_primary=use_primary)
+            try:
+                self.assertEqual(caching.cached(f'replica-test:{use_primary}', content, 60), expected)
+            finally:
+                db_router.end_request(token)
+
+    def test_router_uses_the_primary_outside_requests_transactions_and_after_writes(self):
+        router = db_router.PrimaryReplicaRouter()
+        self.assertEqual(router.db_for_read(Post), 'default') # management commands, job worker
+        token = db_router.start_request(use_primary=False)
+        try:
+            self.assertEqual(router.db_for_read(Post), 'replica')
+            with transaction.atomic():
+                self.assertEqual(router.db_for_read(Post), 'default')
+            self.assertEqual(router.db_for_write(Post), 'default')
+            self.assertEqual(router.db_for_read(Post), 'default') # read back our own write
+        finally:
+            db_router.end_request(token)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class AsyncViewTests(TestCase):
+    """The async twins answer exactly like the DRF views, and run their independent lookups concurrently."""
+
+    def setUp(self):
+        cache.clear()
+        self.reader = User.objects.create(username='reader', email='reader@example.com')
+        self.staff = User.objects.create(username='staff', email='staff@example.com', is_staff=True)
+        self.author = User.objects.create(username='author', email='author@example.com')
+        self.stranger = User.objects.create(username='stranger', email='stranger@example.com')
+        Follow.objects.create(follower=self.reader, following=self.author)
+        for i in range(3):
+            post = Post.objects.create(author=self.author, content=f'Followed post {i}', privacy='private')
+            Comment.objects.bulk_create([Comment(user=self.reader, post=post, content=f'Comment {j}') for j in range(3)])
+        self.secret = Post.objects.create(author=self.stranger, content='Not for the reader', privacy='private')
+        self.public = Post.objects.create(author=self.stranger, content='For everyone', privacy='public')
+        timelines.rebuild_timeline(self.reader.id)
+        self.post = Post.objects.filter(author=self.author).first()
+        # Issuing a token writes to the database, which async tests may not do directly
+        self.tokens = {user.id: authentication.token_for(user).access_token for user in (self.reader, self.staff)}
+
+    def headers(self, user):
+        return {'Authorization': f'Bearer {self.tokens[user.id]}'} if user else {}
+
+    def sync_get(self, url, user):
+        cache.clear()
+        return self.client.get(url, headers=self.headers(user))
+
+    async def async_get(self, url, user):
+        await cache.aclear()
+        return await self.async_client.get(url, headers=self.headers(user))
+
+    async def assert_same(self, sync_url, async_url, user, expected_status=status.HTTP_200_OK):
+        sync_response = await sync_to_async(self.sync_get)(sync_url, user)
+        async_response = await self.async_get(async_url, user)
+        self.assertEqual((sync_response.status_code, async_response.status_code), (expected_status, expected_status))
+        # Same body, except that pagination links point back at the async route
+        self.assertEqual(json.loads(async_response.content.replace(b'/async/', b'/')), json.loads(sync_response.content))
+        return async_response
+
+    async def test_feed_matches_the_sync_view(self):
+        for query in ('', '?page_size=2&page=2', '?cursor=&page_size=2', '?filter=followed', '?filter=liked'):
+            with self.subTest(query=query):
+                await self.assert_same(reverse('feed') + query, reverse('feed-async') + query, self.reader)
+        response = await self.assert_same(reverse('feed'), reverse('feed-async'), None, status.HTTP_401_UNAUTHORIZED)
+        self.assertIn('Bearer', response['WWW-Authenticate'])
+
+    async def test_comments_match_the_sync_view_and_its_visibility_rules(self):
+        cases = [
+            (self.post, self.reader, status.HTTP_200_OK), # private post of a followed author
+            (self.secret, self.reader, status.HTTP_404_NOT_FOUND),
+            (self.secret, self.staff, status.HTTP_200_OK),
+            (self.public, None, status.HTTP_200_OK),
+            (self.post, None, status.HTTP_404_NOT_FOUND),
+        ]
+        for post, user, expected in cases:
+            with self.subTest(post=post.content, user=user and user.username):
+                await self.assert_same(
+                    reverse('post-comments', args=[post.id]) + '?page_size=2',
+                    reverse('post-comments-async', args=[post.id]) + '?page_size=2',
+                    user, expected,
+                )
+
+    async def test_user_detail_matches_the_sync_view(self):
+        await self.assert_same(f'/posts/users/{self.reader.id}/', reverse('user-detail-async', args=[self.reader.id]), self.staff)
+        self.assertEqual((await cache.aget(f'user_{self.reader.id}'))['value']['username'], 'reader') # same entry as the sync view
+        await self.assert_same(f'/posts/users/{self.reader.id}/', reverse('user-detail-async', args=[self.reader.id]), self.reader, status.HTTP_403_FORBIDDEN)
+        await self.assert_same('/posts/users/999999/', reverse('user-detail-async', args=[999999]), self.staff, status.HTTP_404_NOT_FOUND)
+        await self.assert_same('/posts/users/999999/', reverse('user-detail-async', args=[999999]), self.reader, status.HTTP_404_NOT_FOUND)
+
+    async def test_user_detail_checks_the_permission_before_loading(self):
+        with mock.patch('posts.async_views.user_profile', side_effect=AssertionError('loaded')):
+            response = await self.async_client.get(reverse('user-detail-async', args=[self.staff.id]), headers=self.headers(self.reader))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertIsNone(await cache.aget(f'user_{self.staff.id}'))
+
+    async def test_cached_pages_are_not_rebuilt(self):
+        url = reverse('feed-async')
+        first = await self.async_client.get(url, headers=self.headers(self.reader))
+        with mock.patch('posts.async_views.build_feed_page', side_effect=AssertionError('rebuilt')):
+            second = await self.async_client.get(url, headers=self.headers(self.reader))
+        self.assertEqual((second.status_code, second.content), (status.HTTP_200_OK, first.content))
+
+    async def test_feed_key_lookups_run_concurrently(self):
+        started = []
+        both_started = asyncio.Event()
+        def waits_for_the_other(name, result):
+            async def lookup(*args):
+                started.append(name)
+                if len(started) == 2:
+                    both_started.set()
+                await asyncio.wait_for(both_started.wait(), 1) # would time out if awaited one after the other
+                return result
+            return lookup
+        with mock.patch('posts.caching.aget_generation', waits_for_the_other('generation', 7)):
+            key = await caching.afeed_cache_key(self.reader.id, None, '1:None', waits_for_the_other('followees', [])())
+        self.assertEqual(key, f'feed_data:{self.reader.id}:7:None:1:None')
+
+    async def test_polls_get_a_304_from_the_version_stamps(self):
+        for url in (reverse('feed-async'), reverse('post-comments-async', args=[self.post.id])):
+            with self.subTest(url=url):
+                response = await self.async_client.get(url, headers=self.headers(self.reader))
+                self.assertIn('ETag', response)
+                with mock.patch('posts.async_views.visible_post', side_effect=AssertionError('post read')):
+                    response = await self.async_client.get(url, headers={**self.headers(self.reader), 'If-None-Match': response['ETag']})
+                self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_middleware_chain_is_async_end_to_end(self):
+        # Django logs an adaptation for every sync-only middleware, which would put each async request on a thread
+        with self.assertNoLogs('django.request', 'DEBUG'):
+            ASGIHandler()
+
+
+class LeanPipelineTests(TestCase):
+    def setUp(self):
+        self.session_requests = mock.patch.object(SessionMiddleware, 'process_request', autospec=True, side_effect=SessionMiddleware.process_request).start()
+        self.addCleanup(mock.patch.stopall)
+
+    def test_api_routes_skip_the_browser_stack(self):
+        response = self.client.get(reverse('protected'))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.session_requests.assert_not_called()
+        self.assertIn('Access-Control-Allow-Origin', self.client.get(reverse('protected'), headers={'Origin': 'http://localhost:5173'}))
+
+        self.client.get('/accounts/login/') # allauth's pages keep sessions, CSRF and messages
+        self.session_requests.assert_called_once()
+
+    @override_settings(LEAN_API_PREFIXES=[])
+    def test_no_prefixes_run_the_full_stack(self):
+        self.client.get(reverse('protected'))
+        self.session_requests.assert_called_once()
+
+    async def test_async_routes_skip_the_browser_stack(self):
+        response = await self.async_client.get(reverse('feed-async'))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.session_requests.assert_not_called()
+
+    def test_benchmark_command(self):
+        out = StringIO()
+        call_command('benchmark_middleware', '--requests', '5', stdout=out)
+        self.assertIn('lean pipeline', out.getvalue())
+
+
+class StartupTests(TestCase):
+    def test_lazy_view_loads_on_first_request(self):
+        view = lazy_view('posts.social_login.GoogleLogin')
+        self.assertTrue(view.csrf_exempt)
+        self.assertEqual(view.__name__, 'GoogleLogin')
+        loaded = view.load()
+        self.assertIs(view.load(), loaded)
+        self.assertEqual(loaded.view_class.__name__, 'GoogleLogin')
+
+    def test_lazy_routes_are_served(self):
+        response = self.client.get(reverse('schema'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn(b'openapi', response.content)
+        response = self.client.post(reverse('google_login'), {}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_preload_loads_lazy_views(self):
+        lazy.preload()
+        callbacks = [resolve(reverse(name)).func for name in ('google_login', 'schema', 'swagger-ui', 'redoc')]
+        with mock.patch('posts.lazy.import_string') as import_string:
+            for callback in callbacks:
+                callback.load()
+        import_string.assert_not_called()
+
+    def test_social_exception_middleware_ignores_other_errors(self):
+        middleware = AsyncSocialAuthExceptionMiddleware(lambda request: None)
+        self.assertIsNone(middleware.process_exception(RequestFactory().get('/'), ValueError('boom')))
+
+    def test_social_exception_middleware_handles_social_errors(self):
+        from social_core.exceptions import AuthCanceled
+        middleware = AsyncSocialAuthExceptionMiddleware(lambda request: None)
+        request = RequestFactory().get('/')
+        request.social_strategy = mock.Mock(setting=lambda name, default=None: {'RAISE_EXCEPTIONS': False, 'LOGIN_ERROR_URL': '/login-error/'}[name])
+        response = middleware.process_exception(request, AuthCanceled(None))
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(response['Location'].startswith('/login-error/?message='))
+
+    def test_profile_startup_command(self):
+        out = StringIO()
+        call_command('profile_startup', '--runs', '1', '--top', '3', stdout=out)
+        self.assertIn('Ready in', out.getvalue())
+        self.assertIn('django (app)', out.getvalue())
@@ -0,0 +1,255 @@
+"""
+Fan-out-on-write home timelines.
+
+When a post is created its ID is pushed into the TimelineEntry rows of the author and every follower.
+The home feed then reads a bounded page of IDs from the viewer's timeline and merges it with the
+public stream, so feed latency depends on the page size instead of the size of the posts table.
+Each batch of recipients is trimmed back to TIMELINE_MAX_LENGTH entries as it is fanned out to.
+
+Authors with more than FEED_FANOUT_FOLLOWER_THRESHOLD followers are not fanned out (push) at all.
+Their recent posts live in a shared per-author list that is merged into each follower's page at read
+time (pull), so the write cost of a post, like or comment stays bounded however popular the author is.
+"""
+import heapq
+import logging
+from itertools import chain, islice
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db.models import F, Q, Window
+from django.db.models.functions import RowNumber
+from .models import Post, Follow, TimelineEntry
+from .pagination import keyset_filter
+from . import caching
+
+User = get_user_model()
+logger = logging.getLogger(__name__)
+
+TIMELINE_MAX_LENGTH = getattr(settings, 'TIMELINE_MAX_LENGTH', 800) # entries kept per user
+TIMELINE_BATCH_SIZE = getattr(settings, 'TIMELINE_BATCH_SIZE', 1000)
+FEED_FANOUT_FOLLOWER_THRESHOLD = getattr(settings, 'FEED_FANOUT_FOLLOWER_THRESHOLD', 5000)
+AUTHOR_RECENT_LENGTH = getattr(settings, 'AUTHOR_RECENT_LENGTH', 200) # posts kept in each shared per-author list
+AUTHOR_RECENT_TIMEOUT = getattr(settings, 'AUTHOR_RECENT_TIMEOUT', 3600)
+HIGH_FANOUT_FOLLOWS_TIMEOUT = 300
+
+
+def is_high_fanout(author_id):
+    """Whether an author has too many followers to fan out to."""
+    follower_count = User.objects.filter(pk=author_id).values_list('follower_count', flat=True).first()
+    return (follower_count or 0) > FEED_FANOUT_FOLLOWER_THRESHOLD
+
+def _high_fanout_follows_key(user_id):
+    return f'user_{user_id}_high_fanout_follows'
+
+def high_fanout_followees(user_id):
+    """IDs of the high-fanout authors a user follows (pulled into the feed at read time)."""
+    key = _high_fanout_follows_key(user_id)
+    author_ids = cache.get(key)
+    if author_ids is None:
+        author_ids = list(
+            Follow.objects.filter(follower_id=user_id, following__follower_count__gt=FEED_FANOUT_FOLLOWER_THRESHOLD)
+            .values_list('following_id', flat=True)
+        )
+        cache.set(key, author_ids, HIGH_FANOUT_FOLLOWS_TIMEOUT)
+    return author_ids
+
+async def ahigh_fanout_followees(user_id):
+    key = _high_fanout_follows_key(user_id)
+    author_ids = await cache.aget(key)
+    if author_ids is None:
+        author_ids = [
+            author_id async for author_id in
+            Follow.objects.filter(follower_id=user_id, following__follower_count__gt=FEED_FANOUT_FOLLOWER_THRESHOLD)
+            .values_list('following_id', flat=True)
+        ]
+        await cache.aset(key, author_ids, HIGH_FANOUT_FOLLOWS_TIMEOUT)
+    return author_ids
+
+def forget_followees(user_id):
+    """Drops the cached high-fanout followees after a follow or unfollow."""
+    cache.delete(_high_fanout_follows_key(user_id))
+
+def invalidate_follower_feeds(author_ids):
+    """
+    Invalidates the cached feeds that show posts of the given authors.
+    High-fanout authors bump their own generation (embedded in their followers' feed keys); for the others
+    every distinct follower's feed generation is bumped once, however many of the authors they follow.
+    """
+    author_ids = set(author_ids)
+    high_fanout = set(
+        User.objects.filter(pk__in=author_ids, follower_count__gt=FEED_FANOUT_FOLLOWER_THRESHOLD).values_list('pk', flat=True)
+    )
+    for author_id in high_fanout:
+        caching.invalidate_author(author_id)
+    follower_ids = (
+        Follow.objects.filter(following_id__in=author_ids - high_fanout)
+        .order_by().values_list('follower_id', flat=True).distinct()
+    )
+    caching.invalidate_feeds(follower_ids.iterator(chunk_size=TIMELINE_BATCH_SIZE))
+
+def _author_recent_key(author_id):
+    return f'author_recent:{author_id}'
+
+def _load_author_recent(author_id):
+    return list(
+        Post.objects.filter(author_id=author_id)
+        .order_by('-created_at', '-id')
+        .values_list('created_at', 'id')[:AUTHOR_RECENT_LENGTH]
+    )
+
+def invalidate_author_recent(author_id):
+    """Drops the shared recent-posts list of an author; it is reloaded by the next reader."""
+    cache.delete(_author_recent_key(author_id))
+
+
+def _entries_for(post, user_ids):
+    return [
+        TimelineEntry(user_id=user_id, post_id=post.id, author_id=post.author_id, created_at=post.created_at)
+        for user_id in user_ids
+    ]
+
+def push_post(post, user_ids):
+    """Adds a post to the timelines of the given users."""
+    TimelineEntry.objects.bulk_create(_entries_for(post, user_ids), ignore_conflicts=True)
+
+def fan_out_post(post):
+    """
+    Pushes a newly created post into the timelines of its author and all of the author's followers.
+    Posts of high-fanout authors only go to the author's own timeline and the shared per-author list.
+    """
+    if is_high_fanout(post.author_id):
+        push_post(post, [post.author_id])
+        trim_timelines([post.author_id])
+        invalidate_author_recent(post.author_id)
+        return 1
+
+    follower_ids = Follow.objects.filter(following_id=post.author_id).values_list('follower_id', flat=True)
+    user_ids = chain([post.author_id], follower_ids.iterator(chunk_size=TIMELINE_BATCH_SIZE))
+    pushed = 0
+    while batch := list(islice(user_ids, TIMELINE_BATCH_SIZE)):
+        push_post(post, batch)
+        trim_timelines(batch)
+        pushed += len(batch)
+    logger.info(f"Fanned out post {post.id} to {pushed} timelines")
+    return pushed
+
+def backfill_author(user_id, author_id):
+    """Copies the recent posts of a newly followed author into the follower's timeline."""
+    backfill_authors(user_id, [author_id])
+
+def backfill_authors(user_id, author_ids):
+    """Copies the recent posts of several newly followed authors into the follower's timeline, in one query."""
+    # High-fanout authors are pulled at read time instead
+    pushed = User.objects.filter(pk__in=author_ids, follower_count__lte=FEED_FANOUT_FOLLOWER_THRESHOLD).values('pk')
+    # Only the newest TIMELINE_MAX_LENGTH can survive the trim, whatever author they come from
+    posts = Post.objects.filter(author_id__in=pushed).order_by('-created_at').only('id', 'author_id', 'created_at')[:TIMELINE_MAX_LENGTH]
+    TimelineEntry.objects.bulk_create(
+        [TimelineEntry(user_id=user_id, post_id=p.id, author_id=p.author_id, created_at=p.created_at) for p in posts],
+        batch_size=TIMELINE_BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+    trim_timeline(user_id)
+
+def remove_author(user_id, author_id):
+    """Drops an unfollowed author's posts from the follower's timeline."""
+    TimelineEntry.objects.filter(user_id=user_id, author_id=author_id).delete()
+
+def trim_timeline(user_id):
+    """Keeps only the newest TIMELINE_MAX_LENGTH entries of a user's timeline."""
+    cutoff = (
+        TimelineEntry.objects.filter(user_id=user_id)
+        .order_by('-created_at', '-post_id')
+        .values_list('created_at', 'post_id')[TIMELINE_MAX_LENGTH:TIMELINE_MAX_LENGTH + 1]
+    ).first()
+    if cutoff:
+        created_at, post_id = cutoff
+        TimelineEntry.objects.filter(user_id=user_id).filter(
+            Q(created_at__lt=created_at) | Q(created_at=created_at, post_id__lte=post_id)
+        ).delete()
+
+def trim_timelines(user_ids):
+    """trim_timeline() for a batch of users, in one DELETE."""
+    overflow = (
+        TimelineEntry.objects.filter(user_id__in=user_ids)
+        .annotate(position=Window(RowNumber(), partition_by=F('user_id'), order_by=[F('created_at').desc(), F('post_id').desc()]))
+        .filter(position__gt=TIMELINE_MAX_LENGTH)
+        .values('pk')
+    )
+    TimelineEntry.objects.filter(pk__in=overflow).delete()
+
+def rebuild_timeline(user_id):
+    """Rebuilds a user's timeline from scratch out of their own and their followees' posts."""
+    author_ids = [user_id, *Follow.objects.filter(follower_id=user_id).values_list('following_id', flat=True)]
+    posts = (
+        Post.objects.filter(author_id__in=author_ids)
+        .order_by('-created_at', '-id')
+        .only('id', 'author_id', 'created_at')[:TIMELINE_MAX_LENGTH]
+    )
+    TimelineEntry.objects.filter(user_id=user_id).delete()
+    TimelineEntry.objects.bulk_create(
+        [TimelineEntry(user_id=user_id, post_id=p.id, author_id=p.author_id, created_at=p.created_at) for p in posts],
+        batch_size=TIMELINE_BATCH_SIZE,
+    )
+    return len(posts)
+
+def _pulled_entries(author_ids, window, before=None):
+    """
+    Returns newest-first (created_at, id) lists for the given high-fanout authors.
+    The shared per-author lists are read in one round trip; authors whose list is too short for the
+    requested window are read from the posts table in a single query instead.
+    """
+    if not author_ids:
+        return []
+    keys = {_author_recent_key(author_id): author_id for author_id in author_ids}
+    cached = cache.get_many(list(keys))
+    sources = []
+    deep = []
+    for key, author_id in keys.items():
+        entries = cached.get(key)
+        if entries is None:
+            entries = _load_author_recent(author_id)
+            cache.set(key, entries, AUTHOR_RECENT_TIMEOUT)
+        complete = len(entries) < AUTHOR_RECENT_LENGTH # the list holds every post of the author
+        if before is not None:
+            entries = [entry for entry in entries if tuple(entry) < before]
+        if len(entries) >= window or complete:
+            sources.append(entries[:window])
+        else:
+            deep.append(author_id)
+    if deep:
+        sources.append(list(keyset_filter(
+            Post.objects.filter(author_id__in=deep).order_by('-created_at', '-id'),
+            before,
+        ).values_list('created_at', 'id')[:window]))
+    return sources
+
+def home_feed_ids(user, limit, offset=0, before=None):
+    """
+    Returns one page of post IDs for the home feed, newest first.
+    The viewer's timeline (own + followed posts of any privacy) is merged with the public stream;
+    each source is read with a LIMIT, so the cost grows with the page depth and not with the table size.
+    Posts of followed high-fanout authors are merged in from their shared per-author lists.
+    `before` is a (created_at, id) keyset position; with it no OFFSET is needed at all.
+    """
+    window = offset + limit
+    timeline = keyset_filter(
+        TimelineEntry.objects.filter(user_id=user.id).order_by('-created_at', '-post_id'),
+        before, pk_field='post_id',
+    ).values_list('created_at', 'post_id')[:window]
+    public = keyset_filter(
+        Post.objects.filter(privacy='public').order_by('-created_at', '-id'),
+        before,
+    ).values_list('created_at', 'id')[:window]
+    pulled = _pulled_entries(high_fanout_followees(user.id), window, before)
+    seen = set()
+    ids = []
+    for _, post_id in heapq.merge(list(timeline), list(public), *pulled, reverse=True):
+        if post_id not in seen:
+            seen.add(post_id)
+            ids.append(post_id)
+    return ids[offset:offset + limit]
+
+def load_posts(post_ids):
+    """Loads the posts for a page of IDs, preserving the order of the IDs."""
+    posts = Post.objects.select_related('author').in_bulk(post_ids)
+    return [posts[post_id] for post_id in post_ids if post_id in posts]
@@ -1,7 +1,8 @@
 from django.urls import path
 from rest_framework.routers import DefaultRouter, SimpleRouter
-from .views import UserViewSet, PostViewSet, CommentViewSet, LoginView, ProtectedView, PostDetailView, AdminView, feed_view, FollowViewSet
+from .views import UserViewSet, PostViewSet, CommentViewSet, LoginView, ProtectedView, PostDetailView, AdminView, CacheStatsView, feed_view, FollowViewSet
 from django.conf import settings
+from . import async_views
 
 # Choose router based on DEBUG setting
 if settings.DEBUG:
@@ -18,8 +19,13 @@ router.register(r'follows', FollowViewSet, basename='follow')
 # Add the login endpoint
 urlpatterns = [
     path('users/login/', LoginView.as_view(), name='login'),
-    path('<int:pk>/', PostDetailView.as_view()),
+    path('<int:pk>/', PostDetailView.as_view(), name='post-content'),
     path('protected/', ProtectedView.as_view(), name='protected'), # sanity check
-    path('admin/', AdminView.as_view()),
+    path('admin/', AdminView.as_view(), name='admin'),
+    path('admin/cache-stats/', CacheStatsView.as_view(), name='cache-stats'),
     path('feed/', feed_view, name='feed'),
+    # Async twins of the feed, comments and profile reads, for ASGI workers (posts/async_views.py)
+    path('async/feed/', async_views.feed_view, name='feed-async'),
+    path('async/posts/<int:pk>/comments/', async_views.post_comments_view, name='post-comments-async'),
+    path('async/users/<int:pk>/', async_views.user_detail_view, name='user-detail-async'),
 ] + router.urls
\ No newline at end of file
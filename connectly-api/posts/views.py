@@ -2,30 +2,84 @@ from rest_framework import status, viewsets
 from rest_framework.response import Response
 from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.views import APIView
-from rest_framework.exceptions import NotFound
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.permissions import IsAuthenticated, IsAuthenticatedOrReadOnly, IsAdminUser, AllowAny
 from rest_framework_simplejwt.authentication import JWTAuthentication
 from rest_framework_simplejwt.exceptions import TokenError
 from rest_framework_simplejwt.views import TokenRefreshView
 from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.settings import api_settings
 from django.contrib.auth import get_user_model
 from django.shortcuts import get_object_or_404
 from django.conf import settings 
+from django.db import transaction
 from django.db.models import Q
-from rest_framework.pagination import PageNumberPagination
-from dj_rest_auth.registration.views import SocialLoginView
-from allauth.socialaccount.providers.google.views import GoogleOAuth2Adapter
-from allauth.socialaccount.providers.oauth2.client import OAuth2Client
 import logging
+import os
 from django.core.cache import cache
 from .models import Post, Comment, Like, Follow
-from .serializers import UserSerializer, PostSerializer, CommentSerializer, LoginSerializer, FeedPostSerializer, FollowSerializer
+from .serializers import UserSerializer, PostSerializer, CommentSerializer, LoginSerializer, FeedPostSerializer, FollowSerializer, comment_preview_prefetch
 from .permissions import IsOwnerOrAdmin
+from .pagination import CommentPagination, FeedPagination, TimelinePagination, is_cursor_request
+from . import authentication, authz, caching, conditional, counters, jobs, likes, renderers, timelines, visibility
 
 User = get_user_model()
 logger = logging.getLogger(__name__)
 
 FEED_CACHE_TIMEOUT = getattr(settings, 'FEED_CACHE_TIMEOUT', 7200)
+COMMENTS_CACHE_TIMEOUT = getattr(settings, 'COMMENTS_CACHE_TIMEOUT', 3600)
+BATCH_MAX_SIZE = getattr(settings, 'BATCH_MAX_SIZE', 100)
+
+def page_cache_token(request):
+    """Identifies the requested page in cache keys: the opaque cursor in cursor mode, else the page number."""
+    if is_cursor_request(request):
+        return f"cursor={request.query_params.get('cursor')}:{request.query_params.get('page_size')}"
+    return f"{request.query_params.get('page')}:{request.query_params.get('page_size')}"
+
+def batch_ids(values, name):
+    """Parses the IDs of a batch request: a JSON list, or a comma-separated string. Raises ValidationError (400)."""
+    if isinstance(values, str):
+        values = [value for value in values.split(',') if value.strip()]
+    if not isinstance(values, list) or not values:
+        raise ValidationError({name: 'A non-empty list of IDs is required.'})
+    if len(values) > BATCH_MAX_SIZE:
+        raise ValidationError({name: f'At most {BATCH_MAX_SIZE} IDs per request.'})
+    try:
+        ids = [int(value) for value in values]
+    except (TypeError, ValueError):
+        raise ValidationError({name: 'IDs must be integers.'})
+    return list(dict.fromkeys(ids)) # de-duplicated, in request order
+
+def build_comments_page(request, post):
+    """One page of a post's comments, oldest first (PostViewSet.comments and its async twin)."""
+    paginator = CommentPagination()
+    result_page = paginator.paginate_queryset(post.comments.order_by('created_at', 'id'), request)
+    serializer = CommentSerializer(result_page, many=True)
+    return paginator.get_paginated_response(serializer.data).data
+
+def build_feed_page(request, user, filter_type):
+    """One page of the user's feed (feed_view and its async twin)."""
+    if filter_type in ('followed', 'liked'):
+        if filter_type == 'followed':
+            # Followers may see every post of the authors they follow, so no privacy filter is needed
+            branches = [Post.objects.filter(author_id__in=visibility.followed_author_ids(user.id))]
+        else:
+            liked_posts = Like.objects.filter(user=user).values('post')
+            branches = visibility.visible_branches(user, Post.objects.filter(id__in=liked_posts))
+
+        paginator = FeedPagination()
+        paginated_posts = paginator.paginate_union(branches, request, timelines.load_posts)
+    else:
+        # Home feed: read a page of IDs from the materialized timeline, then load just those rows
+        paginator = TimelinePagination()
+        paginated_posts = paginator.paginate_timeline(
+            request,
+            lambda limit, **position: timelines.home_feed_ids(user, limit, **position),
+            timelines.load_posts,
+        )
+
+    serializer = FeedPostSerializer(paginated_posts, many=True)
+    return paginator.get_paginated_response(serializer.data).data
 
 class UserViewSet(viewsets.ModelViewSet):
     queryset = User.objects.all()
@@ -48,7 +102,7 @@ class UserViewSet(viewsets.ModelViewSet):
             user.set_password(request.data['password'])
             user.save()
         self.perform_update(serializer)
-        cache.delete(f'user_{self.get_object().id}')
+        cache.delete(f'user_{user.id}')
         cache.delete('feed_view') 
         return Response(serializer.data)
 
@@ -68,30 +122,18 @@ class UserViewSet(viewsets.ModelViewSet):
     
     def retrieve(self, request, *args, **kwargs):
         instance = self.get_object()
-        serializer = self.get_serializer(instance)
-        cache_key = f'user_{instance.id}'
-        cached_data = cache.get(cache_key)
-        if cached_data:
-            return Response(cached_data)
-        else:
-            data = serializer.data
-            cache.set(cache_key, data, settings.CACHE_TTL)
-            return Response(data)
+        data = caching.cached(f'user_{instance.id}', lambda: self.get_serializer(instance).data, settings.CACHE_TTL)
+        return Response(data)
 
     def destroy(self, request, *args, **kwargs):
         user = self.get_object()
-        if user == request.user or request.user.is_staff or request.user.role == "admin" or request.user.groups.filter(name="Admin").exists():
+        if user == request.user or authz.is_admin(request.user):
             self.perform_destroy(user)
-            cache.delete(f'user_{self.get_object().id}')
+            cache.delete(f'user_{user.id}')
             cache.delete('feed_view') 
             return Response({'message': 'User deleted successfully.'}, status=status.HTTP_204_NO_CONTENT)
         return Response({'message': 'You do not have permission to delete this account.'}, status=status.HTTP_403_FORBIDDEN)
 
-class CommentPagination(PageNumberPagination):
-    page_size = 5
-    page_size_query_param = 'page_size'
-    max_page_size = 20
-
 class PostViewSet(viewsets.ModelViewSet):
     """
     ViewSet for handling CRUD operations on Post objects.
@@ -106,116 +148,155 @@ class PostViewSet(viewsets.ModelViewSet):
         Enforces privacy settings and filters posts accordingly.
         """
         user = self.request.user
+        posts = Post.objects.all()
+        if self.action in ('list', 'retrieve', 'update', 'partial_update', 'batch'):
+            posts = posts.prefetch_related(comment_preview_prefetch()) # PostSerializer embeds a bounded comment preview: one query per page
         if user.is_authenticated:
             # Admin can see all private posts
-            if user.is_staff or user.role == "admin" or user.groups.filter(name="Admin").exists():
-                return Post.objects.all()  # Admin can see everything
+            if authz.is_admin(user):
+                return posts  # Admin can see everything
                 # Owner can see all their private posts, plus public posts and those from followers
-            return Post.objects.filter(
-                Q(privacy='public') |
-                Q(author=user) |
-                Q(author__followers__follower=user)
-            ).distinct()
-        return Post.objects.filter(privacy='public')  # Public posts visible to everyone
+            return visibility.visible_posts(user, posts)
+        return posts.filter(privacy='public')  # Public posts visible to everyone
 
     def get_permissions(self):
         """
         Returns the appropriate permissions based on the action.
         """
-        if self.action in ['list', 'retrieve', 'comments', 'likes']:
+        if self.action in ['list', 'retrieve', 'comments', 'likes', 'batch']:
             permission_classes = [IsAuthenticatedOrReadOnly]
-        elif self.action in ['create', 'like', 'unlike', 'comment']:
+        elif self.action in ['create', 'like', 'unlike', 'comment', 'batch_like', 'batch_unlike']:
             permission_classes = [IsAuthenticated]
         else:
             permission_classes = [IsAuthenticated, IsOwnerOrAdmin]
         return [permission() for permission in permission_classes]
 
     def perform_create(self, serializer):
-        serializer.save(author=self.request.user)
+        with transaction.atomic(): # the post and its fan-out job commit together
+            post = serializer.save(author=self.request.user)
+            timelines.push_post(post, [post.author_id]) # The author sees their post right away
+            jobs.enqueue(jobs.FANOUT_POST, post.pk) # Push the post into followers' timelines in the background
         self.clear_feed_cache(self.request.user.id) # Clear feed cache on post creation
 
+    def retrieve(self, request, *args, **kwargs):
+        """Post detail, with an ETag from the post's version stamps: a matching If-None-Match skips the query."""
+        stamps = conditional.post_stamps(kwargs['pk'], request.user)
+        not_modified = conditional.not_modified(request, *stamps)
+        if not_modified:
+            return not_modified
+        return conditional.respond(request, super().retrieve(request, *args, **kwargs), *stamps)
+
     def perform_update(self, serializer):
-        serializer.save()
-        self.clear_feed_cache(serializer.instance.author.id) # Clear feed cache on post update
+        with transaction.atomic():
+            serializer.save()
+            self.clear_feed_cache_for_followers(serializer.instance.author_id) # followers' pages show the post too
+        caching.invalidate_post(serializer.instance.pk)
+        self.clear_feed_cache(serializer.instance.author_id) # Clear feed cache on post update
 
     def perform_destroy(self, instance):
-        author_id = instance.author.id
-        instance.delete()
+        author_id = instance.author_id
+        caching.invalidate_post(instance.pk)
+        with transaction.atomic():
+            instance.delete()
+            self.clear_feed_cache_for_followers(author_id)
+        timelines.invalidate_author_recent(author_id)
         self.clear_feed_cache(author_id) # Clear feed cache on post deletion
 
     def clear_feed_cache(self, user_id):
-        """Helper function to clear feed cache for a specific user."""
-        keys_to_delete = cache.keys(f'feed_data:{user_id}:*')
-        if keys_to_delete:
-            cache.delete_many(keys_to_delete, cache=cache.caches['feed_cache'])
-            logger.info(f"Cleared feed cache for user: {user_id}")
+        """Helper function to clear feed cache for a specific user (one INCR of the feed generation)."""
+        caching.invalidate_feed(user_id)
 
     @action(detail=True, methods=['get'])
     def comments(self, request, pk=None):
         """
         Retrieves all comments for a specific post with pagination and caching.
+        Polling clients revalidate with If-None-Match, answered from the version stamps before the post is even read.
         """
+        page_token = page_cache_token(request)
+        key = caching.comments_cache_key(pk, page_token)
+        stamps = [key, *conditional.post_stamps(pk, request.user)]
+        not_modified = conditional.page_not_modified(request, *stamps)
+        if not_modified:
+            return not_modified
         post = self.get_object()
-        page = request.query_params.get('page')
-        cache_key = f'post_comments:{post.pk}:{page}'
-        cached_comments = cache.get(cache_key)
-
-        if cached_comments:
-            logger.info(f"Cache hit for key: {cache_key}")
-            return Response(cached_comments)
-        else:
-            logger.info(f"Cache miss for key: {cache_key}")
-            paginator = CommentPagination()
-            result_page = paginator.paginate_queryset(post.comments.all(), request)
-            serializer = CommentSerializer(result_page, many=True)
-            response_data = paginator.get_paginated_response(serializer.data)
-            cache.set(cache_key, response_data.data, timeout=3600) # Cache for 1 hour
-            return response_data
+        entry = caching.cached(
+            key,
+            lambda: conditional.versioned(renderers.rendered(build_comments_page(request, post)), key),
+            COMMENTS_CACHE_TIMEOUT,
+            stale_key=caching.comments_stale_key(post.pk, page_token),
+        )
+        return conditional.respond(request, renderers.RenderedResponse(entry), *stamps, entry=entry)
 
     @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated])
     def like(self, request, pk=None):
         post = self.get_object()
-        user = request.user
-        if Like.objects.filter(user=user, post=post).exists():
+        liked = likes.record_likes(request.user.id, {post.pk: post.author_id}) # Redis, flushed to the database in bulk
+        if post.pk not in liked:
             return Response({'message': 'You have already liked this post.'}, status=status.HTTP_400_BAD_REQUEST)
-        Like.objects.create(user=user, post=post)
-        self.clear_feed_cache_for_followers(post.author.id) # Clear feed cache for followers
-        return Response({'message': 'Post liked successfully.'}, status=status.HTTP_201_CREATED)
+        like_count = liked[post.pk] if liked[post.pk] is not None else post.like_count + 1
+        return Response({'message': 'Post liked successfully.', 'like_count': like_count}, status=status.HTTP_201_CREATED)
 
     @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated])
     def unlike(self, request, pk=None):
         post = self.get_object()
-        user = request.user
-        like = Like.objects.filter(user=user, post=post)
-        if not like.exists():
+        unliked = likes.record_unlikes(request.user.id, [post.pk])
+        if post.pk not in unliked:
             return Response({'message': 'You have not liked this post yet.'}, status=status.HTTP_400_BAD_REQUEST)
-        like.delete()
-        self.clear_feed_cache_for_followers(post.author.id) # Clear feed cache for followers
-        return Response({'message': 'Post unliked successfully.'}, status=status.HTTP_200_OK)
+        like_count = unliked[post.pk] if unliked[post.pk] is not None else max(post.like_count - 1, 0)
+        return Response({'message': 'Post unliked successfully.', 'like_count': like_count}, status=status.HTTP_200_OK)
 
     @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated])
     def comment(self, request, pk=None):
         post = self.get_object()
         serializer = CommentSerializer(data=request.data)
         if serializer.is_valid(raise_exception=True):
-            serializer.save(user=request.user, post=post)
+            with transaction.atomic():
+                serializer.save(user=request.user, post=post)
+                counters.add_comments(post.pk)
+                self.clear_feed_cache_for_followers(post.author_id) # Clear feed cache for followers
             self.clear_post_comments_cache(post.pk) # Clear comments cache
-            self.clear_feed_cache_for_followers(post.author.id) # Clear feed cache for followers
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    @action(detail=False, methods=['get'])
+    def batch(self, request):
+        """Fetches several posts by ID (?ids=1,2,3) in one query; IDs that do not exist or are not visible are listed as missing."""
+        ids = batch_ids(request.query_params.get('ids', ''), 'ids')
+        posts = {post.pk: post for post in self.get_queryset().filter(pk__in=ids)}
+        return Response({
+            'results': self.get_serializer([posts[pk] for pk in ids if pk in posts], many=True).data,
+            'missing': [pk for pk in ids if pk not in posts],
+        })
+
+    @action(detail=False, methods=['post'], url_path='batch-like')
+    def batch_like(self, request):
+        """Likes several posts ({"post_ids": [...]}) at once; already liked posts are left as they are."""
+        ids = batch_ids(request.data.get('post_ids'), 'post_ids')
+        authors = dict(self.get_queryset().filter(pk__in=ids).values_list('pk', 'author_id'))
+        liked = likes.record_likes(request.user.id, {pk: authors[pk] for pk in ids if pk in authors})
+        return Response({
+            'liked': [pk for pk in ids if pk in liked],
+            'already_liked': [pk for pk in ids if pk in authors and pk not in liked],
+            'not_found': [pk for pk in ids if pk not in authors],
+        }, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['post'], url_path='batch-unlike')
+    def batch_unlike(self, request):
+        """Unlikes several posts ({"post_ids": [...]}) at once; posts that were not liked are listed as such."""
+        ids = batch_ids(request.data.get('post_ids'), 'post_ids')
+        unliked = likes.record_unlikes(request.user.id, ids)
+        return Response({
+            'unliked': [pk for pk in ids if pk in unliked],
+            'not_liked': [pk for pk in ids if pk not in unliked],
+        }, status=status.HTTP_200_OK)
+
     def clear_post_comments_cache(self, post_id):
-        """Helper function to clear comments cache for a specific post."""
-        keys_to_delete = cache.keys(f'post_comments:{post_id}:*')
-        if keys_to_delete:
-            cache.delete_many(keys_to_delete)
-            logger.info(f"Cleared comments cache for post: {post_id}")
-
-    def clear_feed_cache_for_followers(self, author_id):
-        """Helper function to clear feed caches of users following the post author."""
-        followers = Follow.objects.filter(following=author_id).values_list('follower_id', flat=True)
-        for follower_id in followers:
-            self.clear_feed_cache(follower_id)
+        """Helper function to clear comments cache for a specific post (one INCR of the comments generation)."""
+        caching.invalidate_post_comments(post_id)
+
+    def clear_feed_cache_for_followers(self, *author_ids):
+        """Helper function to queue the invalidation of feed caches of users following the post authors."""
+        jobs.enqueue(jobs.INVALIDATE_FOLLOWERS, *author_ids)
 
 class CommentViewSet(viewsets.ModelViewSet):
     """
@@ -230,27 +311,29 @@ class CommentViewSet(viewsets.ModelViewSet):
         return [IsAuthenticated(), IsOwnerOrAdmin()]
 
     def perform_create(self, serializer):
-        serializer.save(user=self.request.user)
         # Clear post comments cache and feed cache of the post author's followers
-        post_id = serializer.instance.post_id
-        post = Post.objects.get(pk=post_id)
-        PostViewSet().clear_post_comments_cache(post_id)
-        PostViewSet().clear_feed_cache_for_followers(post.author.id)
+        with transaction.atomic():
+            serializer.save(user=self.request.user)
+            post = serializer.instance.post
+            counters.add_comments(post.pk)
+            jobs.enqueue(jobs.INVALIDATE_FOLLOWERS, post.author_id)
+        caching.invalidate_post_comments(post.pk)
 
     def perform_update(self, serializer):
-        serializer.save()
         # Clear post comments cache and feed cache of the post author's followers
-        post_id = serializer.instance.post_id
-        post = Post.objects.get(pk=post_id)
-        PostViewSet().clear_post_comments_cache(post_id)
-        PostViewSet().clear_feed_cache_for_followers(post.author.id)
+        with transaction.atomic():
+            serializer.save()
+            post = serializer.instance.post
+            jobs.enqueue(jobs.INVALIDATE_FOLLOWERS, post.author_id)
+        caching.invalidate_post_comments(post.pk)
 
     def perform_destroy(self, instance):
-        post_id = instance.post_id
-        post = Post.objects.get(pk=post_id)
-        PostViewSet().clear_post_comments_cache(post_id)
-        PostViewSet().clear_feed_cache_for_followers(post.author.id)
-        instance.delete()
+        post = instance.post
+        with transaction.atomic():
+            instance.delete()
+            counters.add_comments(post.pk, -1)
+            jobs.enqueue(jobs.INVALIDATE_FOLLOWERS, post.author_id)
+        caching.invalidate_post_comments(post.pk)
 
 
 class LoginView(APIView):
@@ -263,8 +346,8 @@ class PostDetailView(APIView):
     permission_classes = [IsAuthenticated, IsOwnerOrAdmin]
 
     def get(self, request, pk):
-        post = Post.objects.get(pk=pk)
-        if post.privacy == 'private' and post.author != request.user:
+        post = Post.objects.select_related('author').get(pk=pk)
+        if post.privacy == 'private' and post.author_id != request.user.id:
             return Response({'message': 'This post is private.'}, status=status.HTTP_403_FORBIDDEN)
         self.check_object_permissions(request, post)
         return Response({"content": post.content})
@@ -275,6 +358,15 @@ class AdminView(APIView):
     def get(self, request):
         return Response({"message": "Hello, Admin!"})
     
+class CacheStatsView(APIView):
+    """Hit/miss counters of the local (in-process) and Redis cache tiers, for the worker serving the request."""
+    permission_classes = [IsAuthenticated, IsAdminUser]
+
+    def get(self, request):
+        if not hasattr(cache, 'local_stats'):
+            return Response({'message': 'The configured cache backend has no local tier.'}, status=status.HTTP_404_NOT_FOUND)
+        return Response({'pid': os.getpid(), **cache.local_stats()})
+
 class ProtectedView(APIView):
     permission_classes = [IsAuthenticated]
 
@@ -308,82 +400,42 @@ class CustomTokenRefreshView(TokenRefreshView):
             return Response({"detail": "Refresh token is required."}, status=400)
         try:
             refresh = RefreshToken(refresh_token)
-            new_access_token = refresh.access_token
-            new_refresh_token = RefreshToken.for_user(refresh.user)
+            user = User.objects.get(pk=refresh[api_settings.USER_ID_CLAIM], is_active=True)
+            new_refresh_token = authentication.token_for(user) # re-reads the user claims (role, is_staff)
             return Response({
-                'access': str(new_access_token),
+                'access': str(new_refresh_token.access_token),
                 'refresh': str(new_refresh_token)
             })
         except Exception as e:
             return Response({"detail": "Invalid refresh token."}, status=400)
 
-class GoogleLogin(SocialLoginView):
-    adapter_class = GoogleOAuth2Adapter
-    client_class = OAuth2Client
-    callback_url = "http://127.0.0.1:5173/"
-
-    def post(self, request, *args, **kwargs):
-        response = super().post(request, *args, **kwargs)
-        if response.status_code == 200:
-            user = self.user
-            refresh = RefreshToken.for_user(user)
-            access_token = str(refresh.access_token)
-            refresh_token = str(refresh)
-            return Response({
-                'access': access_token,
-                'refresh': refresh_token
-            }, status=status.HTTP_200_OK)
-        else:
-            return response
-
-class FeedPagination(PageNumberPagination):
-    page_size = 10  # Adjust as needed
-    page_size_query_param = 'page_size'
-    max_page_size = 100
-
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def feed_view(request):
     user = request.user
     filter_type = request.query_params.get('filter', None)
-    page = request.query_params.get('page')
-
-    cache_key = f'feed_data:{user.id}:{filter_type}:{page}'
-    cached_feed = cache.get(cache_key)
 
-    if cached_feed:
-        logger.info(f"Cache hit for key: {cache_key}")
-        return Response(cached_feed)
-    else:
-        logger.info(f"Cache miss for key: {cache_key}")
-        try:
-            if filter_type == 'followed':
-                followed_users = Follow.objects.filter(follower=user).values_list('following', flat=True)
-                posts = Post.objects.filter(author__in=followed_users)
-            elif filter_type == 'liked':
-                liked_posts = Like.objects.filter(user=user).values_list('post', flat=True)
-                posts = Post.objects.filter(id__in=liked_posts)
-            else:
-                # posts = Post.objects.select_related('author').prefetch_related('likes', 'comments').all()
-                posts = Post.objects.select_related('author').only('id', 'author_id', 'content', 'privacy')
-
-
-            posts = posts.filter(
-                Q(privacy='public') |
-                Q(author=user) |
-                Q(author__followers__follower=user)
-            ).distinct().order_by('-created_at')
-
-            paginator = FeedPagination()
-            paginated_posts = paginator.paginate_queryset(posts, request)
-            serializer = FeedPostSerializer(paginated_posts, many=True)
-            response_data = paginator.get_paginated_response(serializer.data)
-            cache_timeout = FEED_CACHE_TIMEOUT  # Use the configurable timeout
-            cache.set(cache_key, response_data.data, timeout=cache_timeout)
-            return response_data
-        except Exception as e:
-            logger.error(f"Error in feed_view: {e}", exc_info=True)
-            return Response({"error": "Internal Server Error"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    page_token = page_cache_token(request)
+
+    try:
+        key = caching.feed_cache_key(user.id, filter_type, page_token, timelines.high_fanout_followees(user.id))
+        # Polling clients whose copy is still the cached page get a 304 without a rebuild
+        not_modified = conditional.page_not_modified(request, key)
+        if not_modified:
+            return not_modified
+        # Single-flight: concurrent misses on the same page wait for (or serve the previous copy of) one rebuild
+        entry = caching.cached(
+            key,
+            lambda: conditional.versioned(renderers.rendered(build_feed_page(request, user, filter_type)), key),
+            FEED_CACHE_TIMEOUT,
+            stale_key=caching.feed_stale_key(user.id, filter_type, page_token),
+        )
+        return conditional.respond(request, renderers.RenderedResponse(entry), key, entry=entry)
+    except NotFound:
+        raise
+    except Exception as e:
+        logger.error(f"Error in feed_view: {e}", exc_info=True)
+        return Response({"error": "Internal Server Error"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 class FollowViewSet(viewsets.ModelViewSet):
     queryset = Follow.objects.all()
@@ -401,14 +453,54 @@ class FollowViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         self.perform_create(serializer)
-        cache.delete(f'user_{request.user.id}_follows')
+        following_id = serializer.instance.following_id
+        counters.add_followers(following_id)
+        timelines.backfill_author(request.user.id, following_id)
+        timelines.forget_followees(request.user.id)
+        visibility.forget_follows(request.user.id)
+        caching.invalidate_feed(request.user.id)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
+    @action(detail=False, methods=['post'])
+    def batch(self, request):
+        """Follows several users ({"following_ids": [...]}) with one insert and one feed invalidation."""
+        ids = batch_ids(request.data.get('following_ids'), 'following_ids')
+        existing = set(User.objects.filter(pk__in=ids).exclude(pk=request.user.pk).values_list('pk', flat=True))
+        already_following = set(Follow.objects.filter(follower=request.user, following_id__in=existing).values_list('following_id', flat=True))
+        followed = [pk for pk in ids if pk in existing and pk not in already_following]
+        if followed:
+            with transaction.atomic():
+                follows = Follow.objects.bulk_create([Follow(follower=request.user, following_id=pk) for pk in followed], ignore_conflicts=True)
+                # Rows that lost to a concurrent follow were skipped; ours carry the exact timestamps just assigned
+                stamps = {follow.following_id: follow.created_at for follow in follows}
+                inserted = {
+                    following_id for following_id, created_at in
+                    Follow.objects.filter(follower=request.user, following_id__in=followed).values_list('following_id', 'created_at')
+                    if stamps[following_id] == created_at
+                }
+                already_following |= set(followed) - inserted
+                followed = [pk for pk in followed if pk in inserted]
+                counters.add_followers(followed)
+        if followed:
+            timelines.backfill_authors(request.user.id, followed)
+            timelines.forget_followees(request.user.id)
+            visibility.forget_follows(request.user.id)
+            caching.invalidate_feed(request.user.id)
+        return Response({
+            'followed': followed,
+            'already_following': [pk for pk in ids if pk in already_following],
+            'not_found': [pk for pk in ids if pk not in existing], # includes the user themselves
+        }, status=status.HTTP_200_OK)
+
     def destroy(self, request, *args, **kwargs):
         instance = self.get_object()
         if instance.follower == request.user:
             self.perform_destroy(instance)
-            cache.delete(f'user_{request.user.id}_follows')
+            counters.add_followers(instance.following_id, -1)
+            timelines.remove_author(request.user.id, instance.following_id)
+            timelines.forget_followees(request.user.id)
+            visibility.forget_follows(request.user.id)
+            caching.invalidate_feed(request.user.id)
             return Response(status=status.HTTP_204_NO_CONTENT)
         else:
             return Response({"detail": "You do not have permission to delete this follow relationship."}, status=status.HTTP_403_FORBIDDEN)
\ No newline at end of file
@@ -0,0 +1,66 @@
+"""
+Post visibility rules.
+
+A viewer may see every public post, plus every post (of any privacy) by themselves or by an author they follow.
+Instead of joining through followers with `Q(author__followers__follower=user)` and de-duplicating with DISTINCT,
+the viewer's followed-author IDs are resolved once, cached, and used as a plain `author_id IN (...)` filter.
+Feed pages go one step further and read the rules as a UNION ALL of two disjoint, index-friendly branches:
+public posts, and non-public posts by visible authors.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+from .models import Post, Follow
+from . import caching
+
+FOLLOWS_CACHE_TIMEOUT = getattr(settings, 'FOLLOWS_CACHE_TIMEOUT', 3600)
+
+
+def _follows_key(user_id):
+    return f'user_{user_id}_follows'
+
+def followed_author_ids(user_id):
+    """IDs of the authors a user follows, cached until the user follows or unfollows someone."""
+    key = _follows_key(user_id)
+    author_ids = cache.get(key)
+    if author_ids is None:
+        author_ids = list(Follow.objects.filter(follower_id=user_id).values_list('following_id', flat=True))
+        cache.set(key, author_ids, FOLLOWS_CACHE_TIMEOUT)
+    return author_ids
+
+async def afollowed_author_ids(user_id):
+    key = _follows_key(user_id)
+    author_ids = await cache.aget(key)
+    if author_ids is None:
+        author_ids = [author_id async for author_id in Follow.objects.filter(follower_id=user_id).values_list('following_id', flat=True)]
+        await cache.aset(key, author_ids, FOLLOWS_CACHE_TIMEOUT)
+    return author_ids
+
+def forget_follows(user_id):
+    """Drops the cached followed-author set (and the ETags that depended on it); called on follow and unfollow."""
+    cache.delete(_follows_key(user_id))
+    caching.invalidate_follows(user_id)
+
+def visible_author_ids(user):
+    """Authors whose private posts the user may see: themselves and everyone they follow."""
+    return [user.id, *followed_author_ids(user.id)]
+
+def visible_posts(user, queryset=None):
+    """Filters a Post queryset down to what the user may see, without a join or DISTINCT."""
+    queryset = Post.objects.all() if queryset is None else queryset
+    return queryset.filter(Q(privacy='public') | Q(author_id__in=visible_author_ids(user)))
+
+async def avisible_posts(user, queryset=None):
+    queryset = Post.objects.all() if queryset is None else queryset
+    return queryset.filter(Q(privacy='public') | Q(author_id__in=[user.id, *await afollowed_author_ids(user.id)]))
+
+def visible_branches(user, queryset=None):
+    """
+    Splits the visible posts into two disjoint querysets (no row can be in both, so no de-duplication is
+    needed when they are combined): public posts, and non-public posts of visible authors.
+    """
+    queryset = Post.objects.all() if queryset is None else queryset
+    return [
+        queryset.filter(privacy='public'),
+        queryset.filter(author_id__in=visible_author_ids(user)).exclude(privacy='public'),
+    ]